@@ -0,0 +1,55 @@
+import uuid
+from collections.abc import Generator
+from typing import BinaryIO
+
+from dify_plugin.entities.tool import ToolInvokeMessage
+
+# Dify 合并分块时要求单块不超过 8192 字节
+BLOB_CHUNK_SIZE = 8192
+
+
+def iter_blob_chunks(
+    fileobj: BinaryIO, total_length: int, meta: dict | None = None
+) -> Generator[ToolInvokeMessage, None, None]:
+    """把文件对象的内容按 BLOB_CHUNK_SIZE 分块，逐条产出 BLOB_CHUNK 消息
+
+    与 create_blob_message 相比，不需要先把整个文件读成一个 bytes 对象，
+    每次只在内存中保留一个分块。Dify 在收到第一个分块时按 total_length
+    分配缓冲区，因此调用方必须在发送前确定文件长度（或其上界）。
+
+    Args:
+        fileobj: 已定位到起始位置的二进制文件对象
+        total_length: 文件总长度（字节）
+        meta: 与 create_blob_message 相同的 meta（mime_type、filename 等）
+    """
+    blob_id = uuid.uuid4().hex
+    sequence = 0
+    while True:
+        chunk = fileobj.read(BLOB_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield _chunk_message(blob_id, sequence, total_length, chunk, False, meta)
+        sequence += 1
+
+    yield _chunk_message(blob_id, sequence, total_length, b"", True, meta)
+
+
+def _chunk_message(
+    blob_id: str,
+    sequence: int,
+    total_length: int,
+    blob: bytes,
+    end: bool,
+    meta: dict | None,
+) -> ToolInvokeMessage:
+    return ToolInvokeMessage(
+        type=ToolInvokeMessage.MessageType.BLOB_CHUNK,
+        message=ToolInvokeMessage.BlobChunkMessage(
+            id=blob_id,
+            sequence=sequence,
+            total_length=total_length,
+            blob=blob,
+            end=end,
+        ),
+        meta=meta,
+    )
@@ -0,0 +1,253 @@
+import hashlib
+import io
+import json
+import logging
+import threading
+import time
+from collections.abc import Generator
+from datetime import datetime, timezone
+from typing import BinaryIO
+
+from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.sinks import ArtifactSink, create_sink
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+# dedup 模式下未指定 sink_prefix 时的仓库根路径（固定路径，多次运行共享分块）
+DEFAULT_REPOSITORY_PREFIX = "dify-backup/repository"
+
+SNAPSHOT_FORMAT = "dify-backup-snapshot/1"
+
+# 分块大小：最小 MIN_CHUNK_SIZE，之后平均再过 2^BOUNDARY_BITS 字节出现一次边界，最大 MAX_CHUNK_SIZE
+MIN_CHUNK_SIZE = 256 * 1024
+BOUNDARY_BITS = 20
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+
+# 每个位置的签名比特由其后 SIGNATURE_CONTEXT 个字节决定
+SIGNATURE_CONTEXT = 8
+
+# 查找边界时每次计算签名的长度
+SEARCH_STEP = 1024 * 1024
+
+
+def _permutation(seed: bytes) -> bytes:
+    return bytes(
+        sorted(
+            range(256), key=lambda value: hashlib.sha256(seed + bytes([value])).digest()
+        )
+    )
+
+
+# 每个位置的签名比特 = 其后 SIGNATURE_CONTEXT 个字节分别经不同置换表映射后异或的最低位；
+# 连续 BOUNDARY_BITS 个签名比特等于 _BOUNDARY 时视为分块边界。边界只取决于附近内容，
+# 插入或删除数据只影响相邻分块。置换表与边界串由固定种子生成，修改会使已有仓库的分块无法复用。
+_PERMUTATIONS = [
+    _permutation(f"dify-backup-cdc:{k}".encode()) for k in range(SIGNATURE_CONTEXT)
+]
+_LOW_BIT = bytes(value & 1 for value in range(256))
+_BOUNDARY = bytes(
+    hashlib.sha256(f"dify-backup-cdc-boundary:{i}".encode()).digest()[0] & 1
+    for i in range(BOUNDARY_BITS)
+)
+
+
+def iter_chunks(
+    fileobj: BinaryIO,
+    min_size: int = MIN_CHUNK_SIZE,
+    max_size: int = MAX_CHUNK_SIZE,
+) -> Generator[bytes, None, None]:
+    """按内容定义的边界把文件对象切分为分块（CDC）
+
+    签名用 bytes.translate 与大整数异或计算，边界用 bytes.find 查找，逐字节的工作
+    都在 C 中完成，不需要在 Python 中逐字节计算滚动哈希。内存中最多保留 max_size 字节。
+    """
+    buffer = b""
+    eof = False
+    while True:
+        while not eof and len(buffer) < max_size:
+            data = fileobj.read(max_size - len(buffer))
+            if not data:
+                eof = True
+            else:
+                buffer += data
+        if not buffer:
+            return
+
+        cut = _find_boundary(buffer, min_size, max_size)
+        if cut is None:
+            cut = min(len(buffer), max_size)
+        yield buffer[:cut]
+        buffer = buffer[cut:]
+
+
+def _signature(data: bytes) -> bytes:
+    """逐位置计算签名比特，返回长度为 len(data) - SIGNATURE_CONTEXT + 1 的 0/1 字节串"""
+    length = len(data) - SIGNATURE_CONTEXT + 1
+    acc = 0
+    for k, table in enumerate(_PERMUTATIONS):
+        acc ^= int.from_bytes(data[k : k + length].translate(table), "big")
+    return acc.to_bytes(length, "big").translate(_LOW_BIT)
+
+
+def _find_boundary(buffer: bytes, min_size: int, max_size: int) -> int | None:
+    """返回第一个不小于 min_size 的边界位置，找不到时返回 None
+
+    边界通常出现在 min_size 之后不远处，按 SEARCH_STEP 分段计算签名，找到即停止。
+    """
+    if len(buffer) <= min_size:
+        return None
+    limit = min(len(buffer), max_size + SIGNATURE_CONTEXT - 1)
+    # 边界串结束位置 = 签名起点 + BOUNDARY_BITS，从 min_size 开始检测
+    pos = max(0, min_size - BOUNDARY_BITS)
+    while True:
+        window = buffer[pos : min(pos + SEARCH_STEP, limit)]
+        if len(window) < BOUNDARY_BITS + SIGNATURE_CONTEXT - 1:
+            return None
+        signature = _signature(window)
+        index = signature.find(_BOUNDARY)
+        if index >= 0:
+            cut = pos + index + BOUNDARY_BITS
+            return cut if cut <= max_size else None
+        if pos + len(window) >= limit:
+            return None
+        # 相邻两段重叠 BOUNDARY_BITS - 1 个签名，跨段的边界串也能找到
+        pos += len(signature) - BOUNDARY_BITS + 1
+
+
+class ChunkStore:
+    """
+    去重分块仓库
+
+    文件按内容定义分块后，每个分块以 SHA-256 为键存放在 <prefix>/chunks/ 下，
+    已存在的分块不再写入；每次运行只写一份快照索引（<prefix>/snapshots/），
+    记录各文件由哪些分块组成。存储增长与实际变化的数据量成正比，与运行次数无关。
+
+    put_file 可在多个工作线程中并发调用，写入的文件记入本次快照，最后由 commit 写出。
+    """
+
+    def __init__(self, sink: ArtifactSink):
+        self.sink = sink
+        self.files: dict[str, dict] = {}
+        self._known: set[str] = set()
+        self._lock = threading.Lock()
+        self.stats = {
+            "files": 0,
+            "chunks": 0,
+            "new_chunks": 0,
+            "bytes": 0,
+            "new_bytes": 0,
+        }
+
+    def chunk_key(self, digest: str) -> str:
+        return self.sink.key_for("chunks", digest[:2], digest)
+
+    def put_file(self, path: str, fileobj: BinaryIO) -> dict:
+        """切分并存储文件，记入本次快照的 path，返回文件条目（size、sha256、chunks）"""
+        file_hash = hashlib.sha256()
+        chunks = []
+        size = 0
+        for chunk in iter_chunks(fileobj):
+            digest = hashlib.sha256(chunk).hexdigest()
+            file_hash.update(chunk)
+            self._put_chunk(digest, chunk)
+            chunks.append([digest, len(chunk)])
+            size += len(chunk)
+        entry = {"size": size, "sha256": file_hash.hexdigest(), "chunks": chunks}
+        with self._lock:
+            self.stats["files"] += 1
+            self.files[path] = entry
+        return entry
+
+    def put_bytes(self, path: str, data: bytes) -> dict:
+        return self.put_file(path, io.BytesIO(data))
+
+    def _put_chunk(self, digest: str, chunk: bytes) -> None:
+        with self._lock:
+            known = digest in self._known
+            self.stats["chunks"] += 1
+            self.stats["bytes"] += len(chunk)
+        if known:
+            return
+        # 写入成功后才记为已知，写入失败时后续文件会重新写入该分块
+        key = self.chunk_key(digest)
+        if not self.sink.exists(key):
+            self.sink.put_bytes(key, chunk)
+            with self._lock:
+                self.stats["new_chunks"] += 1
+                self.stats["new_bytes"] += len(chunk)
+        with self._lock:
+            self._known.add(digest)
+
+    def iter_file(self, entry: dict) -> Generator[bytes, None, None]:
+        """按快照条目依次读出文件的分块，并校验每个分块的哈希
+
+        Raises:
+            ValueError: 分块内容与哈希不一致
+        """
+        for digest, _ in entry["chunks"]:
+            data = self.sink.get(self.chunk_key(digest))
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise ValueError(f"Chunk {digest} is corrupted")
+            yield data
+
+    def read_file(self, entry: dict) -> bytes:
+        return b"".join(self.iter_file(entry))
+
+    def commit(self, tool: str, **extra) -> str:
+        """写入本次运行的快照索引，返回对象键"""
+        with self._lock:
+            files = dict(sorted(self.files.items()))
+        snapshot = {
+            "format": SNAPSHOT_FORMAT,
+            "tool": tool,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            **extra,
+            "files": files,
+        }
+        key = self.sink.key_for(
+            "snapshots", f"{tool}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        self.sink.put_bytes(
+            key,
+            json.dumps(snapshot, ensure_ascii=False).encode("utf-8"),
+            "application/json",
+        )
+        logger.info(f"快照已写入: {key}（{len(files)} 个文件）")
+        return key
+
+    def load_snapshot(self, key: str) -> dict:
+        snapshot = json.loads(self.sink.get(key))
+        if snapshot.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format: {snapshot.get('format')}")
+        return snapshot
+
+    def stats_text(self) -> str:
+        stats = self.stats
+        return (
+            f"去重存储: {stats['files']} 个文件，{stats['chunks']} 个分块"
+            f"（新增 {stats['new_chunks']} 个，{stats['new_bytes'] / 1024 / 1024:.1f} MB"
+            f" / 共 {stats['bytes'] / 1024 / 1024:.1f} MB）"
+        )
+
+
+def create_chunk_store(
+    dedup: bool, sink_type: str | None, credentials: dict, prefix: str | None
+) -> tuple[ArtifactSink | None, ChunkStore | None]:
+    """按工具参数创建存储目标与（dedup 时的）分块仓库
+
+    dedup 模式下 sink_prefix 是仓库根路径，默认 DEFAULT_REPOSITORY_PREFIX，
+    不带时间戳，多次运行共享同一份分块。
+
+    Raises:
+        ValueError: 参数无效，或 dedup 未配合 local / s3 存储使用
+    """
+    sink = create_sink(
+        sink_type, credentials, prefix or (DEFAULT_REPOSITORY_PREFIX if dedup else None)
+    )
+    if not dedup:
+        return sink, None
+    if sink is None:
+        raise ValueError("dedup requires sink=local or sink=s3")
+    return sink, ChunkStore(sink)
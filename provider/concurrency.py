@@ -0,0 +1,292 @@
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Generator, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, TypeVar
+
+from dify_plugin.config.logger_format import plugin_logger_handler
+
+try:
+    # 插件运行时对标准库打了 gevent 补丁，ThreadPoolExecutor 的工作线程实际是协程，
+    # 只能交替执行；gevent 的线程池使用原生线程，哈希、解压等释放 GIL 的计算可以利用多核
+    from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+except ImportError:
+    NativeThreadPoolExecutor = ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# 端点类别：不同类别的接口耗时差异很大，分别维护并发预算
+LISTING = "listing"
+EXPORT = "export"
+DOWNLOAD = "download"
+IMPORT = "import"
+
+# iter_concurrent 在指定时长内没有任务完成时产出的占位条目
+HEARTBEAT = object()
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发限制器
+
+    - p95 延迟低于目标时，每完成约 limit 个请求并发上限 +1（加性增）
+    - 遇到 429/5xx、网络异常或延迟突增时，并发上限乘以 backoff（乘性减）
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        target_p95: float = 2.0,
+        spike_factor: float = 3.0,
+        backoff: float = 0.5,
+        window: int = 50,
+        min_samples: int = 10,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_p95 = target_p95
+        self.spike_factor = spike_factor
+        self.backoff = backoff
+        self.min_samples = min_samples
+
+        self._cond = threading.Condition()
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._in_flight = 0
+        self._samples: deque[float] = deque(maxlen=window)
+        self._last_decrease = 0.0
+        self._peak_limit = self._limit
+        self._throttled = 0
+        self._completed = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self) -> None:
+        """获取一个并发槽位，超过当前上限时阻塞等待"""
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, latency: float, status_code: int | None) -> None:
+        """归还槽位并根据本次请求结果调整并发上限
+
+        Args:
+            latency: 请求耗时（秒）
+            status_code: HTTP 状态码，请求异常时为 None
+        """
+        with self._cond:
+            self._in_flight -= 1
+            self._completed += 1
+
+            overloaded = status_code is None or status_code == 429 or status_code >= 500
+            if overloaded:
+                self._throttled += 1
+                self._decrease(f"status={status_code}")
+            else:
+                self._samples.append(latency)
+                if latency > self.target_p95 * self.spike_factor:
+                    self._decrease(f"latency spike {latency:.2f}s")
+                elif len(self._samples) >= self.min_samples:
+                    p95 = self._p95()
+                    if p95 <= self.target_p95:
+                        self._limit = min(
+                            float(self.max_limit), self._limit + 1.0 / self._limit
+                        )
+                        self._peak_limit = max(self._peak_limit, self._limit)
+                    else:
+                        self._decrease(f"p95 {p95:.2f}s")
+
+            self._cond.notify_all()
+
+    def _decrease(self, reason: str) -> None:
+        # 同一拥塞事件内的多个失败只降一次，冷却时间取目标延迟
+        now = time.monotonic()
+        if now - self._last_decrease < self.target_p95:
+            return
+        self._last_decrease = now
+        old_limit = self.limit
+        self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        self._samples.clear()
+        if self.limit != old_limit:
+            logger.info(
+                f"[limiter:{self.name}] 并发上限 {old_limit} → {self.limit} ({reason})"
+            )
+
+    def _p95(self) -> float:
+        ordered = sorted(self._samples)
+        return ordered[int(0.95 * (len(ordered) - 1))]
+
+    def snapshot(self) -> dict:
+        """返回当前限流状态，用于日志与摘要"""
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "peak_limit": int(self._peak_limit),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "throttled": self._throttled,
+                "p95": round(self._p95(), 3) if self._samples else None,
+            }
+
+
+class LimiterGroup:
+    """
+    按端点类别（listing / export / download / import）分别维护的限流器集合
+
+    同一 Dify 实例的所有 DifyClient 共享同一个 LimiterGroup，
+    这样并发运行的多个工具调用不会叠加出超出实例承受能力的请求量。
+    """
+
+    # 各端点类别的默认参数：(初始并发, 最大并发, 目标 p95 秒数)
+    DEFAULTS = {
+        LISTING: (4, 16, 1.5),
+        EXPORT: (4, 16, 5.0),
+        DOWNLOAD: (2, 8, 20.0),
+        IMPORT: (2, 8, 10.0),
+    }
+
+    # 对象存储主机（签名链接）限流器的参数：(初始并发, 最大并发, 目标 p95 秒数)
+    STORAGE_DEFAULTS = (4, 16, 20.0)
+
+    _registry: dict[str, "LimiterGroup"] = {}
+    _storage_limiters: dict[str, AdaptiveLimiter] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self):
+        self.limiters = {
+            endpoint_class: AdaptiveLimiter(
+                endpoint_class,
+                initial_limit=initial,
+                max_limit=maximum,
+                target_p95=target,
+            )
+            for endpoint_class, (initial, maximum, target) in self.DEFAULTS.items()
+        }
+
+    @classmethod
+    def for_instance(cls, base_url: str) -> "LimiterGroup":
+        """获取（或创建）指定 Dify 实例共享的限流器集合"""
+        with cls._registry_lock:
+            group = cls._registry.get(base_url)
+            if group is None:
+                group = cls()
+                cls._registry[base_url] = group
+            return group
+
+    @classmethod
+    def for_storage_host(cls, host: str) -> AdaptiveLimiter:
+        """获取（或创建）对象存储主机共享的限流器
+
+        签名链接指向的存储主机与 Dify 接口分开限流，对象存储变慢时
+        不会压低 Dify 的下载并发；同一主机的限流器在所有实例间共享。
+        """
+        with cls._registry_lock:
+            limiter = cls._storage_limiters.get(host)
+            if limiter is None:
+                initial, maximum, target = cls.STORAGE_DEFAULTS
+                limiter = AdaptiveLimiter(
+                    f"storage:{host}",
+                    initial_limit=initial,
+                    max_limit=maximum,
+                    target_p95=target,
+                )
+                cls._storage_limiters[host] = limiter
+            return limiter
+
+    def __getitem__(self, endpoint_class: str) -> AdaptiveLimiter:
+        return self.limiters[endpoint_class]
+
+    def max_workers(self, endpoint_class: str) -> int:
+        return self.limiters[endpoint_class].max_limit
+
+    def total_max(self) -> int:
+        return sum(limiter.max_limit for limiter in self.limiters.values())
+
+    def snapshot(self) -> dict:
+        return {
+            endpoint_class: limiter.snapshot()
+            for endpoint_class, limiter in self.limiters.items()
+        }
+
+
+def iter_concurrent(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int,
+    native_threads: bool = False,
+    heartbeat: float | None = None,
+) -> Generator[tuple[T, R | None, Exception | None], None, None]:
+    """并发执行 fn(item)，按完成顺序产出 (item, result, error)
+
+    调用方在生成器所在线程中消费结果，便于在 Tool._invoke 中实时 yield 消息。
+    提交的任务数量不超过 max_workers 的两倍，避免一次性展开超长列表。
+
+    指定 heartbeat 秒数时，超过该时长没有任务完成则产出 (HEARTBEAT, None, None)，
+    便于调用方在长时间运行的任务期间输出心跳进度。
+
+    native_threads=True 时在原生线程中执行，用于 CPU 密集的任务；fn 中不应调用
+    Dify 接口（限流器与 HTTP 会话按协程使用）。
+    """
+    iterator = iter(items)
+    pending: dict[Future, Any] = {}
+    executor_cls = ThreadPoolExecutor
+    if native_threads:
+        # gevent 线程池会把工作线程中的异常打印到日志并在取结果时重新抛出，
+        # 因此在线程内捕获，与结果一起返回
+        executor_cls = NativeThreadPoolExecutor
+        fn = _capture_errors(fn)
+
+    with executor_cls(max_workers=max(1, max_workers)) as executor:
+
+        def submit_next() -> bool:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return False
+            pending[executor.submit(fn, item)] = item
+            return True
+
+        for _ in range(max(1, max_workers) * 2):
+            if not submit_next():
+                break
+
+        while pending:
+            done, _ = wait(pending, timeout=heartbeat, return_when=FIRST_COMPLETED)
+            if not done:
+                yield HEARTBEAT, None, None  # type: ignore[misc]
+            for future in done:
+                item = pending.pop(future)
+                error = future.exception()
+                if error is not None:
+                    yield item, None, error  # type: ignore[misc]
+                elif native_threads:
+                    result, error = future.result()
+                    yield item, result, error
+                else:
+                    yield item, future.result(), None
+                submit_next()
+
+
+def _capture_errors(
+    fn: Callable[[T], R],
+) -> Callable[[T], tuple[R | None, Exception | None]]:
+    def call(item: T) -> tuple[R | None, Exception | None]:
+        try:
+            return fn(item), None
+        except Exception as e:
+            return None, e
+
+    return call
@@ -0,0 +1,19 @@
+from typing import Any
+
+# 以这些字符开头的值可能被表格软件解释为公式，导出时加单引号前缀
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r", "\n")
+
+
+def sanitize_csv_value(value: Any) -> Any:
+    """CSV 注入防护：以公式字符开头的文本加单引号前缀，其他值原样返回"""
+    if value and isinstance(value, str):
+        if value.startswith(CSV_FORMULA_PREFIXES):
+            return "'" + value
+    return value
+
+
+def unsanitize_csv_value(value: str) -> str:
+    """去掉 sanitize_csv_value 添加的单引号前缀，仅处理其确实会添加前缀的情况"""
+    if value.startswith("'") and value[1:].startswith(CSV_FORMULA_PREFIXES):
+        return value[1:]
+    return value
@@ -0,0 +1,151 @@
+import base64
+import json
+import logging
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterable
+from typing import Any, TypeVar
+
+from dify_plugin.config.logger_format import plugin_logger_handler
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_TOKEN_PREFIX = "v1."
+
+
+class DeadlineScheduler:
+    """
+    在调用时间预算内调度工作单元
+
+    - 按预计成本从小到大排序（最短作业优先），同样预算内完成的单元最多
+    - 用已完成单元的实际耗时估计「每单位成本耗时」（EWMA），预计在截止前
+      完成不了的单元不再启动，记入 deferred，由续传令牌交给下一次调用
+    - 预留 safety_margin 秒用于打包与返回结果
+    - 预算从 started_at（time.monotonic() 的读数）起算，调用方传入调用开始的时刻，
+      使登录与列表请求也计入预算；不传时从创建调度器起算
+    """
+
+    def __init__(
+        self,
+        time_budget_seconds: float,
+        safety_margin: float | None = None,
+        default_seconds_per_cost: float = 0.5,
+        started_at: float | None = None,
+    ):
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.deadline = self.started_at + time_budget_seconds
+        self.safety_margin = (
+            safety_margin
+            if safety_margin is not None
+            else max(2.0, time_budget_seconds * 0.1)
+        )
+        self.deferred: list = []
+        self._seconds_per_cost = default_seconds_per_cost
+        self._samples = 0
+        self._admitted = 0
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def can_start(self, cost: float) -> bool:
+        """预计能在截止前（扣除安全余量）完成时返回 True"""
+        with self._lock:
+            # 每次调用至少启动一个单元，避免超大单元永远无法推进
+            if self._admitted == 0:
+                return True
+            estimate = self._seconds_per_cost * max(cost, 1.0)
+        return self.remaining() - self.safety_margin >= estimate
+
+    def record(self, cost: float, elapsed: float) -> None:
+        """记录一个单元的实际耗时，更新每单位成本耗时估计"""
+        observed = elapsed / max(cost, 1.0)
+        with self._lock:
+            if self._samples == 0:
+                self._seconds_per_cost = observed
+            else:
+                self._seconds_per_cost = 0.7 * self._seconds_per_cost + 0.3 * observed
+            self._samples += 1
+
+    def order(self, units: Iterable[T], cost_fn: Callable[[T], float]) -> list[T]:
+        """按预计成本升序排列工作单元"""
+        return sorted(units, key=cost_fn)
+
+    def try_start(self, unit: Any, cost: float) -> bool:
+        """单元即将开始时调用：来得及则登记并返回 True，否则记入 deferred"""
+        if not self.can_start(cost):
+            self.defer(unit)
+            return False
+        with self._lock:
+            self._admitted += 1
+        return True
+
+    def defer(self, unit: Any) -> None:
+        """不再判断，直接把单元记入 deferred，留给下一次调用"""
+        with self._lock:
+            self.deferred.append(unit)
+            if len(self.deferred) == 1:
+                logger.info(
+                    f"时间预算即将用尽（剩余 {self.remaining():.1f}s），"
+                    "后续单元留待下次调用"
+                )
+
+    def wrap(
+        self, fn: Callable[[T], R], cost_fn: Callable[[T], float]
+    ) -> Callable[[T], R | object]:
+        """包装工作函数：在单元真正开始执行时做截止判断，并把耗时计入估计
+
+        来不及执行的单元返回 DEFERRED，调用方据此跳过结果处理。
+        """
+
+        def wrapper(unit: T) -> R | object:
+            cost = cost_fn(unit)
+            if not self.try_start(unit, cost):
+                return DEFERRED
+            started = time.monotonic()
+            try:
+                return fn(unit)
+            finally:
+                self.record(cost, time.monotonic() - started)
+
+        return wrapper
+
+
+# 因时间预算不足而未执行的单元的占位结果
+DEFERRED = object()
+
+
+def encode_continuation_token(tool: str, remaining_ids: list, params: dict) -> str:
+    """把剩余单元 ID 与原始参数编码为续传令牌"""
+    payload = json.dumps(
+        {"tool": tool, "remaining": remaining_ids, "params": params},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return _TOKEN_PREFIX + base64.urlsafe_b64encode(zlib.compress(payload)).decode(
+        "ascii"
+    )
+
+
+def decode_continuation_token(token: str, tool: str) -> dict[str, Any]:
+    """解析续传令牌，令牌无效或属于其他工具时抛出 ValueError"""
+    token = token.strip()
+    if not token.startswith(_TOKEN_PREFIX):
+        raise ValueError("Invalid continuation token")
+    try:
+        payload = json.loads(
+            zlib.decompress(base64.urlsafe_b64decode(token[len(_TOKEN_PREFIX) :]))
+        )
+    except (ValueError, zlib.error) as e:
+        raise ValueError(f"Invalid continuation token: {e}") from e
+    if payload.get("tool") != tool:
+        raise ValueError(
+            f"Continuation token belongs to {payload.get('tool')}, not {tool}"
+        )
+    return payload
@@ -3,16 +3,77 @@ from dify_plugin.errors.tool import ToolProviderCredentialValidationError
 from dify_plugin.config.logger_format import plugin_logger_handler
 import requests
 import base64
-import json
 import logging
+import threading
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
 from datetime import datetime
 from urllib.parse import urljoin, urlparse
 
+from provider import fast_json
+from provider.concurrency import (
+    DOWNLOAD,
+    EXPORT,
+    IMPORT,
+    LISTING,
+    AdaptiveLimiter,
+    LimiterGroup,
+)
+from provider.http_cache import CachedSession, HttpCache
+from provider.memory import MemoryBudget, Reservation, SpooledBuffer
+from provider.naming import safe_name
+from provider.storage_download import StorageDownloader, StorageDownloadError
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.addHandler(plugin_logger_handler)
 
 
+class WorkspaceGate:
+    """同一账号的工作空间切换闸门
+
+    Dify 把"当前工作空间"记录在账号上而不是会话上，切换会影响该账号的所有会话。
+    固定（pin）工作空间期间，只有绑定到该工作空间的 client 可以发请求，
+    进程内该账号的其他请求等待；固定前先等正在进行的请求结束。
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pinned: str | None = None
+        self._active = 0
+
+    @contextmanager
+    def request(self, workspace_id: str | None) -> Generator[None, None, None]:
+        """包住一次 API 请求；账号被固定到其他工作空间时等待"""
+        with self._condition:
+            while self._pinned is not None and self._pinned != workspace_id:
+                self._condition.wait()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def pin(self, workspace_id: str) -> Generator[None, None, None]:
+        """独占账号的工作空间，同一时间只有一个固定者"""
+        with self._condition:
+            while self._pinned is not None:
+                self._condition.wait()
+            self._pinned = workspace_id
+            while self._active:
+                self._condition.wait()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._pinned = None
+                self._condition.notify_all()
+
+
 class DifyClient:
     """
     Dify API Client - 封装所有与 Dify Console API 的交互
@@ -21,20 +82,75 @@ class DifyClient:
     # 默认超时时间（秒）
     DEFAULT_TIMEOUT = 60
 
+    # 未知长度的响应按块读取，每块读取前预留内存
+    READ_CHUNK_SIZE = 1024 * 1024
+
+    # 超过该大小（或长度未知）的分页响应增量解析，按批产出 data 中的元素
+    STREAM_PARSE_THRESHOLD = 4 * 1024 * 1024
+    STREAM_BATCH_SIZE = 1000
+
+    # 标注批量导入为异步任务，按固定间隔轮询状态
+    ANNOTATION_IMPORT_POLL_INTERVAL = 2
+    ANNOTATION_IMPORT_TIMEOUT = 1800
+
+    # 同一账号的所有 client 共用一个工作空间闸门（按实例与账号）
+    _workspace_gates: dict[str, WorkspaceGate] = {}
+    _workspace_gates_guard = threading.Lock()
+
     def __init__(
-        self, base_url: str, email: str, password: str, timeout: int | None = None
+        self,
+        base_url: str,
+        email: str,
+        password: str,
+        timeout: int | None = None,
+        limiters: LimiterGroup | None = None,
+        cache: HttpCache | None = None,
+        workspace_id: str | None = None,
     ):
+        """
+        Args:
+            workspace_id: 绑定的工作空间；账号被固定到该工作空间时本 client 的请求照常发出，
+                登录后校验账号当前确实位于该工作空间
+        """
         self.base_url = base_url.rstrip("/")
         self.email = email
         self.password = password
+        self.workspace_id = workspace_id
+        with self._workspace_gates_guard:
+            self.workspace_gate = self._workspace_gates.setdefault(
+                f"{self.base_url}|{email}", WorkspaceGate()
+            )
         self.timeout = timeout or self.DEFAULT_TIMEOUT
-        self.session = requests.Session()
+        # 同一实例的所有 client 默认共享自适应限流器
+        self.limiters = limiters or LimiterGroup.for_instance(self.base_url)
+        # 开启缓存时，列表与导出类 GET 请求走磁盘缓存（按账号隔离）
+        self.session = (
+            CachedSession(cache, namespace=f"{self.base_url}|{email}")
+            if cache
+            else requests.Session()
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=4, pool_maxsize=self.limiters.total_max()
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self.access_token: str | None = None
         self.csrf_token: str | None = None
+        # 本 client 发出的请求数与累计耗时（按端点类别），试运行据此推算执行计划
+        self.request_stats: dict[str, list] = {}
 
         # 登录并初始化 session
         self._login()
 
+        if workspace_id:
+            self.verify_workspace()
+
+        # 缓存按工作空间隔离，避免切换工作空间后命中其他工作空间的列表
+        if cache:
+            self.session.namespace += (
+                f"|{workspace_id or self.current_workspace_id() or ''}"
+            )
+
     def _login(self):
         """登录 Dify 并获取 Access Token 和 CSRF Token"""
         try:
@@ -60,7 +176,7 @@ class DifyClient:
                     f"Login failed: {login_response.status_code} - {login_response.text}"
                 )
 
-            login_data = login_response.json()
+            login_data = self._json(login_response)
             if login_data.get("result") != "success":
                 raise Exception(
                     f"Login failed: {login_data.get('result', 'Unknown error')}"
@@ -112,13 +228,198 @@ class DifyClient:
                 return token
         return None
 
+    def _request(
+        self,
+        endpoint_class: str,
+        method: str,
+        url: str,
+        session: requests.Session | None = None,
+        cacheable: bool | None = None,
+        limiter: AdaptiveLimiter | None = None,
+        **kwargs,
+    ) -> requests.Response:
+        """经自适应限流器发送请求，并把耗时与状态码反馈给限流器
+
+        Args:
+            cacheable: 是否允许走 HTTP 缓存，默认列表与导出类请求可缓存
+            limiter: 指定限流器（如对象存储主机的限流器），默认按 endpoint_class 选择；
+                请求统计仍记在 endpoint_class 下
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        sender = session or self.session
+        if isinstance(sender, CachedSession):
+            kwargs["cacheable"] = (
+                endpoint_class in (LISTING, EXPORT) if cacheable is None else cacheable
+            )
+        limiter = limiter or self.limiters[endpoint_class]
+        # 先过工作空间闸门再占用并发名额，等待闸门的请求不占限流器
+        with self.workspace_gate.request(self.workspace_id):
+            limiter.acquire()
+            started = time.monotonic()
+            status_code = None
+            try:
+                response = sender.request(method, url, **kwargs)
+                status_code = response.status_code
+                return response
+            finally:
+                elapsed = time.monotonic() - started
+                limiter.release(elapsed, status_code)
+                stats = self.request_stats.setdefault(endpoint_class, [0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+
+    def _spool_body(
+        self, response: requests.Response, reservation: Reservation | None
+    ) -> SpooledBuffer:
+        """把响应体（需以 stream=True 发出）逐块写入 SpooledBuffer，读取位置在开头
+
+        内存预算不足或超过 StorageDownloader.SPOOL_BYTES 时落盘。
+        """
+        body = SpooledBuffer(
+            reservation or MemoryBudget.shared().reserve(),
+            StorageDownloader.SPOOL_BYTES,
+        )
+        try:
+            for chunk in response.iter_content(self.READ_CHUNK_SIZE):
+                body.write(chunk)
+        except BaseException:
+            body.close()
+            raise
+        finally:
+            response.close()
+        body.seek(0)
+        return body
+
+    def _json(self, response: requests.Response):
+        """解析 JSON 响应体（优先使用 orjson）"""
+        return fast_json.loads(response.content)
+
+    def _iter_page_data(
+        self, response: requests.Response, fields: dict
+    ) -> Generator[list, None, None]:
+        """逐批产出分页响应中 data 数组的元素，其余字段（has_more 等）写入 fields
+
+        小响应整体解析；大响应或长度未知的响应增量解析，不构建整个文档，
+        内存中只保留当前一批元素。请求需以 stream=True 发出。
+        """
+        try:
+            content_length = response.headers.get("Content-Length", "")
+            if (
+                content_length.isdigit()
+                and not response.headers.get("Content-Encoding")
+                and int(content_length) <= self.STREAM_PARSE_THRESHOLD
+            ):
+                data = self._json(response)
+                fields.update((k, v) for k, v in data.items() if k != "data")
+                if data.get("data"):
+                    yield data["data"]
+                return
+
+            batch = []
+            for item in fast_json.iter_array_items(
+                response.iter_content(self.READ_CHUNK_SIZE), "data", fields
+            ):
+                batch.append(item)
+                if len(batch) >= self.STREAM_BATCH_SIZE:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+        finally:
+            response.close()
+
+    def max_workers(self, endpoint_class: str) -> int:
+        """指定端点类别的最大并发，供工具设置线程池大小"""
+        return self.limiters.max_workers(endpoint_class)
+
+    def cache_stats_text(self) -> str | None:
+        """HTTP 缓存命中统计，未开启缓存时返回 None"""
+        if isinstance(self.session, CachedSession):
+            return self.session.stats_text()
+        return None
+
+    def get_workspaces(self) -> list:
+        """获取当前账号加入的所有工作空间
+
+        Returns:
+            工作空间列表，每项包含 id、name、status、current 等字段
+        """
+        response = self._request(
+            LISTING,
+            "GET",
+            f"{self.base_url}/console/api/workspaces",
+            cacheable=False,
+        )
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to fetch workspaces: {response.status_code} - {response.text[:200]}"
+            )
+        return self._json(response).get("workspaces", [])
+
+    def current_workspace_id(self) -> str | None:
+        """当前账号所在的工作空间 ID"""
+        for workspace in self.get_workspaces():
+            if workspace.get("current"):
+                return workspace.get("id")
+        return None
+
+    def switch_workspace(self, workspace_id: str) -> None:
+        """切换账号的当前工作空间（对该账号的所有会话生效）"""
+        response = self._request(
+            LISTING,
+            "POST",
+            f"{self.base_url}/console/api/workspaces/switch",
+            json={"tenant_id": workspace_id},
+        )
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to switch to workspace {workspace_id}: "
+                f"{response.status_code} - {response.text[:200]}"
+            )
+        logger.info(f"已切换到工作空间 {workspace_id}")
+
+    def verify_workspace(self) -> None:
+        """确认账号当前位于绑定的工作空间，否则抛出异常"""
+        current = self.current_workspace_id()
+        if current != self.workspace_id:
+            raise Exception(
+                f"Current workspace is {current}, expected {self.workspace_id}"
+            )
+
+    @contextmanager
+    def use_workspace(self, workspace_id: str) -> Generator[None, None, None]:
+        """在指定工作空间内执行操作，结束后切回原工作空间
+
+        持有期间固定账号的工作空间：本进程内只有绑定到该工作空间的 client
+        （以 workspace_id 创建）能发请求，该账号的其他调用等待结束。
+        """
+        with self.workspace_gate.pin(workspace_id):
+            bound = self.workspace_id
+            self.workspace_id = workspace_id
+            try:
+                previous = self.current_workspace_id()
+                if previous != workspace_id:
+                    self.switch_workspace(workspace_id)
+                try:
+                    yield
+                finally:
+                    if previous and previous != workspace_id:
+                        try:
+                            self.switch_workspace(previous)
+                        except Exception as e:
+                            logger.warning(f"切回工作空间 {previous} 失败: {str(e)}")
+            finally:
+                self.workspace_id = bound
+
     def get_app_info(self, app_id: str) -> dict | None:
         """获取应用基本信息"""
-        response = self.session.get(
-            f"{self.base_url}/console/api/apps/{app_id}", timeout=self.timeout
+        response = self._request(
+            LISTING,
+            "GET",
+            f"{self.base_url}/console/api/apps/{app_id}",
         )
         if response.status_code == 200:
-            return response.json()
+            return self._json(response)
         return None
 
     def get_all_apps(self, limit: int = 100, mode: str = "all") -> list:
@@ -136,8 +437,11 @@ class DifyClient:
             if mode and mode != "all":
                 params["mode"] = mode
 
-            response = self.session.get(
-                f"{self.base_url}/console/api/apps", params=params, timeout=self.timeout
+            response = self._request(
+                LISTING,
+                "GET",
+                f"{self.base_url}/console/api/apps",
+                params=params,
             )
             if response.status_code != 200:
                 logger.error(
@@ -145,7 +449,7 @@ class DifyClient:
                 )
                 break
 
-            data = response.json()
+            data = self._json(response)
             items = data.get("data", [])
             if not items:
                 break
@@ -159,9 +463,17 @@ class DifyClient:
         return all_apps
 
     def get_versions_to_export(
-        self, app_id: str, app_name: str, version_type: str = "draft"
+        self,
+        app_id: str,
+        app_name: str,
+        version_type: str = "draft",
+        app_info: dict | None = None,
     ) -> list:
-        """获取需要导出的版本列表信息"""
+        """获取需要导出的版本列表信息
+
+        Args:
+            app_info: 已获取的应用信息，工作流接口 404 降级时复用，避免重复请求
+        """
         versions = []
         target_types = (
             ["draft", "published"] if version_type == "all" else [version_type]
@@ -175,22 +487,25 @@ class DifyClient:
 
             elif v_type == "published":
                 # 获取已发布版本列表
-                pub_versions = self._get_published_versions(app_id, app_name)
+                pub_versions = self._get_published_versions(app_id, app_name, app_info)
                 versions.extend(pub_versions)
 
         return versions
 
-    def _get_published_versions(self, app_id: str, app_name: str) -> list:
+    def _get_published_versions(
+        self, app_id: str, app_name: str, app_info: dict | None = None
+    ) -> list:
         """获取已发布版本列表（包含 404 降级处理）"""
         versions = []
-        response = self.session.get(
+        response = self._request(
+            LISTING,
+            "GET",
             f"{self.base_url}/console/api/apps/{app_id}/workflows",
             params={"page": 1, "limit": 100},
-            timeout=self.timeout,
         )
 
         if response.status_code == 200:
-            items = response.json().get("items", [])
+            items = self._json(response).get("items", [])
             published_items = [v for v in items if v.get("version") != "draft"]
 
             for item in published_items:
@@ -202,7 +517,7 @@ class DifyClient:
                 f"[{app_name}] Workflows API 404, attempting fallback to current version"
             )
             # 降级处理：尝试从 App Info 获取当前 workflow_id
-            app_info = self.get_app_info(app_id)
+            app_info = app_info or self.get_app_info(app_id)
             if app_info:
                 wf_id = None
                 if "workflow" in app_info and app_info["workflow"]:
@@ -258,26 +573,87 @@ class DifyClient:
             "marked_name": marked_name,
         }
 
-    def export_dsl(self, app_id: str, workflow_id: str | None = None) -> str | None:
-        """导出 DSL"""
+    def export_dsl(
+        self,
+        app_id: str,
+        workflow_id: str | None = None,
+        reservation: Reservation | None = None,
+    ) -> str | None:
+        """导出 DSL
+
+        DSL 响应整体读入（不流式读取），开启 HTTP 缓存时可以写入缓存。
+
+        Args:
+            reservation: 内存预留，传入时读入后按响应大小计入
+        """
         params = {"include_secret": "false"}
         if workflow_id:
             params["workflow_id"] = workflow_id
 
-        response = self.session.get(
+        response = self._request(
+            EXPORT,
+            "GET",
             f"{self.base_url}/console/api/apps/{app_id}/export",
             params=params,
-            timeout=self.timeout,
         )
 
         if response.status_code == 200:
-            return response.json().get("data", "")
+            body = response.content
+            if reservation is not None:
+                reservation.resize(reservation.nbytes + len(body))
+            return fast_json.loads(body).get("data", "")
         else:
+            response.close()
             logger.warning(
                 f"Export failed for app {app_id} (wf: {workflow_id}): {response.status_code}"
             )
             return None
 
+    def import_app_dsl(self, yaml_content: str) -> dict:
+        """通过 DSL 导入创建应用
+
+        DSL 版本与实例不一致时导入进入 pending 状态，需要再调用 confirm 完成。
+
+        Returns:
+            导入结果，包含 status、app_id、app_mode 等字段
+
+        Raises:
+            Exception: 导入失败
+        """
+        response = self._request(
+            IMPORT,
+            "POST",
+            f"{self.base_url}/console/api/apps/imports",
+            json={"mode": "yaml-content", "yaml_content": yaml_content},
+        )
+        result = self._parse_import_response(response)
+
+        if result.get("status") == "pending":
+            logger.info(
+                f"DSL 版本与实例不一致（{result.get('imported_dsl_version')} → "
+                f"{result.get('current_dsl_version')}），确认导入 {result.get('id')}"
+            )
+            response = self._request(
+                IMPORT,
+                "POST",
+                f"{self.base_url}/console/api/apps/imports/{result.get('id')}/confirm",
+            )
+            result = self._parse_import_response(response)
+
+        return result
+
+    def _parse_import_response(self, response: requests.Response) -> dict:
+        try:
+            result = self._json(response)
+        except ValueError:
+            result = {}
+        if response.status_code not in (200, 202) or result.get("status") == "failed":
+            raise Exception(
+                f"Import failed: {response.status_code} - "
+                f"{result.get('error') or result.get('message') or response.text[:200]}"
+            )
+        return result
+
     def get_all_annotations(self, app_id: str, limit: int = 100) -> list:
         """获取指定应用的所有标注
 
@@ -289,36 +665,348 @@ class DifyClient:
             标注列表，每个标注包含 question 和 answer 字段
         """
         all_annotations = []
-        page = 1
+        try:
+            for items in self.iter_annotations(app_id, limit):
+                all_annotations.extend(items)
+        except Exception as e:
+            logger.warning(str(e))
+        return all_annotations
 
+    def iter_annotations(
+        self, app_id: str, limit: int = 100
+    ) -> Generator[list, None, None]:
+        """逐页获取指定应用的标注，内存中只保留当前页
+
+        Yields:
+            每页的标注列表
+
+        Raises:
+            Exception: 某一页获取失败时抛出
+        """
+        page = 1
         while True:
-            response = self.session.get(
+            response = self._request(
+                LISTING,
+                "GET",
                 f"{self.base_url}/console/api/apps/{app_id}/annotations",
                 params={"page": page, "limit": limit},
-                timeout=self.timeout,
+                stream=True,
             )
 
             if response.status_code != 200:
-                logger.warning(
+                response.close()
+                raise Exception(
                     f"Failed to fetch annotations for app {app_id}, page {page}: {response.status_code}"
                 )
+
+            fields = {}
+            has_items = False
+            for items in self._iter_page_data(response, fields):
+                has_items = True
+                yield items
+
+            if not has_items:
                 break
 
-            data = response.json()
-            items = data.get("data", [])
+            # 检查是否还有更多数据
+            if not fields.get("has_more", False):
+                break
 
-            if not items:
+            page += 1
+
+    def count_annotations(self, app_id: str) -> int:
+        """获取指定应用当前的标注数量（只请求一条，读取分页信息中的 total）"""
+        response = self._request(
+            LISTING,
+            "GET",
+            f"{self.base_url}/console/api/apps/{app_id}/annotations",
+            params={"page": 1, "limit": 1},
+            cacheable=False,
+        )
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to fetch annotations for app {app_id}: {response.status_code}"
+            )
+        return int(self._json(response).get("total") or 0)
+
+    def batch_import_annotations(
+        self, app_id: str, csv_content: bytes, filename: str = "annotations.csv"
+    ) -> dict:
+        """通过批量导入接口写入一批标注，并等待异步任务完成
+
+        Args:
+            app_id: 应用 ID
+            csv_content: 表头为 question,answer 的 CSV 内容
+            filename: 上传时使用的文件名
+
+        Returns:
+            任务最终状态，包含 job_id、job_status 字段
+
+        Raises:
+            Exception: 提交失败、任务出错或等待超时
+        """
+        response = self._request(
+            IMPORT,
+            "POST",
+            f"{self.base_url}/console/api/apps/{app_id}/annotations/batch-import",
+            files={"file": (filename, csv_content, "text/csv")},
+            # 去掉 session 默认的 JSON Content-Type，由 requests 生成 multipart 边界
+            headers={"Content-Type": None},
+        )
+        if response.status_code not in (200, 201, 202):
+            raise Exception(
+                f"Annotation batch import failed for app {app_id}: "
+                f"{response.status_code} - {response.text[:200]}"
+            )
+        job = self._json(response)
+        job_id = job.get("job_id")
+
+        deadline = time.monotonic() + self.ANNOTATION_IMPORT_TIMEOUT
+        while job.get("job_status") not in ("completed", "error"):
+            if time.monotonic() > deadline:
+                raise Exception(
+                    f"Annotation batch import job {job_id} timed out ({job.get('job_status')})"
+                )
+            time.sleep(self.ANNOTATION_IMPORT_POLL_INTERVAL)
+            response = self._request(
+                LISTING,
+                "GET",
+                f"{self.base_url}/console/api/apps/{app_id}/annotations/batch-import-status/{job_id}",
+                cacheable=False,
+            )
+            if response.status_code != 200:
+                raise Exception(
+                    f"Failed to fetch status of annotation import job {job_id}: {response.status_code}"
+                )
+            job = self._json(response)
+
+        if job.get("job_status") == "error":
+            raise Exception(
+                f"Annotation batch import job {job_id} failed: {job.get('error_msg')}"
+            )
+        return job
+
+    def iter_conversations(
+        self,
+        app_id: str,
+        app_mode: str,
+        start: str | None = None,
+        end: str | None = None,
+        limit: int = 100,
+    ) -> Generator[list, None, None]:
+        """逐页获取应用在时间窗口内创建的会话，按创建时间升序，内存中只保留当前页
+
+        Args:
+            app_mode: 应用类型，completion 应用使用 completion-conversations 接口
+            start / end: "YYYY-MM-DD HH:MM"，按账号时区解释，end 所在分钟包含在内
+
+        Raises:
+            Exception: 某一页获取失败时抛出
+        """
+        kind = "completion" if app_mode == "completion" else "chat"
+        params: dict[str, int | str] = {
+            "limit": limit,
+            "annotation_status": "all",
+            # 按创建时间升序分页，窗口内新产生的会话不会挤动已读取的页
+            "sort_by": "created_at",
+        }
+        if start:
+            params["start"] = start
+        if end:
+            params["end"] = end
+
+        page = 1
+        while True:
+            response = self._request(
+                LISTING,
+                "GET",
+                f"{self.base_url}/console/api/apps/{app_id}/{kind}-conversations",
+                params={**params, "page": page},
+                cacheable=False,
+                stream=True,
+            )
+            if response.status_code != 200:
+                response.close()
+                raise Exception(
+                    f"Failed to fetch conversations for app {app_id}, page {page}: {response.status_code}"
+                )
+
+            fields = {}
+            has_items = False
+            for items in self._iter_page_data(response, fields):
+                has_items = True
+                yield items
+
+            if not has_items or not fields.get("has_more", False):
                 break
+            page += 1
 
-            all_annotations.extend(items)
+    def iter_conversation_messages(
+        self, app_id: str, conversation_id: str, limit: int = 100
+    ) -> Generator[list, None, None]:
+        """逐页获取对话类应用中一个会话的消息
 
-            # 检查是否还有更多数据
-            if not data.get("has_more", False):
+        接口以 first_id 为游标从新到旧翻页，每页内按时间升序。
+
+        Raises:
+            Exception: 某一页获取失败时抛出
+        """
+        first_id = None
+        while True:
+            params = {"conversation_id": conversation_id, "limit": limit}
+            if first_id:
+                params["first_id"] = first_id
+            response = self._request(
+                LISTING,
+                "GET",
+                f"{self.base_url}/console/api/apps/{app_id}/chat-messages",
+                params=params,
+                cacheable=False,
+                stream=True,
+            )
+            if response.status_code != 200:
+                response.close()
+                raise Exception(
+                    f"Failed to fetch messages for conversation {conversation_id}: {response.status_code}"
+                )
+
+            fields = {}
+            oldest = None
+            for items in self._iter_page_data(response, fields):
+                if oldest is None:
+                    oldest = items[0].get("id")
+                yield items
+
+            if oldest is None or not fields.get("has_more", False):
                 break
+            first_id = oldest
+
+    def iter_workflow_app_logs(
+        self,
+        app_id: str,
+        created_after: str | None = None,
+        created_before: str | None = None,
+        limit: int = 100,
+    ) -> Generator[list, None, None]:
+        """逐页获取 workflow 应用在时间窗口内的运行日志（每条含 workflow_run 摘要）
+
+        Args:
+            created_after / created_before: ISO 8601 时间，两端均包含
+
+        Raises:
+            Exception: 某一页获取失败时抛出
+        """
+        params: dict[str, int | str] = {"limit": limit}
+        if created_after:
+            params["created_at__after"] = created_after
+        if created_before:
+            params["created_at__before"] = created_before
 
+        page = 1
+        while True:
+            response = self._request(
+                LISTING,
+                "GET",
+                f"{self.base_url}/console/api/apps/{app_id}/workflow-app-logs",
+                params={**params, "page": page},
+                cacheable=False,
+                stream=True,
+            )
+            if response.status_code != 200:
+                response.close()
+                raise Exception(
+                    f"Failed to fetch workflow logs for app {app_id}, page {page}: {response.status_code}"
+                )
+
+            fields = {}
+            has_items = False
+            for items in self._iter_page_data(response, fields):
+                has_items = True
+                yield items
+
+            if not has_items or not fields.get("has_more", False):
+                break
             page += 1
 
-        return all_annotations
+    def iter_workflow_runs(
+        self, app_id: str, app_mode: str, limit: int = 100
+    ) -> Generator[list, None, None]:
+        """从新到旧逐页获取应用的工作流运行记录（last_id 游标，不支持时间过滤）
+
+        Args:
+            app_mode: advanced-chat 应用使用 advanced-chat/workflow-runs 接口
+
+        Raises:
+            Exception: 某一页获取失败时抛出
+        """
+        path = (
+            "advanced-chat/workflow-runs"
+            if app_mode == "advanced-chat"
+            else "workflow-runs"
+        )
+        last_id = None
+        while True:
+            params = {"limit": limit}
+            if last_id:
+                params["last_id"] = last_id
+            response = self._request(
+                LISTING,
+                "GET",
+                f"{self.base_url}/console/api/apps/{app_id}/{path}",
+                params=params,
+                cacheable=False,
+                stream=True,
+            )
+            if response.status_code != 200:
+                response.close()
+                raise Exception(
+                    f"Failed to fetch workflow runs for app {app_id}: {response.status_code}"
+                )
+
+            fields = {}
+            last_id = None
+            for items in self._iter_page_data(response, fields):
+                last_id = items[-1].get("id")
+                yield items
+
+            if last_id is None or not fields.get("has_more", False):
+                break
+
+    def get_workflow_run(self, app_id: str, run_id: str) -> dict:
+        """获取工作流运行详情（含 inputs / outputs）
+
+        Raises:
+            Exception: 请求失败时抛出
+        """
+        response = self._request(
+            LISTING,
+            "GET",
+            f"{self.base_url}/console/api/apps/{app_id}/workflow-runs/{run_id}",
+            cacheable=False,
+        )
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to fetch workflow run {run_id}: {response.status_code}"
+            )
+        return self._json(response)
+
+    def get_workflow_run_node_executions(self, app_id: str, run_id: str) -> list:
+        """获取工作流运行中各节点的执行记录
+
+        Raises:
+            Exception: 请求失败时抛出
+        """
+        response = self._request(
+            LISTING,
+            "GET",
+            f"{self.base_url}/console/api/apps/{app_id}/workflow-runs/{run_id}/node-executions",
+            cacheable=False,
+        )
+        if response.status_code != 200:
+            raise Exception(
+                f"Failed to fetch node executions of workflow run {run_id}: {response.status_code}"
+            )
+        return self._json(response).get("data", [])
 
     def get_all_datasets(self, limit: int = 100) -> list:
         """获取所有知识库列表
@@ -329,10 +1017,11 @@ class DifyClient:
         all_datasets = []
         page = 1
         while True:
-            response = self.session.get(
+            response = self._request(
+                LISTING,
+                "GET",
                 f"{self.base_url}/console/api/datasets",
                 params={"page": page, "limit": limit},
-                timeout=self.timeout,
             )
             if response.status_code != 200:
                 logger.error(
@@ -340,7 +1029,7 @@ class DifyClient:
                 )
                 break
 
-            data = response.json()
+            data = self._json(response)
             items = data.get("data", [])
             if not items:
                 break
@@ -366,10 +1055,11 @@ class DifyClient:
         all_documents = []
         page = 1
         while True:
-            response = self.session.get(
+            response = self._request(
+                LISTING,
+                "GET",
                 f"{self.base_url}/console/api/datasets/{dataset_id}/documents",
                 params={"page": page, "limit": limit},
-                timeout=self.timeout,
             )
             if response.status_code != 200:
                 logger.warning(
@@ -377,7 +1067,7 @@ class DifyClient:
                 )
                 break
 
-            data = response.json()
+            data = self._json(response)
             items = data.get("data", [])
             if not items:
                 break
@@ -403,28 +1093,50 @@ class DifyClient:
             分段列表
         """
         all_segments = []
+        try:
+            for items in self.iter_document_segments(dataset_id, document_id, limit):
+                all_segments.extend(items)
+        except Exception as e:
+            logger.warning(str(e))
+        return all_segments
+
+    def iter_document_segments(
+        self, dataset_id: str, document_id: str, limit: int = 100
+    ) -> Generator[list, None, None]:
+        """逐页获取指定文档的分段，内存中只保留当前页
+
+        Yields:
+            每页的分段列表
+
+        Raises:
+            Exception: 某一页获取失败时抛出，避免调用方把不完整的结果当作完整备份
+        """
         page = 1
         page_limit = min(limit, 100)
         while True:
-            response = self.session.get(
+            response = self._request(
+                LISTING,
+                "GET",
                 f"{self.base_url}/console/api/datasets/{dataset_id}/documents/{document_id}/segments",
                 params={"page": page, "limit": page_limit},
-                timeout=self.timeout,
+                stream=True,
             )
             if response.status_code != 200:
-                logger.warning(
-                    f"Failed to fetch segments for document {document_id}: {response.status_code}"
+                response.close()
+                raise Exception(
+                    f"Failed to fetch segments for document {document_id}, page {page}: {response.status_code}"
                 )
-                break
 
-            data = response.json()
-            items = data.get("data", [])
-            if not items:
+            fields = {}
+            has_items = False
+            for items in self._iter_page_data(response, fields):
+                has_items = True
+                yield items
+            if not has_items:
                 break
 
-            all_segments.extend(items)
-            total_pages = data.get("total_pages")
-            has_more = data.get("has_more")
+            total_pages = fields.get("total_pages")
+            has_more = fields.get("has_more")
             if isinstance(total_pages, int):
                 if page >= total_pages:
                     break
@@ -432,15 +1144,16 @@ class DifyClient:
                 break
             page += 1
 
-        return all_segments
-
     def get_document_download_url(
         self, dataset_id: str, document_id: str
     ) -> str | None:
         """获取文档级下载链接，优先使用 Dify 新版 document download 接口。"""
-        response = self.session.get(
+        response = self._request(
+            LISTING,
+            "GET",
             f"{self.base_url}/console/api/datasets/{dataset_id}/documents/{document_id}/download",
-            timeout=self.timeout,
+            # 签名链接有时效，不能缓存
+            cacheable=False,
         )
         if response.status_code != 200:
             logger.warning(
@@ -449,7 +1162,7 @@ class DifyClient:
             return None
 
         try:
-            payload = response.json()
+            payload = self._json(response)
         except ValueError:
             logger.warning(
                 f"Document download url response is not JSON for document {document_id}"
@@ -468,9 +1181,20 @@ class DifyClient:
         return None
 
     def download_document_file(
-        self, dataset_id: str, document_id: str
-    ) -> tuple[bytes | None, str | None]:
-        """按 document 下载原始文件，兼容新版 Dify 控制台接口。"""
+        self,
+        dataset_id: str,
+        document_id: str,
+        reservation: Reservation | None = None,
+    ) -> tuple[SpooledBuffer | None, str | None]:
+        """按 document 下载原始文件，兼容新版 Dify 控制台接口。
+
+        签名链接经 StorageDownloader 下载：按主机复用连接、断点续传、大文件分段并行；
+        指向对象存储（非 Dify 主机）的链接使用该存储主机的限流器。
+        下载失败（状态码错误、重试耗尽或校验失败）时返回 (None, None)，
+        由调用方改用上传文件接口。
+        内容写入 SpooledBuffer（由调用方关闭），内存预算不足或文件较大时落盘；
+        reservation 专用于该缓冲。
+        """
         download_url = self.get_document_download_url(dataset_id, document_id)
         if not download_url:
             return None, None
@@ -478,51 +1202,69 @@ class DifyClient:
         parsed_download_url = urlparse(download_url)
         parsed_base_url = urlparse(self.base_url)
         same_host = parsed_download_url.netloc in {"", parsed_base_url.netloc}
+        limiter = (
+            None
+            if same_host
+            else LimiterGroup.for_storage_host(parsed_download_url.netloc)
+        )
 
-        if same_host:
-            response = self.session.get(download_url, timeout=self.timeout)
-        else:
-            response = requests.get(download_url, timeout=self.timeout)
-
-        if response.status_code == 200:
-            content_type = response.headers.get(
-                "Content-Type", "application/octet-stream"
+        def send(session: requests.Session, headers: dict) -> requests.Response:
+            return self._request(
+                DOWNLOAD,
+                "GET",
+                download_url,
+                session=session,
+                cacheable=False,
+                limiter=limiter,
+                stream=True,
+                headers=headers,
             )
-            return response.content, content_type
 
-        logger.warning(
-            f"Cannot download document {document_id} from signed url: {response.status_code}"
-        )
-        return None, None
+        # 跨域签名链接不能携带 console 鉴权头，使用下载器按主机维护的连接池
+        try:
+            return StorageDownloader.shared().download(
+                download_url,
+                send,
+                reservation,
+                session=self.session if same_host else None,
+            )
+        except StorageDownloadError as e:
+            logger.warning(
+                f"Cannot download document {document_id} from signed url: {e}"
+            )
+            return None, None
 
     def download_upload_file(
-        self, upload_file_id: str
-    ) -> tuple[bytes | None, str | None]:
+        self, upload_file_id: str, reservation: Reservation | None = None
+    ) -> tuple[SpooledBuffer | None, str | None]:
         """下载原始上传文件内容
 
         Args:
             upload_file_id: 上传文件的 ID（来自 document data_source_info）
+            reservation: 内容留在内存中时占用的预留（专用于该缓冲）
 
         Returns:
-            (file_bytes, mime_type) 元组，失败时返回 (None, None)
+            (内容, mime_type) 元组，内容为 SpooledBuffer（由调用方关闭），失败时返回 (None, None)
         """
         # Dify Console API 文件预览/下载端点
         url = f"{self.base_url}/console/api/files/{upload_file_id}/file-preview"
-        response = self.session.get(url, timeout=self.timeout)
+        response = self._request(DOWNLOAD, "GET", url, stream=True)
         if response.status_code == 200:
             content_type = response.headers.get(
                 "Content-Type", "application/octet-stream"
             )
-            return response.content, content_type
+            return self._spool_body(response, reservation), content_type
+        response.close()
 
         # 降级：尝试另一个端点路径
         url2 = f"{self.base_url}/files/{upload_file_id}/file-preview"
-        response2 = self.session.get(url2, timeout=self.timeout)
+        response2 = self._request(DOWNLOAD, "GET", url2, stream=True)
         if response2.status_code == 200:
             content_type = response2.headers.get(
                 "Content-Type", "application/octet-stream"
             )
-            return response2.content, content_type
+            return self._spool_body(response2, reservation), content_type
+        response2.close()
 
         logger.warning(f"Cannot download file {upload_file_id}: {response.status_code}")
         return None, None
@@ -530,19 +1272,7 @@ class DifyClient:
     @staticmethod
     def generate_filename(app_name: str, version_display_name: str) -> str:
         """生成安全的文件名"""
-        safe_app = (
-            "".join(c for c in app_name if c.isalnum() or c in (" ", "-", "_"))
-            .strip()
-            .replace(" ", "_")
-        )
-        safe_ver = (
-            "".join(
-                c for c in version_display_name if c.isalnum() or c in (" ", "-", "_")
-            )
-            .strip()
-            .replace(" ", "_")
-        )
-        return f"{safe_app}-{safe_ver}.yml"
+        return f"{safe_name(app_name)}-{safe_name(version_display_name)}.yml"
 
 
 class DifyBackupProvider(ToolProvider):
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from dify_plugin.config.logger_format import plugin_logger_handler
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+# 缓存条目中保留的响应头（响应体按解压后的内容保存，不保留 Content-Encoding）
+_KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class HttpCache:
+    """
+    磁盘 HTTP 响应缓存
+
+    - 每个条目由 <key>.json（元数据）与 <key>.body（响应体）两个文件组成
+    - 按总字节数做 LRU 淘汰，访问顺序以元数据文件的 mtime 持久化
+    - 有 ETag / Last-Modified 的条目每次都做条件请求校验，其余条目按 TTL 直接命中
+    """
+
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+    DEFAULT_TTL = 3600
+
+    _shared: "HttpCache | None" = None
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: int = DEFAULT_TTL,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @classmethod
+    def shared(cls) -> "HttpCache":
+        """进程内共享的默认缓存，目录可通过 DIFY_BACKUP_CACHE_DIR 指定"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                directory = os.environ.get("DIFY_BACKUP_CACHE_DIR") or os.path.join(
+                    tempfile.gettempdir(), "dify_backup_http_cache"
+                )
+                cls._shared = cls(directory)
+            return cls._shared
+
+    @staticmethod
+    def make_key(namespace: str, method: str, url: str, params: dict | None) -> str:
+        """按 命名空间 + 方法 + URL + 排序后的参数 生成缓存键"""
+        normalized = json.dumps(
+            [namespace, method.upper(), url, sorted((params or {}).items())],
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return f"{base}.json", f"{base}.body"
+
+    def _load_index(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-5]
+            meta_path, body_path = self._paths(key)
+            try:
+                entries.append(
+                    (os.path.getmtime(meta_path), key, os.path.getsize(body_path))
+                )
+            except OSError:
+                continue
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total_bytes += size
+
+    def get(self, key: str) -> tuple[dict, bytes] | None:
+        """读取缓存条目，返回 (meta, body)，不存在时返回 None"""
+        with self._lock:
+            if key not in self._index:
+                return None
+            meta_path, body_path = self._paths(key)
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                with open(body_path, "rb") as f:
+                    body = f.read()
+            except (OSError, ValueError):
+                self._remove(key)
+                return None
+            self._index.move_to_end(key)
+            os.utime(meta_path)
+            return meta, body
+
+    def touch(self, key: str) -> None:
+        """条件请求返回 304 后刷新条目的存储时间"""
+        with self._lock:
+            if key not in self._index:
+                return
+            meta_path, _ = self._paths(key)
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                meta["stored_at"] = time.time()
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+            except (OSError, ValueError):
+                self._remove(key)
+                return
+            self._index.move_to_end(key)
+
+    def put(self, key: str, url: str, response: requests.Response) -> None:
+        """写入 200 响应，超出容量时淘汰最久未使用的条目
+
+        响应需已完整读入（stream=False），否则不缓存。
+        """
+        if not response._content_consumed:
+            return
+        body = response.content
+        if len(body) > self.max_bytes:
+            return
+        meta = {
+            "url": url,
+            "stored_at": time.time(),
+            "headers": {
+                name: response.headers[name]
+                for name in _KEPT_HEADERS
+                if name in response.headers
+            },
+        }
+        meta_path, body_path = self._paths(key)
+        with self._lock:
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)
+            try:
+                # 先写 body 再写 meta，索引只认 meta 存在的条目
+                with open(body_path, "wb") as f:
+                    f.write(body)
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+            except OSError as e:
+                logger.warning(f"HTTP 缓存写入失败: {e}")
+                self._remove(key)
+                return
+            self._index[key] = len(body)
+            self._total_bytes += len(body)
+            while self._total_bytes > self.max_bytes and self._index:
+                oldest = next(iter(self._index))
+                self._remove(oldest)
+
+    def _remove(self, key: str) -> None:
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class CachedSession(requests.Session):
+    """
+    带磁盘缓存的 requests.Session
+
+    只有调用方显式传入 cacheable=True 的 GET 请求才会走缓存，
+    命中统计按 session 维度记录，便于在单次工具调用的摘要中展示。
+    stream=True 的请求不走缓存：写缓存需要先把响应体整体读入内存，
+    会绕过调用方按块读取与内存预留的处理。
+    """
+
+    def __init__(self, cache: HttpCache, namespace: str):
+        super().__init__()
+        self.cache = cache
+        self.namespace = namespace
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0}
+        self._stats_lock = threading.Lock()
+
+    def request(self, method, url, *args, cacheable: bool = False, **kwargs):
+        if not cacheable or method.upper() != "GET" or kwargs.get("stream"):
+            return super().request(method, url, *args, **kwargs)
+
+        key = self.cache.make_key(self.namespace, method, url, kwargs.get("params"))
+        cached = self.cache.get(key)
+        headers = dict(kwargs.pop("headers", None) or {})
+
+        if cached is not None:
+            meta, body = cached
+            etag = meta["headers"].get("ETag")
+            last_modified = meta["headers"].get("Last-Modified")
+            if etag or last_modified:
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+            elif time.time() - meta["stored_at"] < self.cache.ttl:
+                self._count("hits")
+                return self._build_response(meta, body, url)
+
+        response = super().request(method, url, *args, headers=headers, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            self.cache.touch(key)
+            self._count("revalidated")
+            return self._build_response(cached[0], cached[1], url)
+
+        self._count("misses")
+        if response.status_code == 200:
+            self.cache.put(key, url, response)
+        return response
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def _build_response(meta: dict, body: bytes, url: str) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response._content = body
+        # 标记响应体已读完，iter_content 直接按块切分缓存的内容
+        response._content_consumed = True
+        # 旧版本写入的条目可能带有 Content-Encoding，回放时只取保留的响应头
+        response.headers = CaseInsensitiveDict(
+            {
+                name: meta["headers"][name]
+                for name in _KEPT_HEADERS
+                if name in meta["headers"]
+            }
+        )
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = meta.get("url", url)
+        response.from_cache = True  # type: ignore[attr-defined]
+        return response
+
+    def stats_text(self) -> str:
+        """摘要中展示的缓存统计"""
+        return (
+            f"HTTP 缓存: 命中 {self.stats['hits']} / "
+            f"304 校验 {self.stats['revalidated']} / 未命中 {self.stats['misses']}"
+        )
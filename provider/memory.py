@@ -0,0 +1,269 @@
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import BinaryIO
+
+from dify_plugin.config.logger_format import plugin_logger_handler
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+
+class MemoryBudgetExceeded(Exception):
+    """预留无法在预算内满足：超过整个预算，或等待超时"""
+
+
+class MemoryBudget:
+    """
+    进程级内存预算
+
+    各导出阶段在把数据缓冲进内存之前先预留字节数，预算用尽时阻塞等待
+    （背压），直到其他阶段释放。预留从不超出预算：超过整个预算的预留
+    与等待超时的预留抛出 MemoryBudgetExceeded，由调用方让该项失败；
+    可以落盘的数据使用 SpooledBuffer，预算不足时直接写入磁盘。
+    """
+
+    DEFAULT_LIMIT = 256 * 1024 * 1024
+
+    # 等待超过该时长仍无法满足时抛出 MemoryBudgetExceeded，
+    # 避免多个增长中的预留互相等待时永久阻塞
+    MAX_WAIT_SECONDS = 120
+
+    _shared: "MemoryBudget | None" = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, limit_bytes: int = DEFAULT_LIMIT):
+        self.limit_bytes = limit_bytes
+        self._cond = threading.Condition()
+        self._used = 0
+        self._peak = 0
+        self._waits = 0
+
+    @classmethod
+    def shared(cls) -> "MemoryBudget":
+        """进程内共享的预算，上限可通过 DIFY_BACKUP_MEMORY_BUDGET（字节）指定"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                limit = int(
+                    os.environ.get("DIFY_BACKUP_MEMORY_BUDGET") or cls.DEFAULT_LIMIT
+                )
+                cls._shared = cls(limit)
+            return cls._shared
+
+    def reserve(self, nbytes: int = 0) -> "Reservation":
+        """预留 nbytes 字节，返回可增长、可释放的 Reservation"""
+        reservation = Reservation(self)
+        reservation.resize(nbytes)
+        return reservation
+
+    def _acquire(self, nbytes: int, held: int = 0) -> None:
+        """预留 nbytes 字节；held 为调用方已持有的量
+
+        Raises:
+            MemoryBudgetExceeded: held + nbytes 超过整个预算，或等待 MAX_WAIT_SECONDS 后仍无法满足
+        """
+        if held + nbytes > self.limit_bytes:
+            raise MemoryBudgetExceeded(
+                f"Memory reservation of {held + nbytes} bytes exceeds "
+                f"the budget of {self.limit_bytes} bytes"
+            )
+        with self._cond:
+            if self._used + nbytes > self.limit_bytes:
+                self._waits += 1
+                logger.info(
+                    f"内存预算不足（已用 {self._used} / {self.limit_bytes} 字节），"
+                    f"等待释放 {nbytes} 字节"
+                )
+                deadline = time.monotonic() + self.MAX_WAIT_SECONDS
+                while self._used + nbytes > self.limit_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise MemoryBudgetExceeded(
+                            f"Timed out after {self.MAX_WAIT_SECONDS}s waiting for "
+                            f"{nbytes} bytes of memory budget "
+                            f"({self._used} / {self.limit_bytes} bytes in use)"
+                        )
+                    self._cond.wait(remaining)
+            self._take(nbytes)
+
+    def _try_acquire(self, nbytes: int) -> bool:
+        """不等待地预留 nbytes 字节，预算不足时返回 False"""
+        with self._cond:
+            if self._used + nbytes > self.limit_bytes:
+                return False
+            self._take(nbytes)
+            return True
+
+    def _take(self, nbytes: int) -> None:
+        self._used += nbytes
+        self._peak = max(self._peak, self._used)
+
+    def _release(self, nbytes: int) -> None:
+        with self._cond:
+            self._used -= nbytes
+            self._cond.notify_all()
+
+    def reset_peak(self) -> None:
+        """以当前占用重置峰值与背压计数，工具调用开始时调用"""
+        with self._cond:
+            self._peak = self._used
+            self._waits = 0
+
+    def stats_text(self) -> str:
+        """摘要中展示的内存统计"""
+        with self._cond:
+            return (
+                f"内存峰值: {self._peak / 1024 / 1024:.1f} MB / "
+                f"预算 {self.limit_bytes / 1024 / 1024:.0f} MB"
+                + (f"（背压等待 {self._waits} 次）" if self._waits else "")
+            )
+
+
+class Reservation:
+    """
+    一次内存预留
+
+    可以随着缓冲数据增长而扩大（扩大时同样受预算约束），
+    数据交给下一阶段或发送完毕后调用 release()。支持 with 语句。
+    """
+
+    def __init__(self, budget: MemoryBudget):
+        self.budget = budget
+        self.nbytes = 0
+
+    def resize(self, nbytes: int) -> None:
+        """调整预留量，增长部分可能阻塞
+
+        Raises:
+            MemoryBudgetExceeded: 增长部分无法在预算内满足（预留量保持不变）
+        """
+        delta = nbytes - self.nbytes
+        if delta > 0:
+            self.budget._acquire(delta, held=self.nbytes)
+        elif delta < 0:
+            self.budget._release(-delta)
+        self.nbytes = nbytes
+
+    def try_resize(self, nbytes: int) -> bool:
+        """不等待地扩大预留量，预算不足时返回 False（预留量保持不变）"""
+        delta = nbytes - self.nbytes
+        if delta > 0 and not self.budget._try_acquire(delta):
+            return False
+        if delta < 0:
+            self.budget._release(-delta)
+        self.nbytes = nbytes
+        return True
+
+    def release(self) -> None:
+        self.resize(0)
+
+    def __enter__(self) -> "Reservation":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class SpooledBuffer:
+    """
+    受内存预算约束的缓冲文件
+
+    数据不超过 max_size 且预算允许时留在内存中，占用记在 reservation 上
+    （该预留专用于本缓冲）；写入将超过 max_size 或预算不足时，
+    已有内容整体转存到磁盘临时文件并释放预留，不等待其他阶段释放内存。
+    关闭时释放预留。大小由本类自行记录（size 属性）。
+
+    write_at 按偏移写入，可供多个线程并行填充预先分配的区间；
+    其余方法与普通文件对象相同，不保证线程安全。
+    """
+
+    def __init__(self, reservation: Reservation, max_size: int):
+        self.reservation = reservation
+        self.max_size = max_size
+        self.size = 0
+        self._file: BinaryIO = io.BytesIO()
+        self._in_memory = True
+        self._lock = threading.Lock()
+
+    @property
+    def in_memory(self) -> bool:
+        return self._in_memory
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def rollover(self) -> None:
+        """把内存中的内容转存到磁盘临时文件并释放预留"""
+        if not self._in_memory:
+            return
+        memory = self._file
+        disk = tempfile.TemporaryFile()
+        with memory.getbuffer() as view:
+            disk.write(view)
+        disk.seek(memory.tell())
+        self._file = disk
+        self._in_memory = False
+        memory.close()
+        self.reservation.release()
+
+    def _ensure_room(self, end: int) -> None:
+        """写到 end 之前确认内存预留足够，否则落盘"""
+        if self._in_memory and end > self.reservation.nbytes:
+            if end > self.max_size or not self.reservation.try_resize(end):
+                self.rollover()
+
+    def allocate(self, size: int) -> None:
+        """预先分配 size 字节（以零填充），之后可用 write_at 按偏移写入"""
+        self._ensure_room(size)
+        if self._in_memory:
+            if size > self.size:
+                # BytesIO 写到末尾之后时以零填充中间部分，只分配一次
+                position = self._file.tell()
+                self._file.seek(size - 1)
+                self._file.write(b"\0")
+                self._file.seek(position)
+        elif size > self.size:
+            self._file.truncate(size)
+        self.size = max(self.size, size)
+
+    def write(self, data) -> int:
+        self._ensure_room(self._file.tell() + len(data))
+        written = self._file.write(data)
+        self.size = max(self.size, self._file.tell())
+        return written
+
+    def write_at(self, position: int, data) -> None:
+        """在 position 处写入 data（线程安全）"""
+        with self._lock:
+            self._file.seek(position)
+            self.write(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def seekable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+        self.reservation.release()
+
+    def __enter__(self) -> "SpooledBuffer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,106 @@
+import os
+import threading
+
+
+class _SafeCharTable(dict):
+    """
+    str.translate 使用的字符表
+
+    首次遇到某个字符时判定是否保留并缓存结果，之后同一字符直接查表；
+    字母、数字（含中日韩文字）与 keep 中的字符保留，其余删除。
+    """
+
+    def __init__(self, keep: str):
+        super().__init__()
+        self.keep = keep
+
+    def __missing__(self, codepoint: int) -> int | None:
+        char = chr(codepoint)
+        value = codepoint if char.isalnum() or char in self.keep else None
+        self[codepoint] = value
+        return value
+
+
+# 标注导出文件名的后缀，导入时据此从文件名取回应用名
+ANNOTATION_FILE_SUFFIX = "-annotations.csv"
+
+_NAME_TABLE = _SafeCharTable(" -_")
+# 文件名额外保留 "."，以便沿用原始扩展名
+_FILE_TABLE = _SafeCharTable(" -_.")
+
+
+def safe_name(name: str | None, keep_dots: bool = False) -> str:
+    """将名称转换为文件系统安全的字符串，保留中文等文字，空格替换为下划线"""
+    table = _FILE_TABLE if keep_dots else _NAME_TABLE
+    safe = (name or "").translate(table).strip().replace(" ", "_")
+    return safe or "unknown"
+
+
+class NameIndex:
+    """
+    单个归档（ZIP 或存储目录）内的名称冲突索引
+
+    - 名称按 casefold 比较，兼容大小写不敏感的文件系统
+    - 同一 owner 重复申请同一名称得到相同结果
+    - 与其他 owner 冲突时在扩展名前追加 -2、-3 …；按列表顺序预先申请，
+      后缀在多次导出之间保持稳定
+    - mapping 记录最终名称 → owner，写入清单供恢复时对照
+    """
+
+    def __init__(self):
+        self.mapping: dict[str, str] = {}
+        self._owners: dict[str, str] = {}
+        self._claims: dict[tuple[str, str], str] = {}
+        self._next_suffix: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, name: str, owner: str, split_extension: bool = True) -> str:
+        """为 owner 申请名称，返回不与其他 owner 冲突的名称
+
+        Args:
+            split_extension: 后缀是否加在扩展名之前（"a.pdf" → "a-2.pdf"）
+        """
+        with self._lock:
+            requested = name
+            claimed = self._claims.get((owner, requested))
+            if claimed is not None:
+                return claimed
+
+            key = name.casefold()
+            if self._owners.get(key, owner) != owner:
+                stem, ext = os.path.splitext(name) if split_extension else (name, "")
+                suffix = self._next_suffix.get(key, 2)
+                while True:
+                    candidate = f"{stem}-{suffix}{ext}"
+                    suffix += 1
+                    if self._owners.get(candidate.casefold(), owner) == owner:
+                        break
+                self._next_suffix[key] = suffix
+                name, key = candidate, candidate.casefold()
+
+            self._owners[key] = owner
+            self._claims[(owner, requested)] = name
+            self.mapping[name] = owner
+            return name
+
+
+def annotation_filename(app_name: str) -> str:
+    """生成标注文件名：应用-annotations.csv，保留中文字符和常用字符"""
+    return f"{safe_name(app_name)}{ANNOTATION_FILE_SUFFIX}"
+
+
+def annotation_filenames(apps: list) -> dict[str, str]:
+    """按应用列表顺序为各应用分配不重复的标注文件名，返回 应用 ID → 文件名
+
+    同名应用的文件名为 应用-2-annotations.csv、应用-3-annotations.csv …，
+    导入时按目标工作空间的应用列表以同样的规则反查。
+    """
+    names = NameIndex()
+    return {
+        app.get("id"): annotation_filename(
+            names.claim(
+                safe_name(app.get("name")), app.get("id"), split_extension=False
+            )
+        )
+        for app in apps
+    }
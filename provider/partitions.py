@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Any
+
+# 分区粒度 → 摘要中的名称
+PARTITION_GRANULARITIES = {"day": "天", "week": "周", "month": "月"}
+
+
+def partition_window(day: date, granularity: str) -> tuple[str, date, date]:
+    """返回包含 day 的分区 (标识, 首日, 末日)
+
+    周、月分区总是完整的自然周（周一开始）/ 自然月，不随导出范围裁剪，
+    同一分区在不同调用中内容范围一致，检查点可以复用。
+    """
+    if granularity == "week":
+        first = day - timedelta(days=day.weekday())
+        year, week, _ = first.isocalendar()
+        return f"{year}-W{week:02d}", first, first + timedelta(days=6)
+    if granularity == "month":
+        first = day.replace(day=1)
+        next_month = (first + timedelta(days=32)).replace(day=1)
+        return first.strftime("%Y-%m"), first, next_month - timedelta(days=1)
+    return day.isoformat(), day, day
+
+
+def time_partitions(
+    start: date, end: date, granularity: str
+) -> list[tuple[str, date, date]]:
+    """覆盖 [start, end] 的分区列表，按时间升序"""
+    partitions = []
+    day = start
+    while day <= end:
+        partition = partition_window(day, granularity)
+        partitions.append(partition)
+        day = partition[2] + timedelta(days=1)
+    return partitions
+
+
+def parse_date(value: Any, name: str) -> date | None:
+    """解析 YYYY-MM-DD 形式的日期参数，空值返回 None
+
+    Raises:
+        ValueError: 日期格式错误
+    """
+    if value in (None, ""):
+        return None
+    try:
+        return date.fromisoformat(str(value).strip()[:10])
+    except ValueError as e:
+        raise ValueError(
+            f"{name} must be a date in YYYY-MM-DD format, got {value!r}"
+        ) from e
+
+
+def app_created_date(app: dict, tz: timezone | None = None) -> date | None:
+    """应用的创建日期（列表与详情接口中为时间戳或 ISO 字符串），无法解析时返回 None"""
+    created_at = app.get("created_at")
+    try:
+        if isinstance(created_at, (int, float)):
+            return datetime.fromtimestamp(created_at, tz).date()
+        if created_at:
+            return datetime.fromisoformat(str(created_at).replace("Z", "+00:00")).date()
+    except (ValueError, OSError):
+        pass
+    return None
+
+
+def utc_timestamp(day: date) -> int:
+    """UTC 日期 00:00 的时间戳"""
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
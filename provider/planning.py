@@ -0,0 +1,210 @@
+import logging
+import math
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+from dify_plugin.config.logger_format import plugin_logger_handler
+
+from provider.concurrency import iter_concurrent
+from provider.dify_backup import DifyClient
+from provider.progress import format_bytes, format_duration
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+T = TypeVar("T")
+
+# 试运行时每类单元抽样执行的数量
+DRY_RUN_SAMPLE_SIZE = 3
+
+# 抽样中没有出现的端点类别，按该耗时（秒/请求）推算
+DEFAULT_SECONDS_PER_REQUEST = 1.0
+
+
+def sample_units(
+    items: list[T],
+    size: int = DRY_RUN_SAMPLE_SIZE,
+    key: Callable[[T], Any] | None = None,
+) -> list[T]:
+    """从列表中等间隔取 size 个单元；指定 key 时先按 key 排序，使各类单元都有机会被抽中"""
+    ordered = sorted(items, key=key) if key else list(items)
+    if len(ordered) <= size:
+        return ordered
+    return [ordered[i * len(ordered) // size] for i in range(size)]
+
+
+class Sample:
+    """一组抽样单元的测量结果"""
+
+    def __init__(self, size: int, results: list[dict], requests: dict[str, int]):
+        self.size = size
+        self.results = results
+        self.requests = requests
+
+    def mean(self, key: str) -> float:
+        """成功单元的 key 平均值，没有成功单元时为 0"""
+        if not self.results:
+            return 0.0
+        return sum(result.get(key) or 0 for result in self.results) / len(self.results)
+
+    def requests_per_unit(self, endpoint_class: str) -> float:
+        return self.requests.get(endpoint_class, 0) / self.size if self.size else 0.0
+
+
+class ExecutionPlan:
+    """
+    试运行（dry_run）生成的执行计划
+
+    列表来自工具原有的 get_all_* 调用，导出 / 下载只抽样执行少量单元，
+    按抽样的每单元请求数与字节数推算全部单元。预计耗时按各端点类别：
+    请求数 × 实测平均耗时 ÷ 配置的最大并发，各类别相加。
+
+    请求数与耗时取自 DifyClient.request_stats，同一 client 不应同时用于其他任务。
+    """
+
+    def __init__(self, tool: str, client: DifyClient):
+        self.tool = tool
+        self.client = client
+        self.counts: dict[str, int] = {}
+        self.sampled: dict[str, int] = {}
+        self.requests: dict[str, float] = {}
+        self.bytes = 0.0
+        self._observed: dict[str, list] = {}
+        self._mark = self._snapshot()
+
+    def _snapshot(self) -> dict[str, tuple[int, float]]:
+        return {
+            endpoint_class: (count, seconds)
+            for endpoint_class, (count, seconds) in self.client.request_stats.items()
+        }
+
+    def _take_delta(self) -> dict[str, int]:
+        """上次标记以来各类别的请求数，耗时计入实测平均"""
+        now = self._snapshot()
+        delta = {}
+        for endpoint_class, (count, seconds) in now.items():
+            prev_count, prev_seconds = self._mark.get(endpoint_class, (0, 0.0))
+            if count > prev_count:
+                delta[endpoint_class] = count - prev_count
+                observed = self._observed.setdefault(endpoint_class, [0, 0.0])
+                observed[0] += count - prev_count
+                observed[1] += seconds - prev_seconds
+        self._mark = now
+        return delta
+
+    def record_listing(self) -> None:
+        """把标记以来的列表请求计入计划：正式运行时会原样再发一遍"""
+        for endpoint_class, count in self._take_delta().items():
+            self.add_requests(endpoint_class, count)
+
+    def sample(
+        self,
+        name: str,
+        items: list[T],
+        fn: Callable[[T], dict],
+        max_workers: int,
+    ) -> Sample:
+        """并发执行抽样单元，fn 返回该单元的测量值（如 bytes、versions）
+
+        失败的单元不计入平均值，但其请求仍计入每单元请求数。
+        """
+        self._take_delta()
+        results = []
+        for item, result, error in iter_concurrent(fn, items, max_workers):
+            if error is not None:
+                logger.warning(f"[dry_run] 抽样单元执行失败: {str(error)}")
+                continue
+            results.append(result)
+        self.sampled[name] = len(items)
+        return Sample(len(items), results, self._take_delta())
+
+    def add_count(self, name: str, value: float) -> None:
+        self.counts[name] = self.counts.get(name, 0) + round(value)
+
+    def add_requests(self, endpoint_class: str, count: float) -> None:
+        self.requests[endpoint_class] = self.requests.get(endpoint_class, 0) + count
+
+    def add_bytes(self, nbytes: float) -> None:
+        self.bytes += nbytes
+
+    def extrapolate(
+        self, sample: Sample, total: int, counts: tuple[str, ...] = ()
+    ) -> None:
+        """按抽样的每单元请求数、字节数（及 counts 中的测量值）推算 total 个单元"""
+        for endpoint_class in sample.requests:
+            self.add_requests(
+                endpoint_class, sample.requests_per_unit(endpoint_class) * total
+            )
+        self.add_bytes(sample.mean("bytes") * total)
+        for name in counts:
+            self.add_count(name, sample.mean(name) * total)
+
+    def seconds_per_request(self, endpoint_class: str) -> float:
+        count, seconds = self._observed.get(endpoint_class, (0, 0.0))
+        return seconds / count if count else DEFAULT_SECONDS_PER_REQUEST
+
+    def projected_seconds(self) -> dict[str, float]:
+        """各端点类别的预计耗时（秒）"""
+        return {
+            endpoint_class: count
+            * self.seconds_per_request(endpoint_class)
+            / max(1, self.client.max_workers(endpoint_class))
+            for endpoint_class, count in self.requests.items()
+        }
+
+    def to_dict(self) -> dict:
+        projected = self.projected_seconds()
+        return {
+            "dry_run": True,
+            "tool": self.tool,
+            "counts": self.counts,
+            "sampled": self.sampled,
+            "estimated_requests": {
+                endpoint_class: math.ceil(count)
+                for endpoint_class, count in self.requests.items()
+            },
+            "estimated_total_requests": math.ceil(sum(self.requests.values())),
+            "estimated_bytes": round(self.bytes),
+            "concurrency": {
+                endpoint_class: self.client.max_workers(endpoint_class)
+                for endpoint_class in self.requests
+            },
+            "seconds_per_request": {
+                endpoint_class: round(self.seconds_per_request(endpoint_class), 3)
+                for endpoint_class in self.requests
+            },
+            "projected_seconds": {
+                endpoint_class: round(seconds, 1)
+                for endpoint_class, seconds in projected.items()
+            },
+            "projected_total_seconds": round(sum(projected.values()), 1),
+        }
+
+    def summary_text(self, labels: dict[str, str]) -> str:
+        """执行计划摘要，labels 为计数名称 → 显示名称"""
+        plan = self.to_dict()
+        text = "🧮 试运行：执行计划（未导出任何内容）\n\n"
+        for name, value in plan["counts"].items():
+            text += f"{labels.get(name, name)}: {value}\n"
+        if plan["sampled"]:
+            text += "抽样: " + "，".join(
+                f"{count} 个{labels.get(name, name)}"
+                for name, count in plan["sampled"].items()
+            )
+            text += "\n"
+        text += f"预计请求数: {plan['estimated_total_requests']}"
+        if plan["estimated_requests"]:
+            text += "（" + "，".join(
+                f"{endpoint_class} {count}"
+                for endpoint_class, count in plan["estimated_requests"].items()
+            )
+            text += "）"
+        text += f"\n预计数据量: {format_bytes(plan['estimated_bytes'])}\n"
+        text += "并发上限: " + "，".join(
+            f"{endpoint_class} {workers}"
+            for endpoint_class, workers in plan["concurrency"].items()
+        )
+        text += f"\n预计耗时: {format_duration(plan['projected_total_seconds'])}"
+        text += "（按配置的并发上限与抽样实测的请求耗时推算）\n"
+        return text
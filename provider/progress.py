@@ -0,0 +1,134 @@
+import math
+import threading
+import time
+
+
+class ProgressTracker:
+    """
+    批量导出进度跟踪
+
+    每完成约 every_items 个条目或每隔 every_seconds 秒产出一条进度文本
+    （已完成/总数、已传输字节、吞吐量、预计剩余时间），其余调用返回 None，
+    由工具决定是否 yield 为文本消息。
+
+    单个条目可能耗时很长（大知识库的分段、上万条消息的会话分区），
+    其内部的分页循环调用 tick() 记录进行中的处理量；距上次输出超过
+    every_seconds 时生成一条心跳进度文本，即使没有条目完成。
+    tick() 可在工作线程中调用，心跳文本由产出消息的线程通过 heartbeat() 取出。
+    """
+
+    # 未指定 every_items 时，约每完成 10% 输出一次
+    DEFAULT_STEPS = 10
+    DEFAULT_EVERY_SECONDS = 15.0
+
+    def __init__(
+        self,
+        total: int,
+        unit: str = "个",
+        every_items: int | None = None,
+        every_seconds: float = DEFAULT_EVERY_SECONDS,
+        activity_unit: str = "条",
+    ):
+        self.total = total
+        self.unit = unit
+        self.every_items = every_items
+        self.every_seconds = every_seconds
+        self.activity_unit = activity_unit
+        self.done = 0
+        self.bytes_done = 0
+        # 进行中条目内部已处理的量（分段、消息等），只用于心跳文本
+        self.activity = 0
+        self._heartbeat: str | None = None
+        self.started_at = time.monotonic()
+        self._last_report_at = self.started_at
+        self._last_report_done = 0
+        self._lock = threading.Lock()
+
+    def adjust_total(self, delta: int) -> None:
+        """实际条目数与预估不同（如文档数变化、单元被推迟）时修正总数"""
+        with self._lock:
+            self.total = max(self.done, self.total + delta)
+
+    def advance(self, items: int = 1, nbytes: int = 0) -> str | None:
+        """记录完成的条目与字节数，达到输出间隔时返回进度文本"""
+        with self._lock:
+            self.done += items
+            self.bytes_done += nbytes
+            now = time.monotonic()
+            # 全部完成时由工具的摘要收尾，不再单独输出
+            if self.done >= self.total:
+                return None
+            every_items = self.every_items or max(
+                1, math.ceil(self.total / self.DEFAULT_STEPS)
+            )
+            if (
+                self.done - self._last_report_done < every_items
+                and now - self._last_report_at < self.every_seconds
+            ):
+                return None
+            self._last_report_at = now
+            self._last_report_done = self.done
+            self._heartbeat = None
+            return self._format(now)
+
+    def tick(self, activity: int = 0) -> None:
+        """长时间运行的条目每处理一批调用一次（可在工作线程中调用）
+
+        记录进行中的处理量；距上次输出超过 every_seconds 时生成心跳进度文本，
+        由 heartbeat() 取出。
+        """
+        with self._lock:
+            self.activity += activity
+            now = time.monotonic()
+            if now - self._last_report_at < self.every_seconds:
+                return
+            self._last_report_at = now
+            self._heartbeat = self._format(now)
+            if self.activity:
+                self._heartbeat += (
+                    f" | 进行中，已处理 {self.activity} {self.activity_unit}"
+                )
+
+    def heartbeat(self) -> str | None:
+        """取出 tick() 生成的心跳进度文本（在产出消息的线程中调用）
+
+        调用时先 tick() 一次，没有条目内部循环调用 tick() 时（如单个大文件下载）
+        也按时间间隔输出。
+        """
+        self.tick()
+        with self._lock:
+            text, self._heartbeat = self._heartbeat, None
+            return text
+
+    def _format(self, now: float) -> str:
+        elapsed = max(now - self.started_at, 1e-6)
+        rate = self.done / elapsed
+        percent = self.done * 100 // self.total if self.total else 100
+        text = f"⏳ 进度: {self.done}/{self.total} {self.unit}（{percent}%）"
+        if self.bytes_done:
+            text += (
+                f" | 已传输 {format_bytes(self.bytes_done)}"
+                f" | {rate:.2f} {self.unit}/s，{format_bytes(self.bytes_done / elapsed)}/s"
+            )
+        else:
+            text += f" | {rate:.2f} {self.unit}/s"
+        if rate > 0:
+            text += f" | 预计剩余 {format_duration((self.total - self.done) / rate)}"
+        return text
+
+
+def format_bytes(nbytes: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.2f} GB"
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
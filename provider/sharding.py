@@ -0,0 +1,169 @@
+import hashlib
+from collections.abc import Callable, Iterable
+from typing import TypeVar
+
+T = TypeVar("T")
+
+# 各批量导出工具的清单类型，合并时据此选择合并规则
+SHARDED_TOOLS = ("export_all_apps", "export_all_annotations", "export_datasets")
+
+
+class Shard:
+    """
+    批量导出的一个分片：按 ID 的稳定哈希把应用 / 知识库划分为 count 份，
+    第 index 份（从 0 开始）由本次调用导出
+
+    哈希只取决于 ID，不同节点、不同进程对同一 ID 得到相同的分片。
+    """
+
+    def __init__(self, index: int, count: int):
+        self.index = index
+        self.count = count
+
+    @classmethod
+    def from_parameters(cls, index, count) -> "Shard | None":
+        """解析 shard_index / shard_count 参数，未分片时返回 None
+
+        Raises:
+            ValueError: 参数不是整数或超出范围
+        """
+        if index in (None, "") and count in (None, ""):
+            return None
+        try:
+            index = int(index or 0)
+            count = int(count or 1)
+        except (TypeError, ValueError) as e:
+            raise ValueError("shard_index and shard_count must be integers") from e
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(
+                f"shard_index must be between 0 and shard_count - 1, got {index}/{count}"
+            )
+        return cls(index, count) if count > 1 else None
+
+    @staticmethod
+    def of(item_id: str, count: int) -> int:
+        """ID 所属的分片序号"""
+        digest = hashlib.sha1(str(item_id).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % count
+
+    def owns(self, item_id: str) -> bool:
+        return self.of(item_id, self.count) == self.index
+
+    def select(self, items: Iterable[T], key: Callable[[T], str]) -> list[T]:
+        """保留属于本分片的元素（保持原顺序）"""
+        return [item for item in items if self.owns(key(item))]
+
+    def label(self, tool: str) -> str:
+        """清单与快照文件名中使用的标识，多个分片写入同一前缀时不会互相覆盖"""
+        return f"{tool}-shard-{self.index}-of-{self.count}"
+
+    def describe(self, tool: str) -> dict:
+        return {"tool": tool, "index": self.index, "count": self.count}
+
+    def to_params(self) -> dict:
+        """写入续传令牌的参数"""
+        return {"shard_index": self.index, "shard_count": self.count}
+
+
+def merge_shard_manifests(manifests: list[dict]) -> dict:
+    """合并同一次分片导出的各分片清单
+
+    同一分片的多份清单（续传调用）一并合并；按 ID 去重，后出现的条目覆盖前面的。
+    dedup 模式的快照需读取存储才能合并，各分片的 snapshot_key 记在 shard_snapshot_keys 中，
+    由调用方合并后写回 snapshot_key。
+
+    Raises:
+        ValueError: 清单不是分片清单、来自不同工具 / 分片数 / 存储位置，
+            或 dedup 模式的清单缺少存储信息
+    """
+    if not manifests:
+        raise ValueError("No manifests to merge")
+
+    shards = []
+    for manifest in manifests:
+        shard = manifest.get("shard") if isinstance(manifest, dict) else None
+        if not isinstance(shard, dict) or shard.get("tool") not in SHARDED_TOOLS:
+            raise ValueError("Only manifests of sharded exports can be merged")
+        shards.append(shard)
+
+    tool = shards[0]["tool"]
+    count = shards[0]["count"]
+    if any(s["tool"] != tool or s["count"] != count for s in shards):
+        raise ValueError("Manifests come from different tools or shard counts")
+    sinks = {_sink_identity(m.get("sink")) for m in manifests}
+    if len(sinks) > 1:
+        raise ValueError(
+            "Shards were written to different storage locations; use the same sink and sink_prefix on every shard"
+        )
+
+    # 同一分片只要有一份清单完整（续传链的最后一次调用），该分片即完成
+    completed = {
+        s["index"] for s, m in zip(shards, manifests) if m.get("complete", True)
+    }
+    present = {s["index"] for s in shards}
+    merged = {
+        "complete": len(completed) == count,
+        "shards": {"tool": tool, "count": count, "merged": sorted(present)},
+        "missing_shards": sorted(set(range(count)) - present),
+        "incomplete_shards": sorted(present - completed),
+    }
+
+    if tool == "export_datasets":
+        datasets = _merge_by_id(manifests, "datasets", "dataset_id")
+        exported = [d for d in datasets if d.get("status") == "exported"]
+        merged["total_datasets"] = len(datasets)
+        merged["total_files"] = sum(d.get("exported_file_count", 0) for d in exported)
+        merged["datasets"] = datasets
+        merged["deferred_dataset_ids"] = _remaining_deferred(
+            manifests, "deferred_dataset_ids", {d.get("dataset_id") for d in datasets}
+        )
+    else:
+        exported_apps = _merge_by_id(manifests, "exported_apps", "id")
+        merged["exported_apps"] = exported_apps
+        merged["name_index"] = {
+            name: owner
+            for manifest in manifests
+            for name, owner in (manifest.get("name_index") or {}).items()
+        }
+        merged["failed_apps"] = [
+            failure
+            for manifest in manifests
+            for failure in manifest.get("failed_apps") or []
+        ]
+        if tool == "export_all_apps":
+            merged["deferred_app_ids"] = _remaining_deferred(
+                manifests, "deferred_app_ids", {app.get("id") for app in exported_apps}
+            )
+
+    snapshot_keys = [m["snapshot_key"] for m in manifests if m.get("snapshot_key")]
+    if snapshot_keys:
+        if not manifests[0].get("sink"):
+            raise ValueError("dedup manifests require a storage sink")
+        merged["shard_snapshot_keys"] = snapshot_keys
+    if manifests[0].get("sink"):
+        merged["sink"] = manifests[0]["sink"]
+    return merged
+
+
+def _merge_by_id(manifests: list[dict], field: str, id_field: str) -> list[dict]:
+    merged: dict = {}
+    for manifest in manifests:
+        for item in manifest.get(field) or []:
+            merged[item.get(id_field)] = item
+    return list(merged.values())
+
+
+def _remaining_deferred(manifests: list[dict], field: str, done: set) -> list:
+    """推迟的 ID 中去掉后续续传调用已处理的部分"""
+    deferred = []
+    for manifest in manifests:
+        for item_id in manifest.get(field) or []:
+            if item_id not in done and item_id not in deferred:
+                deferred.append(item_id)
+    return deferred
+
+
+def _sink_identity(info: dict | None) -> tuple:
+    if not info:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in info.items()))
@@ -0,0 +1,539 @@
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from collections.abc import Generator
+from datetime import datetime, timezone
+from typing import BinaryIO
+from urllib.parse import quote, urlparse
+
+import requests
+
+from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.concurrency import iter_concurrent
+from provider.memory import MemoryBudget, Reservation
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+# 工具参数 sink 的取值
+SINK_MESSAGE = "message"
+SINK_LOCAL = "local"
+SINK_S3 = "s3"
+
+
+class ArtifactSink(ABC):
+    """
+    导出产物的存储目标
+
+    默认（sink=message）产物经插件消息通道返回，不创建 sink；
+    指定 local / s3 时产物直接写入存储，工具只返回清单与对象键。
+    子类需实现全部抽象方法，缺少实现时在创建 sink 时即报错。
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix.strip("/")
+
+    def key_for(self, *parts: str) -> str:
+        """拼接对象键：<prefix>/<parts...>"""
+        return "/".join(p.strip("/") for p in (self.prefix, *parts) if p)
+
+    @abstractmethod
+    def put(
+        self,
+        key: str,
+        fileobj: BinaryIO,
+        size: int,
+        content_type: str = "application/octet-stream",
+    ) -> str:
+        """写入 size 字节的文件对象，返回对象的位置（路径或 s3:// URI）"""
+
+    def put_bytes(
+        self, key: str, data: bytes, content_type: str = "application/octet-stream"
+    ) -> str:
+        return self.put(key, io.BytesIO(data), len(data), content_type)
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        """读取对象内容（恢复类工具读取导出结果时使用）"""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """以流的方式读取对象，大文件不必整体读入内存（校验工具使用）"""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        """对象是否已存在（去重存储据此跳过已写入的分块）"""
+
+    @abstractmethod
+    def describe(self) -> dict:
+        """清单中记录的存储目标信息（不含密钥）"""
+
+    @abstractmethod
+    def location_text(self) -> str:
+        """摘要中展示的输出位置"""
+
+
+class LocalSink(ArtifactSink):
+    """写入插件运行环境本地目录（或挂载的共享卷）"""
+
+    def __init__(self, directory: str, prefix: str):
+        super().__init__(prefix)
+        self.directory = os.path.abspath(directory)
+
+    def put(
+        self,
+        key: str,
+        fileobj: BinaryIO,
+        size: int,
+        content_type: str = "application/octet-stream",
+    ) -> str:
+        path = os.path.abspath(os.path.join(self.directory, key))
+        if os.path.commonpath([self.directory, path]) != self.directory:
+            raise ValueError(f"Object key escapes sink directory: {key}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，中断时不会留下半个文件
+        tmp_path = f"{path}.part"
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(fileobj, f, length=1024 * 1024)
+        os.replace(tmp_path, path)
+        logger.info(f"已写入本地文件: {path} ({size} bytes)")
+        return path
+
+    def get(self, key: str) -> bytes:
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.directory, key))
+        if os.path.commonpath([self.directory, path]) != self.directory:
+            raise ValueError(f"Object key escapes sink directory: {key}")
+        return path
+
+    def describe(self) -> dict:
+        return {"type": SINK_LOCAL, "directory": self.directory, "prefix": self.prefix}
+
+    def location_text(self) -> str:
+        return os.path.join(self.directory, self.prefix)
+
+
+class S3RequestError(Exception):
+    """S3 请求返回了错误状态码"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class S3Sink(ArtifactSink):
+    """
+    S3 兼容对象存储（AWS S3、MinIO 等），path-style 寻址，SigV4 签名
+
+    - 小于 part_size 的对象单次 PUT
+    - 更大的对象走分片上传：分片从文件对象按需读取，并发上传，
+      每个分片读入前从 MemoryBudget 预留内存
+    - 分片上传遇到网络错误或 429/5xx 时按指数退避重试（同一分片号重传是幂等的），
+      重试耗尽后中止整个分片上传
+    """
+
+    # S3 要求除最后一片外每片至少 5 MiB
+    DEFAULT_PART_SIZE = 8 * 1024 * 1024
+    DEFAULT_MAX_WORKERS = 4
+    DEFAULT_TIMEOUT = 300
+
+    MAX_PART_RETRIES = 3
+    RETRY_BACKOFF = 1.0
+
+    def __init__(
+        self,
+        endpoint_url: str,
+        bucket: str,
+        access_key_id: str,
+        secret_access_key: str,
+        prefix: str,
+        region: str = "us-east-1",
+        part_size: int = DEFAULT_PART_SIZE,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        super().__init__(prefix)
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.region = region or "us-east-1"
+        self.part_size = part_size
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def describe(self) -> dict:
+        return {
+            "type": SINK_S3,
+            "endpoint_url": self.endpoint_url,
+            "bucket": self.bucket,
+            "prefix": self.prefix,
+        }
+
+    def location_text(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}"
+
+    def put(
+        self,
+        key: str,
+        fileobj: BinaryIO,
+        size: int,
+        content_type: str = "application/octet-stream",
+    ) -> str:
+        if size <= self.part_size:
+            self._request(
+                "PUT",
+                key,
+                data=fileobj.read(),
+                headers={"Content-Type": content_type},
+            )
+        else:
+            self._multipart_upload(key, fileobj, size, content_type)
+        logger.info(f"已上传对象: s3://{self.bucket}/{key} ({size} bytes)")
+        return f"s3://{self.bucket}/{key}"
+
+    def get(self, key: str) -> bytes:
+        return self._request("GET", key).content
+
+    def open(self, key: str) -> BinaryIO:
+        response = self._request("GET", key, stream=True)
+        response.raw.decode_content = True
+        return response.raw
+
+    def exists(self, key: str) -> bool:
+        return self._request("HEAD", key, allowed_statuses=(404,)).status_code != 404
+
+    def _multipart_upload(
+        self, key: str, fileobj: BinaryIO, size: int, content_type: str
+    ) -> None:
+        response = self._request(
+            "POST", key, query={"uploads": ""}, headers={"Content-Type": content_type}
+        )
+        upload_id = _xml_find(response.content, "UploadId")
+        if not upload_id:
+            raise Exception(f"CreateMultipartUpload returned no UploadId for {key}")
+
+        memory = MemoryBudget.shared()
+
+        def iter_parts() -> Generator[tuple[int, bytes, Reservation], None, None]:
+            # 在提交任务时才读取分片，同时在途的分片数受 iter_concurrent 限制
+            part_number = 1
+            while True:
+                reservation = memory.reserve(min(self.part_size, size))
+                data = fileobj.read(self.part_size)
+                if not data:
+                    reservation.release()
+                    return
+                yield part_number, data, reservation
+                part_number += 1
+
+        def upload_part(part: tuple[int, bytes, Reservation]) -> str:
+            part_number, data, reservation = part
+            with reservation:
+                return self._upload_part(key, upload_id, part_number, data)
+
+        etags: dict[int, str] = {}
+        try:
+            for part, etag, error in iter_concurrent(
+                upload_part, iter_parts(), self.max_workers
+            ):
+                if error is not None:
+                    raise error
+                etags[part[0]] = etag
+
+            body = "<CompleteMultipartUpload>"
+            for part_number in sorted(etags):
+                body += (
+                    f"<Part><PartNumber>{part_number}</PartNumber>"
+                    f"<ETag>{etags[part_number]}</ETag></Part>"
+                )
+            body += "</CompleteMultipartUpload>"
+            response = self._request(
+                "POST",
+                key,
+                query={"uploadId": upload_id},
+                data=body.encode("utf-8"),
+                headers={"Content-Type": "application/xml"},
+            )
+            # CompleteMultipartUpload 可能返回 200 但响应体是错误
+            if b"<Error>" in response.content:
+                raise Exception(
+                    f"CompleteMultipartUpload failed: {_xml_find(response.content, 'Message')}"
+                )
+        except Exception:
+            try:
+                self._request("DELETE", key, query={"uploadId": upload_id})
+            except Exception as abort_error:
+                logger.warning(f"AbortMultipartUpload 失败: {abort_error}")
+            raise
+
+        logger.info(f"分片上传完成: {key}（{len(etags)} 个分片）")
+
+    def _upload_part(
+        self, key: str, upload_id: str, part_number: int, data: bytes
+    ) -> str:
+        """上传一个分片并返回其 ETag，可重试的错误按指数退避重试"""
+        attempt = 0
+        while True:
+            try:
+                response = self._request(
+                    "PUT",
+                    key,
+                    query={"partNumber": str(part_number), "uploadId": upload_id},
+                    data=data,
+                )
+                return response.headers.get("ETag", "")
+            except (requests.ConnectionError, requests.Timeout, S3RequestError) as e:
+                if isinstance(e, S3RequestError) and not (
+                    e.status_code == 429 or e.status_code >= 500
+                ):
+                    raise
+                attempt += 1
+                if attempt > self.MAX_PART_RETRIES:
+                    raise
+                delay = self.RETRY_BACKOFF * 2 ** (attempt - 1)
+                logger.warning(
+                    f"分片 {part_number} 上传失败，{delay:.0f}s 后重试 "
+                    f"({attempt}/{self.MAX_PART_RETRIES}): {e}"
+                )
+                time.sleep(delay)
+
+    def _request(
+        self,
+        method: str,
+        key: str,
+        query: dict[str, str] | None = None,
+        data: bytes = b"",
+        headers: dict[str, str] | None = None,
+        allowed_statuses: tuple[int, ...] = (),
+        stream: bool = False,
+    ) -> requests.Response:
+        path = f"/{self.bucket}/{key}"
+        signed_headers = self._sign(
+            method,
+            path,
+            query or {},
+            headers or {},
+            hashlib.sha256(data).hexdigest(),
+        )
+        url = f"{self.endpoint_url}{_uri_encode(path, safe='/')}"
+        canonical_query = _canonical_query(query or {})
+        if canonical_query:
+            url += f"?{canonical_query}"
+
+        response = self.session.request(
+            method,
+            url,
+            data=data,
+            headers=signed_headers,
+            timeout=self.DEFAULT_TIMEOUT,
+            stream=stream,
+        )
+        if response.status_code >= 300 and response.status_code not in allowed_statuses:
+            raise S3RequestError(
+                f"S3 {method} {key} failed: {response.status_code} "
+                f"{_xml_find(response.content, 'Code') or response.text[:200]}",
+                response.status_code,
+            )
+        return response
+
+    def _sign(
+        self,
+        method: str,
+        path: str,
+        query: dict[str, str],
+        headers: dict[str, str],
+        payload_hash: str,
+        now: datetime | None = None,
+    ) -> dict[str, str]:
+        """按 AWS Signature Version 4 签名，返回需要发送的请求头"""
+        now = now or datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+
+        headers = {
+            **headers,
+            "Host": urlparse(self.endpoint_url).netloc,
+            "x-amz-date": amz_date,
+            "x-amz-content-sha256": payload_hash,
+        }
+        lowered = {name.lower(): str(value).strip() for name, value in headers.items()}
+        signed_header_names = ";".join(sorted(lowered))
+        canonical_request = "\n".join(
+            [
+                method,
+                _uri_encode(path, safe="/"),
+                _canonical_query(query),
+                "".join(f"{name}:{lowered[name]}\n" for name in sorted(lowered)),
+                signed_header_names,
+                payload_hash,
+            ]
+        )
+
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                amz_date,
+                scope,
+                hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+            ]
+        )
+
+        signing_key = ("AWS4" + self.secret_access_key).encode("utf-8")
+        for part in (date_stamp, self.region, "s3", "aws4_request"):
+            signing_key = _hmac(signing_key, part)
+        signature = hmac.new(
+            signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+
+        headers["Authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key_id}/{scope}, "
+            f"SignedHeaders={signed_header_names}, Signature={signature}"
+        )
+        return headers
+
+
+def put_manifest(sink: ArtifactSink, tool: str, manifest: dict) -> str:
+    """把工具的结构化清单写入存储，返回对象键
+
+    文件名带时间戳，续传调用各自写入一份，不会覆盖前一次的清单。
+    """
+    manifest_key = sink.key_for(
+        f"manifest-{tool}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    sink.put_bytes(
+        manifest_key,
+        json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8"),
+        "application/json",
+    )
+    return manifest_key
+
+
+def sink_from_manifest(info: dict, credentials: dict) -> ArtifactSink:
+    """按清单中记录的存储信息（describe() 的结果）重建 sink，用于读取导出结果
+
+    清单可能由用户上传，只采用其中的存储类型与前缀：本地目录、S3 端点与存储桶
+    一律取自提供方凭证，清单中的记录与凭证不一致时拒绝，避免读写任意目录或
+    携带凭证签名请求其他主机。
+
+    Raises:
+        ValueError: 清单中的存储类型未知、与当前配置不一致或缺少必需配置
+    """
+    sink_type = info.get("type")
+    if sink_type not in (SINK_LOCAL, SINK_S3):
+        raise ValueError(f"Unknown sink in manifest: {sink_type}")
+    sink = create_sink(sink_type, credentials, info.get("prefix") or "")
+    configured = sink.describe()
+    fields = ("directory",) if sink_type == SINK_LOCAL else ("endpoint_url", "bucket")
+    for field in fields:
+        recorded = info.get(field)
+        if recorded and _normalize_location(field, recorded) != _normalize_location(
+            field, configured[field]
+        ):
+            raise ValueError(
+                f"Manifest sink {field} {recorded!r} does not match the configured "
+                f"{sink_type} sink"
+            )
+    return sink
+
+
+def _normalize_location(field: str, value: str) -> str:
+    if field == "directory":
+        return os.path.abspath(value)
+    return value.rstrip("/")
+
+
+def create_sink(
+    sink_type: str | None, credentials: dict, prefix: str | None
+) -> ArtifactSink | None:
+    """按工具参数与凭证创建存储目标，sink_type 为 message（默认）时返回 None
+
+    Raises:
+        ValueError: 未知的 sink 类型或缺少必需配置
+    """
+    sink_type = (sink_type or SINK_MESSAGE).strip().lower()
+    if sink_type == SINK_MESSAGE:
+        return None
+
+    prefix = (prefix or "").strip() or time.strftime("dify-backup/%Y%m%d-%H%M%S")
+
+    if sink_type == SINK_LOCAL:
+        directory = credentials.get("local_sink_dir") or os.environ.get(
+            "DIFY_BACKUP_LOCAL_SINK_DIR"
+        )
+        if not directory:
+            raise ValueError(
+                "sink=local requires local_sink_dir in provider credentials "
+                "or DIFY_BACKUP_LOCAL_SINK_DIR"
+            )
+        return LocalSink(directory, prefix)
+
+    if sink_type == SINK_S3:
+        required = (
+            "s3_endpoint_url",
+            "s3_bucket",
+            "s3_access_key_id",
+            "s3_secret_access_key",
+        )
+        missing = [name for name in required if not credentials.get(name)]
+        if missing:
+            raise ValueError(
+                f"sink=s3 requires provider credentials: {', '.join(missing)}"
+            )
+        return S3Sink(
+            credentials["s3_endpoint_url"],
+            credentials["s3_bucket"],
+            credentials["s3_access_key_id"],
+            credentials["s3_secret_access_key"],
+            prefix,
+            region=credentials.get("s3_region") or "us-east-1",
+        )
+
+    raise ValueError(f"Unknown sink: {sink_type}")
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _uri_encode(value: str, safe: str = "") -> str:
+    return quote(value, safe=safe + "-_.~")
+
+
+def _canonical_query(query: dict[str, str]) -> str:
+    return "&".join(
+        f"{_uri_encode(name)}={_uri_encode(value)}"
+        for name, value in sorted(query.items())
+    )
+
+
+def _xml_find(content: bytes, tag: str) -> str | None:
+    """在 S3 XML 响应中查找第一个 tag 节点的文本（忽略命名空间）"""
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError:
+        return None
+    for element in root.iter():
+        if element.tag.rsplit("}", 1)[-1] == tag:
+            return element.text
+    return None
@@ -0,0 +1,432 @@
+import base64
+import hashlib
+import logging
+import re
+import threading
+import time
+import zlib
+from collections.abc import Callable
+from urllib.parse import urlparse
+
+import requests
+
+from dify_plugin.config.logger_format import plugin_logger_handler
+
+from provider.concurrency import iter_concurrent
+from provider.memory import MemoryBudget, Reservation, SpooledBuffer
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+# send(session, headers) -> Response：由调用方发送 GET 请求（stream=True），
+# 便于经过调用方的限流器
+Sender = Callable[[requests.Session, dict], requests.Response]
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+# 单段上传的 S3 / OSS 等对象的 ETag 通常即内容的 MD5，但 SSE-KMS 加密等情况下
+# 同样形如 32 位十六进制却不是 MD5，只能作为参考
+_MD5_ETAG = re.compile(r'^"?([0-9a-fA-F]{32})"?$')
+
+
+class _Crc32:
+    """与 hashlib 对象接口一致的增量 CRC32"""
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data) -> None:
+        self.value = zlib.crc32(data, self.value)
+
+    def digest(self) -> bytes:
+        return self.value.to_bytes(4, "big")
+
+
+# 完整响应携带的内容摘要头（值为 base64 编码的摘要）→ 增量摘要对象的构造函数
+_CHECKSUM_HEADERS = {
+    "Content-MD5": lambda: hashlib.md5(usedforsecurity=False),
+    "x-amz-checksum-sha256": hashlib.sha256,
+    "x-amz-checksum-sha1": lambda: hashlib.sha1(usedforsecurity=False),
+    "x-amz-checksum-crc32": _Crc32,
+}
+
+_RETRYABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class StorageDownloadError(Exception):
+    """签名链接下载失败
+
+    status_code 不为空时表示服务端直接返回了错误状态码（链接失效、无权限等），
+    为空时表示重试耗尽或内容校验失败。
+    """
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class _Incomplete(Exception):
+    """响应体提前结束或服务端返回可重试的状态码"""
+
+
+class StorageDownloader:
+    """
+    对象存储签名链接下载器
+
+    - 按主机复用连接池，避免每个文档都重新建立 TLS 连接
+    - 连接中断时用 HTTP Range 从已收到的位置续传，并以 ETag 确认对象未变化
+    - 大文件拆成多个区间并行下载
+    - 内容写入 SpooledBuffer：不超过 SPOOL_BYTES 且内存预算允许时留在内存中，否则落盘
+    - 下载完成后按 Content-Length 校验长度，按 Content-MD5 / x-amz-checksum-* 校验内容；
+      ETag 形如 MD5 但不一致时只记录警告
+    """
+
+    # 首个请求与后续每个区间的字节数
+    SEGMENT_SIZE = 32 * 1024 * 1024
+    # 超过该大小的文件并行下载剩余区间
+    PARALLEL_THRESHOLD = 64 * 1024 * 1024
+    PARALLEL_SEGMENTS = 4
+
+    # 连续无进展的重试次数上限；每次重试前按指数退避等待
+    MAX_RETRIES = 5
+    RETRY_BACKOFF = 1.0
+
+    READ_CHUNK_SIZE = 1024 * 1024
+
+    # 单个文件在内存中缓冲的上限，超出后落盘
+    SPOOL_BYTES = 16 * 1024 * 1024
+
+    _shared: "StorageDownloader | None" = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, pool_maxsize: int = 16):
+        self.pool_maxsize = pool_maxsize
+        self._sessions: dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> "StorageDownloader":
+        """进程内共享的下载器，同一存储主机的连接在所有工具间复用"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def session_for(self, url: str) -> requests.Session:
+        """返回目标主机的连接池会话（不携带 console 鉴权头）"""
+        parsed = urlparse(url)
+        host = f"{parsed.scheme}://{parsed.netloc}"
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_maxsize
+                )
+                session.mount(host, adapter)
+                self._sessions[host] = session
+            return session
+
+    def download(
+        self,
+        url: str,
+        send: Sender,
+        reservation: Reservation | None = None,
+        session: requests.Session | None = None,
+    ) -> tuple[SpooledBuffer, str]:
+        """下载整个文件，返回 (内容, Content-Type)，内容读取位置在开头，由调用方关闭
+
+        首个请求即带 Range：服务端支持区间时据 Content-Range 得到总大小，
+        剩余部分按区间下载；不支持时按普通响应读取，中断后从头重试。
+
+        Args:
+            send: 发送请求的回调，传入会话与额外请求头
+            reservation: 内容留在内存中时占用的预留（专用于本次下载），默认向共享预算申请
+            session: 指定会话（如同域链接需携带鉴权头），默认使用主机连接池
+
+        Raises:
+            StorageDownloadError: 状态码错误、重试耗尽或校验失败
+        """
+        session = session or self.session_for(url)
+        reservation = reservation or MemoryBudget.shared().reserve()
+        response = self._open(send, session, 0, self.SEGMENT_SIZE - 1)
+        if response.status_code == 416:
+            # 空文件不存在可满足的区间
+            response.close()
+            response = self._open(send, session)
+        if response.status_code not in (200, 206):
+            response.close()
+            raise StorageDownloadError(
+                f"Download failed: {response.status_code}", response.status_code
+            )
+
+        content_range = _CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+        if response.status_code == 206 and (
+            not content_range
+            or content_range.group(3) == "*"
+            or int(content_range.group(1)) != 0
+        ):
+            # 无法据 Content-Range 确定总大小时退回完整下载
+            response.close()
+            response = self._open(send, session)
+            if response.status_code != 200:
+                response.close()
+                raise StorageDownloadError(
+                    f"Download failed: {response.status_code}", response.status_code
+                )
+
+        content_type = response.headers.get("Content-Type", "application/octet-stream")
+        etag = response.headers.get("ETag")
+        # 区间响应的摘要头不一定对应完整对象，只校验完整响应的
+        checksums = {}
+        if response.status_code == 200:
+            checksums = {
+                name: response.headers[name]
+                for name in _CHECKSUM_HEADERS
+                if name in response.headers
+            }
+        if response.status_code == 206:
+            size = int(content_range.group(3))
+            body = self._download_ranges(
+                send, session, response, size, etag, reservation
+            )
+        else:
+            content_length = response.headers.get("Content-Length", "")
+            size = int(content_length) if content_length.isdigit() else None
+            body = self._download_whole(send, session, response, size, reservation)
+
+        try:
+            self._verify(body, size, etag, checksums)
+        except Exception:
+            body.close()
+            raise
+        body.seek(0)
+        return body, content_type
+
+    def _open(
+        self,
+        send: Sender,
+        session: requests.Session,
+        start: int | None = None,
+        end: int | None = None,
+        etag: str | None = None,
+    ) -> requests.Response:
+        """发送请求（可带区间），网络错误与 429 / 5xx 时退避重试"""
+        # 按字节区间续传与长度校验要求响应体不经压缩
+        headers = {"Accept-Encoding": "identity"}
+        if start is not None:
+            headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+            if etag and not etag.startswith("W/"):
+                # 对象已变化时服务端返回完整内容（200），而不是新对象的区间
+                headers["If-Range"] = etag
+        attempt = 0
+        while True:
+            try:
+                response = send(session, headers)
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                response.close()
+                raise _Incomplete(f"status {response.status_code}")
+            except (_Incomplete, *_RETRYABLE_ERRORS) as e:
+                attempt = self._backoff(attempt, e)
+
+    def _backoff(self, attempt: int, error: Exception) -> int:
+        """等待后返回新的重试次数；超过上限时抛出 StorageDownloadError"""
+        attempt += 1
+        if attempt > self.MAX_RETRIES:
+            raise StorageDownloadError(
+                f"Download failed after {self.MAX_RETRIES} retries: {error}"
+            ) from error
+        delay = self.RETRY_BACKOFF * 2 ** (attempt - 1)
+        logger.warning(
+            f"下载中断，{delay:.0f}s 后重试 ({attempt}/{self.MAX_RETRIES}): {error}"
+        )
+        time.sleep(delay)
+        return attempt
+
+    def _download_ranges(
+        self,
+        send: Sender,
+        session: requests.Session,
+        first: requests.Response,
+        size: int,
+        etag: str | None,
+        reservation: Reservation,
+    ) -> SpooledBuffer:
+        """服务端支持区间请求：按总大小预先分配缓冲，按区间填充"""
+        body = SpooledBuffer(reservation, self.SPOOL_BYTES)
+        try:
+            body.allocate(size)
+            first_end = min(self.SEGMENT_SIZE, size) - 1
+            if first_end >= 0:
+                self._fetch_range(send, session, body, 0, first_end, etag, first)
+            else:
+                first.close()
+
+            segments = [
+                (start, min(start + self.SEGMENT_SIZE, size) - 1)
+                for start in range(first_end + 1, size, self.SEGMENT_SIZE)
+            ]
+            workers = self.PARALLEL_SEGMENTS if size >= self.PARALLEL_THRESHOLD else 1
+            for _, _, error in iter_concurrent(
+                lambda segment: self._fetch_range(send, session, body, *segment, etag),
+                segments,
+                workers,
+            ):
+                if error is not None:
+                    raise error
+        except BaseException:
+            body.close()
+            raise
+        return body
+
+    def _fetch_range(
+        self,
+        send: Sender,
+        session: requests.Session,
+        body: SpooledBuffer,
+        start: int,
+        end: int,
+        etag: str | None,
+        response: requests.Response | None = None,
+    ) -> None:
+        """下载 [start, end] 区间写入 body 的对应位置，中断时从已收到的位置续传
+
+        Args:
+            response: 已发出的该区间请求的响应，为空时新发请求
+        """
+        pos = start
+        attempt = 0
+        while pos <= end:
+            if response is None:
+                response = self._open(send, session, pos, end, etag)
+            received = pos
+            try:
+                if response.status_code != 206:
+                    raise StorageDownloadError(
+                        f"Object changed or range not honored: {response.status_code}"
+                    )
+                content_range = _CONTENT_RANGE.match(
+                    response.headers.get("Content-Range", "")
+                )
+                if not content_range or int(content_range.group(1)) != pos:
+                    raise StorageDownloadError(
+                        f"Unexpected Content-Range: {response.headers.get('Content-Range')}"
+                    )
+                if etag and response.headers.get("ETag") not in (None, etag):
+                    raise StorageDownloadError("Object changed during download")
+                pos = self._read_into(response, body, pos, end)
+            except _RETRYABLE_ERRORS as e:
+                pos = getattr(e, "position", pos)
+                error = e
+            else:
+                if pos > end:
+                    return
+                error = _Incomplete(f"{end + 1 - pos} bytes missing")
+            finally:
+                response.close()
+            response = None
+            # 有进展时重新计数，只有连续失败才会耗尽重试次数
+            attempt = self._backoff(0 if pos > received else attempt, error)
+
+    def _read_into(
+        self, response: requests.Response, body: SpooledBuffer, pos: int, end: int
+    ) -> int:
+        """把响应体写入 body 的 [pos, end] 区间，返回下一个待写入的位置
+
+        网络错误时把已写入的位置记在异常的 position 属性上。
+        """
+        try:
+            for chunk in response.iter_content(self.READ_CHUNK_SIZE):
+                length = min(len(chunk), end + 1 - pos)
+                body.write_at(pos, chunk[:length])
+                pos += length
+                if pos > end:
+                    break
+        except _RETRYABLE_ERRORS as e:
+            e.position = pos  # type: ignore[attr-defined]
+            raise
+        return pos
+
+    def _download_whole(
+        self,
+        send: Sender,
+        session: requests.Session,
+        response: requests.Response,
+        size: int | None,
+        reservation: Reservation,
+    ) -> SpooledBuffer:
+        """服务端不支持区间请求：读取完整响应，中断后重新下载"""
+        attempt = 0
+        while True:
+            body = SpooledBuffer(reservation, self.SPOOL_BYTES)
+            if size is not None and size > self.SPOOL_BYTES:
+                body.rollover()
+            try:
+                for chunk in response.iter_content(self.READ_CHUNK_SIZE):
+                    body.write(chunk)
+                if size is None or body.size >= size:
+                    return body
+                error = _Incomplete(f"{size - body.size} bytes missing")
+            except _RETRYABLE_ERRORS as e:
+                error = e
+            except BaseException:
+                body.close()
+                raise
+            finally:
+                response.close()
+            body.close()
+            attempt = self._backoff(attempt, error)
+            response = self._open(send, session)
+            if response.status_code != 200:
+                response.close()
+                raise StorageDownloadError(
+                    f"Download failed: {response.status_code}", response.status_code
+                )
+
+    def _verify(
+        self,
+        body: SpooledBuffer,
+        size: int | None,
+        etag: str | None,
+        checksums: dict[str, str] | None = None,
+    ) -> None:
+        """按 Content-Length 校验长度，按摘要头校验内容（从头逐块读取 body 计算摘要）
+
+        ETag 不保证是 MD5，不一致时只记录警告，视为未校验。
+        """
+        if size is not None and body.size != size:
+            raise StorageDownloadError(
+                f"Size mismatch: expected {size} bytes, got {body.size}"
+            )
+        checksums = checksums or {}
+        hashers = {name: _CHECKSUM_HEADERS[name]() for name in checksums}
+        match = _MD5_ETAG.match(etag or "")
+        etag_md5 = (
+            hashlib.md5(usedforsecurity=False) if match and not checksums else None
+        )
+        if not hashers and etag_md5 is None:
+            return
+        body.seek(0)
+        while chunk := body.read(self.READ_CHUNK_SIZE):
+            for hasher in hashers.values():
+                hasher.update(chunk)
+            if etag_md5 is not None:
+                etag_md5.update(chunk)
+        for name, expected in checksums.items():
+            actual = base64.b64encode(hashers[name].digest()).decode("ascii")
+            if actual != expected.strip():
+                raise StorageDownloadError(
+                    f"{name} mismatch: expected {expected}, got {actual}"
+                )
+        if etag_md5 is not None:
+            digest = etag_md5.hexdigest()
+            if digest != match.group(1).lower():
+                logger.warning(
+                    f"ETag {etag} 与内容 MD5 {digest} 不一致，可能不是 MD5 形式的 ETag，内容未校验"
+                )
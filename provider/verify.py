@@ -0,0 +1,85 @@
+import csv
+import hashlib
+import io
+import zipfile
+from collections.abc import Callable
+from typing import BinaryIO
+
+import yaml
+
+# 流式哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class HashingReader:
+    """
+    包装只读文件对象，读取的同时累计 SHA-256 与字节数
+
+    导出时包在产物文件外，写入存储（或分块返回）的同时得到摘要，无需再读一遍。
+    """
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self._hash.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def hash_stream(fileobj: BinaryIO) -> tuple[str, int]:
+    """读完文件对象，返回 (sha256, 字节数)"""
+    reader = HashingReader(fileobj)
+    while reader.read(HASH_CHUNK_SIZE):
+        pass
+    return reader.hexdigest(), reader.size
+
+
+def hash_zip_member(opener: Callable[[], BinaryIO], name: str) -> tuple[str, int]:
+    """解压并哈希 ZIP 中的一个成员，返回 (sha256, 字节数)
+
+    每次调用单独打开一次 ZIP，可在多个线程中并行校验同一压缩包的不同成员；
+    zipfile 读到成员末尾时会校验 CRC-32，不一致时抛出 zipfile.BadZipFile。
+    """
+    with opener() as fileobj, zipfile.ZipFile(fileobj) as zf, zf.open(name) as member:
+        return hash_stream(member)
+
+
+def check_dsl(data: bytes) -> str:
+    """解析 DSL，返回应用名称
+
+    Raises:
+        ValueError: 不是有效的应用 DSL
+    """
+    try:
+        dsl = yaml.safe_load(data.decode("utf-8"))
+    except (UnicodeDecodeError, yaml.YAMLError) as e:
+        raise ValueError(f"Invalid DSL: {e}") from e
+    if not isinstance(dsl, dict) or not isinstance(dsl.get("app"), dict):
+        raise ValueError("Invalid DSL: missing app section")
+    if not dsl["app"].get("name"):
+        raise ValueError("Invalid DSL: missing app.name")
+    return dsl["app"]["name"]
+
+
+def count_csv_rows(fileobj: BinaryIO) -> int:
+    """流式统计 CSV 数据行数（不含表头），字段内的换行不计为新行
+
+    Raises:
+        ValueError: CSV 格式错误
+    """
+    stream = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        rows = sum(1 for _ in csv.reader(stream))
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid CSV: {e}") from e
+    finally:
+        # 不关闭底层文件对象，由调用方负责
+        stream.detach()
+    return max(0, rows - 1)
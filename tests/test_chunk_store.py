@@ -0,0 +1,60 @@
+import io
+import random
+
+from provider.chunk_store import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, ChunkStore, iter_chunks
+from provider.sinks import LocalSink
+
+
+def _random_bytes(size: int, seed: int = 0) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def _chunks(data: bytes, **kwargs) -> list[bytes]:
+    return list(iter_chunks(io.BytesIO(data), **kwargs))
+
+
+def test_chunks_reassemble_within_size_limits():
+    data = _random_bytes(6 * 1024 * 1024)
+    chunks = _chunks(data)
+    assert b"".join(chunks) == data
+    assert len(chunks) > 1
+    assert all(MIN_CHUNK_SIZE < len(chunk) <= MAX_CHUNK_SIZE for chunk in chunks[:-1])
+    assert _chunks(data) == chunks
+
+
+def test_chunks_without_boundaries_are_cut_at_max_size():
+    # 全零数据的签名恒定，不会出现边界
+    data = bytes(10 * 1024 * 1024)
+    assert [len(chunk) for chunk in _chunks(data)] == [
+        MAX_CHUNK_SIZE,
+        MAX_CHUNK_SIZE,
+        len(data) - 2 * MAX_CHUNK_SIZE,
+    ]
+
+
+def test_insertion_only_changes_the_affected_chunk():
+    data = _random_bytes(6 * 1024 * 1024, seed=1)
+    edited = data[:1000] + b"inserted" * 16 + data[1000:]
+    original_chunks = _chunks(data)
+    edited_chunks = _chunks(edited)
+    assert original_chunks[0] != edited_chunks[0]
+    assert original_chunks[1:] == edited_chunks[1:]
+
+
+def test_small_files_are_a_single_chunk():
+    assert _chunks(b"") == []
+    assert _chunks(b"small file") == [b"small file"]
+
+
+def test_store_deduplicates_chunks(tmp_path):
+    store = ChunkStore(LocalSink(str(tmp_path), "repository"))
+    data = _random_bytes(3 * 1024 * 1024, seed=2)
+
+    first = store.put_bytes("a.bin", data)
+    new_chunks = store.stats["new_chunks"]
+    second = store.put_bytes("b.bin", data + b"tail")
+
+    assert store.read_file(first) == data
+    assert store.read_file(second) == data + b"tail"
+    assert first["chunks"][:-1] == second["chunks"][:-1]
+    assert store.stats["new_chunks"] == new_chunks + 1
@@ -0,0 +1,107 @@
+import threading
+import time
+
+from provider.concurrency import (
+    DOWNLOAD,
+    HEARTBEAT,
+    AdaptiveLimiter,
+    LimiterGroup,
+    iter_concurrent,
+)
+
+
+def _complete(limiter: AdaptiveLimiter, count: int, latency: float, status_code: int | None = 200) -> None:
+    for _ in range(count):
+        limiter.acquire()
+        limiter.release(latency, status_code)
+
+
+def test_fast_responses_raise_the_limit_additively():
+    limiter = AdaptiveLimiter("test", initial_limit=4, max_limit=6, target_p95=1.0, min_samples=5)
+    _complete(limiter, 4, 0.1)
+    assert limiter.limit == 4
+    # 达到最少样本数后，每完成约 limit 个请求上限 +1
+    _complete(limiter, 5, 0.1)
+    assert limiter.limit == 5
+    _complete(limiter, 100, 0.1)
+    assert limiter.limit == 6
+    assert limiter.snapshot()["peak_limit"] == 6
+
+
+def test_overload_halves_the_limit_once_per_event():
+    limiter = AdaptiveLimiter("test", initial_limit=8, target_p95=5.0)
+    for status_code in (429, 503, None):
+        _complete(limiter, 1, 0.1, status_code)
+    # 冷却时间内的多个失败只降一次
+    assert limiter.limit == 4
+    assert limiter.snapshot()["throttled"] == 3
+
+
+def test_latency_spike_and_slow_p95_lower_the_limit():
+    spiky = AdaptiveLimiter("test", initial_limit=8, target_p95=0.01, spike_factor=3.0)
+    _complete(spiky, 1, 1.0)
+    assert spiky.limit == 4
+
+    slow = AdaptiveLimiter("test", initial_limit=8, target_p95=0.1, spike_factor=100.0, min_samples=3)
+    _complete(slow, 3, 0.5)
+    assert slow.limit == 4
+
+
+def test_acquire_blocks_at_the_limit():
+    limiter = AdaptiveLimiter("test", initial_limit=1, max_limit=1)
+    limiter.acquire()
+    acquired = threading.Event()
+
+    def waiter():
+        limiter.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    assert not acquired.is_set()
+    limiter.release(0.1, 200)
+    thread.join(1)
+    assert acquired.is_set()
+
+
+def test_limiter_group_is_shared_per_instance():
+    group = LimiterGroup.for_instance("http://dify-a.test")
+    assert LimiterGroup.for_instance("http://dify-a.test") is group
+    assert LimiterGroup.for_instance("http://dify-b.test") is not group
+    assert group.max_workers(DOWNLOAD) == LimiterGroup.DEFAULTS[DOWNLOAD][1]
+
+
+def test_storage_hosts_have_their_own_limiters():
+    limiter = LimiterGroup.for_storage_host("bucket.s3.test")
+    assert LimiterGroup.for_storage_host("bucket.s3.test") is limiter
+    assert LimiterGroup.for_storage_host("other.s3.test") is not limiter
+    assert limiter is not LimiterGroup.for_instance("http://dify-a.test")[DOWNLOAD]
+
+
+def test_iter_concurrent_reports_results_and_errors():
+    def work(item: int) -> int:
+        if item == 3:
+            raise ValueError("three")
+        return item * 2
+
+    results = {item: (result, error) for item, result, error in iter_concurrent(work, range(6), 2)}
+    assert {item: result for item, (result, _) in results.items() if item != 3} == {0: 0, 1: 2, 2: 4, 4: 8, 5: 10}
+    assert isinstance(results[3][1], ValueError)
+
+
+def test_iter_concurrent_yields_heartbeats_while_tasks_run():
+    release = threading.Event()
+
+    def slow(item: int) -> int:
+        release.wait(1)
+        return item
+
+    seen = []
+    for item, result, _ in iter_concurrent(slow, [1], 1, heartbeat=0.01):
+        seen.append(item)
+        if item is HEARTBEAT:
+            release.set()
+        else:
+            assert result == 1
+    assert seen[0] is HEARTBEAT and seen[-1] == 1
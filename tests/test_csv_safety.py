@@ -0,0 +1,27 @@
+import pytest
+
+from provider.csv_safety import sanitize_csv_value, unsanitize_csv_value
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("=SUM(A1)", "'=SUM(A1)"),
+        ("+1", "'+1"),
+        ("-1", "'-1"),
+        ("@cmd", "'@cmd"),
+        ("\tindent", "'\tindent"),
+        ("plain", "plain"),
+        ("a=b", "a=b"),
+        ("", ""),
+        (None, None),
+        (-1, -1),
+    ],
+)
+def test_sanitize_csv_value(value, expected):
+    assert sanitize_csv_value(value) == expected
+
+
+@pytest.mark.parametrize("value", ["=SUM(A1)", "'plain", "plain", "-1", ""])
+def test_unsanitize_reverses_sanitize(value):
+    assert unsanitize_csv_value(sanitize_csv_value(value)) == value
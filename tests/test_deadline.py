@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from provider.deadline import (
+    DEFERRED,
+    DeadlineScheduler,
+    decode_continuation_token,
+    encode_continuation_token,
+)
+
+
+def test_budget_counts_from_started_at():
+    # 登录与列表已用掉 9 秒，10 秒预算只剩 1 秒，不足安全余量
+    scheduler = DeadlineScheduler(10, started_at=time.monotonic() - 9)
+    assert scheduler.remaining() < 1.01
+    assert scheduler.try_start("first", 1.0)
+    assert not scheduler.try_start("second", 1.0)
+    assert scheduler.deferred == ["second"]
+
+
+def test_units_that_do_not_fit_are_deferred():
+    scheduler = DeadlineScheduler(3, safety_margin=0, default_seconds_per_cost=1)
+    assert scheduler.order([5, 1, 2], float) == [1, 2, 5]
+    assert scheduler.try_start(1, 1.0)
+    assert scheduler.try_start(2, 2.0)
+    assert not scheduler.try_start(5, 5.0)
+    assert scheduler.deferred == [5]
+
+
+def test_wrap_returns_deferred_placeholder():
+    scheduler = DeadlineScheduler(0, safety_margin=0)
+    run = scheduler.wrap(lambda unit: unit * 2, cost_fn=float)
+    # 每次调用至少启动一个单元
+    assert run(1) == 2
+    assert run(2) is DEFERRED
+    assert scheduler.deferred == [2]
+
+
+def test_continuation_token_round_trip():
+    params = {"sink": "local", "sink_prefix": "备份/2024", "shard_index": 1}
+    token = encode_continuation_token("export_datasets", ["ds-1", "ds-2"], params)
+    assert token.startswith("v1.")
+
+    payload = decode_continuation_token(f"  {token}\n", "export_datasets")
+    assert payload == {
+        "tool": "export_datasets",
+        "remaining": ["ds-1", "ds-2"],
+        "params": params,
+    }
+
+
+def test_continuation_token_belongs_to_one_tool():
+    token = encode_continuation_token("export_all_apps", ["app-1"], {})
+    with pytest.raises(ValueError, match="export_all_apps"):
+        decode_continuation_token(token, "export_datasets")
+
+
+@pytest.mark.parametrize("token", ["", "v2.abc", "v1.not-base64!", "v1.aGVsbG8="])
+def test_invalid_continuation_token(token):
+    with pytest.raises(ValueError):
+        decode_continuation_token(token, "export_all_apps")
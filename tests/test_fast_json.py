@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from provider.fast_json import iter_array_items
+
+PAGE = {
+    "page": 1,
+    "data": [
+        {"id": "a", "question": "你好", "answer": "=SUM(A1)", "score": -2.5e-3},
+        {"id": "b", "nested": {"list": [1, 2, [3]], "escaped": "\"\\/é"}},
+        12345678901234567890,
+        None,
+    ],
+    "has_more": True,
+    "total": 4,
+}
+
+
+def _split(data: bytes, size: int) -> list[bytes]:
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1024])
+def test_items_across_chunk_boundaries(size):
+    # 按各种块大小切分，块边界会落在多字节 UTF-8 字符、字符串与数字的中间
+    data = json.dumps(PAGE, ensure_ascii=False, indent=1).encode("utf-8")
+    fields = {}
+    items = list(iter_array_items(_split(data, size), fields=fields))
+    assert items == PAGE["data"]
+    assert fields == {"page": 1, "has_more": True, "total": 4}
+
+
+def test_other_key_and_empty_values():
+    assert list(iter_array_items([b'{"data": []}'])) == []
+    assert list(iter_array_items([b"{}"])) == []
+
+    fields = {}
+    assert list(iter_array_items([b'{"items": [1, 2]}'], fields=fields)) == []
+    assert fields == {"items": [1, 2]}
+    assert list(iter_array_items([b'{"items": [1, 2]}'], key="items")) == [1, 2]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"[1, 2]", b'{"data": [1 2]}', b'{"data": [1, 2]', b'{"data": [1,, 2]}'],
+    ids=["not-object", "missing-comma", "truncated", "double-comma"],
+)
+def test_invalid_json_raises_value_error(data):
+    with pytest.raises(ValueError):
+        list(iter_array_items(_split(data, 3)))
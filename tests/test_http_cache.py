@@ -0,0 +1,99 @@
+import gzip
+import io
+
+import pytest
+import requests
+from urllib3 import HTTPResponse
+
+from provider.http_cache import CachedSession, HttpCache
+
+URL = "http://dify.test/console/api/apps"
+
+
+class _FakeAdapter(requests.adapters.HTTPAdapter):
+    """按预设返回响应，记录收到的请求头"""
+
+    def __init__(self, responses: list):
+        super().__init__()
+        self.responses = responses
+        self.sent = []
+
+    def send(self, request, stream=False, **kwargs):
+        self.sent.append(dict(request.headers))
+        status, headers, body = self.responses.pop(0)
+        raw = HTTPResponse(
+            body=io.BytesIO(body),
+            headers=headers,
+            status=status,
+            preload_content=False,
+            decode_content=True,
+        )
+        response = self.build_response(request, raw)
+        if not stream:
+            response.content
+        return response
+
+
+def _session(tmp_path, responses: list, **cache_options) -> tuple[CachedSession, _FakeAdapter]:
+    session = CachedSession(HttpCache(str(tmp_path), **cache_options), namespace="test")
+    adapter = _FakeAdapter(responses)
+    session.mount("http://", adapter)
+    return session, adapter
+
+
+def test_etag_revalidation_replays_cached_body(tmp_path):
+    session, adapter = _session(
+        tmp_path,
+        [(200, {"ETag": '"v1"'}, b'{"data": [1]}'), (304, {"ETag": '"v1"'}, b"")],
+    )
+    assert session.get(URL, cacheable=True).content == b'{"data": [1]}'
+    response = session.get(URL, cacheable=True)
+
+    assert adapter.sent[1]["If-None-Match"] == '"v1"'
+    assert response.status_code == 200 and response.content == b'{"data": [1]}'
+    assert response.from_cache
+    assert session.stats == {"hits": 0, "revalidated": 1, "misses": 1}
+
+
+def test_entries_without_validators_hit_within_ttl(tmp_path):
+    session, adapter = _session(tmp_path, [(200, {}, b"a"), (200, {}, b"b")], ttl=60)
+    session.get(URL, cacheable=True)
+    assert session.get(URL, cacheable=True).content == b"a"
+    assert len(adapter.sent) == 1
+
+    expired, _ = _session(tmp_path / "expired", [(200, {}, b"a"), (200, {}, b"b")], ttl=0)
+    expired.get(URL, cacheable=True)
+    assert expired.get(URL, cacheable=True).content == b"b"
+
+
+@pytest.mark.parametrize("options", [{"stream": True}, {"cacheable": False}])
+def test_uncacheable_requests_bypass_the_cache(tmp_path, options):
+    options.setdefault("cacheable", True)
+    session, adapter = _session(tmp_path, [(200, {}, b"a"), (200, {}, b"b")])
+    session.get(URL, **options).content
+    assert session.get(URL, **options).content == b"b"
+    assert len(adapter.sent) == 2
+
+
+def test_decoded_body_is_replayed_without_content_encoding(tmp_path):
+    session, _ = _session(
+        tmp_path,
+        [(200, {"Content-Encoding": "gzip", "Content-Type": "application/json"}, gzip.compress(b"{}"))],
+    )
+    assert session.get(URL, cacheable=True).content == b"{}"
+    response = session.get(URL, cacheable=True)
+    assert response.content == b"{}"
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Content-Type"] == "application/json"
+
+
+def test_lru_eviction_and_persistent_index(tmp_path):
+    cache = HttpCache(str(tmp_path), max_bytes=10)
+    session = CachedSession(cache, namespace="test")
+    session.mount("http://", _FakeAdapter([(200, {}, b"x" * 6), (200, {}, b"y" * 6)]))
+    session.get(URL + "?page=1", cacheable=True)
+    session.get(URL + "?page=2", cacheable=True)
+
+    reopened = HttpCache(str(tmp_path), max_bytes=10)
+    assert reopened.get(HttpCache.make_key("test", "GET", URL + "?page=1", None)) is None
+    assert reopened.get(HttpCache.make_key("test", "GET", URL + "?page=2", None))[1] == b"y" * 6
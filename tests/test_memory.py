@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from provider.memory import MemoryBudget, MemoryBudgetExceeded, SpooledBuffer
+
+
+def test_reservation_larger_than_the_budget_is_rejected():
+    budget = MemoryBudget(100)
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.reserve(101)
+    reservation = budget.reserve(60)
+    with pytest.raises(MemoryBudgetExceeded):
+        reservation.resize(120)
+    # 失败的扩大不改变已有预留
+    assert reservation.nbytes == 60 and budget._used == 60
+
+
+def test_waiting_reservation_is_admitted_after_release():
+    budget = MemoryBudget(100)
+    first = budget.reserve(80)
+    admitted = threading.Event()
+
+    def waiter():
+        budget.reserve(50)
+        admitted.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    assert not admitted.is_set()
+    first.release()
+    thread.join(1)
+    assert admitted.is_set() and budget._used == 50
+
+
+def test_timed_out_reservation_fails_instead_of_overcommitting():
+    budget = MemoryBudget(100)
+    budget.MAX_WAIT_SECONDS = 0.05
+    budget.reserve(80)
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.reserve(50)
+    assert budget._used == 80 and budget._peak == 80
+
+
+def test_try_resize_does_not_wait():
+    budget = MemoryBudget(100)
+    budget.reserve(80)
+    other = budget.reserve()
+    assert not other.try_resize(30)
+    assert other.try_resize(20)
+    assert budget._used == 100
+
+
+def test_spooled_buffer_stays_in_memory_within_limits():
+    budget = MemoryBudget(100)
+    with SpooledBuffer(budget.reserve(), max_size=50) as spool:
+        spool.write(b"a" * 30)
+        assert spool.in_memory and spool.size == 30 and budget._used == 30
+        spool.seek(0)
+        assert spool.read() == b"a" * 30
+    assert budget._used == 0
+
+
+@pytest.mark.parametrize("limit, max_size", [(100, 50), (40, 1000)])
+def test_spooled_buffer_spills_to_disk(limit, max_size):
+    # 超过 max_size 或预算不足时转存到磁盘并释放预留，不等待
+    budget = MemoryBudget(limit)
+    with SpooledBuffer(budget.reserve(), max_size) as spool:
+        spool.write(b"a" * 30)
+        spool.write(b"b" * 30)
+        assert not spool.in_memory and spool.size == 60 and budget._used == 0
+        spool.seek(0)
+        assert spool.read() == b"a" * 30 + b"b" * 30
+
+
+@pytest.mark.parametrize("max_size", [100, 10])
+def test_spooled_buffer_write_at_fills_allocated_ranges(max_size):
+    budget = MemoryBudget(100)
+    with SpooledBuffer(budget.reserve(), max_size) as spool:
+        spool.allocate(20)
+        spool.write_at(10, b"y" * 10)
+        spool.write_at(0, b"x" * 10)
+        assert spool.size == 20 and spool.in_memory == (max_size == 100)
+        spool.seek(0)
+        assert spool.read() == b"x" * 10 + b"y" * 10
@@ -0,0 +1,56 @@
+from provider.naming import NameIndex, annotation_filename, annotation_filenames, safe_name
+
+
+def test_claims_are_stable_per_owner():
+    names = NameIndex()
+    assert names.claim("report.pdf", "doc-1") == "report.pdf"
+    assert names.claim("report.pdf", "doc-2") == "report-2.pdf"
+    assert names.claim("Report.PDF", "doc-3") == "Report-3.PDF"
+    # 同一 owner 重复申请得到相同结果
+    assert names.claim("report.pdf", "doc-2") == "report-2.pdf"
+    assert names.mapping == {
+        "report.pdf": "doc-1",
+        "report-2.pdf": "doc-2",
+        "Report-3.PDF": "doc-3",
+    }
+
+
+def test_suffix_skips_names_claimed_literally():
+    names = NameIndex()
+    names.claim("a-2.txt", "doc-1")
+    names.claim("a.txt", "doc-2")
+    assert names.claim("a.txt", "doc-3") == "a-3.txt"
+
+
+def test_suffix_without_extension_split():
+    names = NameIndex()
+    assert names.claim("My.App", "app-1", split_extension=False) == "My.App"
+    assert names.claim("My.App", "app-2", split_extension=False) == "My.App-2"
+    assert names.claim("My.App", "app-3") == "My-3.App"
+
+
+def test_one_owner_may_hold_several_names():
+    names = NameIndex()
+    assert names.claim("doc.pdf", "doc-1") == "doc.pdf"
+    assert names.claim("segments/doc.pdf.jsonl", "doc-1") == "segments/doc.pdf.jsonl"
+    assert names.claim("doc.pdf", "doc-2") == "doc-2.pdf"
+
+
+def test_safe_name():
+    assert safe_name("销售 报表/2024:Q1") == "销售_报表2024Q1"
+    assert safe_name("a.b c", keep_dots=True) == "a.b_c"
+    assert safe_name("") == "unknown"
+
+
+def test_annotation_filenames_follow_list_order():
+    apps = [
+        {"id": "app-1", "name": "客服 助手"},
+        {"id": "app-2", "name": "客服 助手"},
+        {"id": "app-3", "name": "Other"},
+    ]
+    assert annotation_filenames(apps) == {
+        "app-1": "客服_助手-annotations.csv",
+        "app-2": "客服_助手-2-annotations.csv",
+        "app-3": "Other-annotations.csv",
+    }
+    assert annotation_filename("客服 助手") == "客服_助手-annotations.csv"
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+import yaml
+from dify_plugin import Tool, ToolProvider
+from dify_plugin.core.utils.class_loader import load_single_subclass_from_source
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_yaml(path: str) -> dict:
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+PROVIDER = _load_yaml("provider/dify_backup.yaml")
+
+
+def _load(source: str, parent_type: type):
+    # 与插件注册时相同：按源文件加载，且文件中必须恰好有一个子类
+    return load_single_subclass_from_source(
+        module_name=os.path.splitext(source)[0].replace("/", "."),
+        script_path=os.path.join(ROOT, source),
+        parent_type=parent_type,
+    )
+
+
+def test_provider_loads():
+    assert _load(PROVIDER["extra"]["python"]["source"], ToolProvider)
+
+
+@pytest.mark.parametrize("tool_yaml", PROVIDER["tools"])
+def test_tool_loads(tool_yaml):
+    tool = _load_yaml(tool_yaml)
+    tool_cls = _load(tool["extra"]["python"]["source"], Tool)
+    assert tool_cls.__module__ == os.path.splitext(tool["extra"]["python"]["source"])[0].replace("/", ".")
@@ -0,0 +1,25 @@
+from provider.progress import ProgressTracker
+
+
+def test_advance_reports_every_items():
+    progress = ProgressTracker(10, unit="应用", every_items=3, every_seconds=3600)
+    assert progress.advance() is None
+    assert progress.advance() is None
+    assert progress.advance(nbytes=2048).startswith("⏳ 进度: 3/10 应用（30%）")
+    # 全部完成时由摘要收尾
+    assert progress.advance(7) is None
+
+
+def test_tick_emits_heartbeat_before_any_item_completes():
+    progress = ProgressTracker(2, unit="分区", every_seconds=0, activity_unit="条消息")
+    progress.tick(500)
+    progress.tick(700)
+    text = progress.heartbeat()
+    assert text.startswith("⏳ 进度: 0/2 分区（0%）")
+    assert "已处理 1200 条消息" in text
+
+
+def test_heartbeat_waits_for_the_interval():
+    progress = ProgressTracker(2, every_seconds=3600)
+    progress.tick(100)
+    assert progress.heartbeat() is None
@@ -0,0 +1,111 @@
+import pytest
+
+from provider.sharding import Shard, merge_shard_manifests
+
+IDS = [f"app-{i:03d}" for i in range(200)]
+
+
+def test_shards_partition_ids():
+    shards = [Shard(index, 4) for index in range(4)]
+    selected = [shard.select(IDS, lambda item_id: item_id) for shard in shards]
+
+    assert sorted(item_id for part in selected for item_id in part) == IDS
+    assert all(part for part in selected)
+    # 保持原顺序，且分片只取决于 ID
+    assert all(part == sorted(part) for part in selected)
+    assert [Shard.of(item_id, 4) for item_id in IDS] == [
+        Shard.of(item_id, 4) for item_id in IDS
+    ]
+
+
+@pytest.mark.parametrize(
+    "index, count, expected",
+    [(None, None, None), ("", "", None), (0, 1, None), ("1", "3", (1, 3))],
+)
+def test_shard_from_parameters(index, count, expected):
+    shard = Shard.from_parameters(index, count)
+    assert (shard and (shard.index, shard.count)) == expected
+
+
+@pytest.mark.parametrize("index, count", [(3, 3), (-1, 2), (0, -1), ("a", 2)])
+def test_shard_from_parameters_rejects_invalid(index, count):
+    with pytest.raises(ValueError):
+        Shard.from_parameters(index, count)
+
+
+def _apps_manifest(index: int, apps: list, **extra) -> dict:
+    return {
+        "shard": Shard(index, 2).describe("export_all_apps"),
+        "exported_apps": [{"id": app_id, "files": [f"{app_id}.yml"]} for app_id in apps],
+        "name_index": {f"{app_id}.yml": app_id for app_id in apps},
+        "failed_apps": [],
+        **extra,
+    }
+
+
+def test_merge_app_shards_with_continuation():
+    merged = merge_shard_manifests(
+        [
+            _apps_manifest(0, ["a"], complete=False, deferred_app_ids=["b", "c"]),
+            _apps_manifest(0, ["b"], complete=True, deferred_app_ids=[]),
+            _apps_manifest(1, ["d"], failed_apps=["e: boom"]),
+        ]
+    )
+    assert merged["complete"] is True
+    assert merged["shards"] == {"tool": "export_all_apps", "count": 2, "merged": [0, 1]}
+    assert [app["id"] for app in merged["exported_apps"]] == ["a", "b", "d"]
+    assert merged["deferred_app_ids"] == ["c"]
+    assert merged["failed_apps"] == ["e: boom"]
+    assert merged["missing_shards"] == [] and merged["incomplete_shards"] == []
+
+
+def test_merge_reports_missing_and_incomplete_shards():
+    merged = merge_shard_manifests([_apps_manifest(1, ["a"], complete=False)])
+    assert merged["complete"] is False
+    assert merged["missing_shards"] == [0]
+    assert merged["incomplete_shards"] == [1]
+
+
+def test_merge_dataset_shards():
+    manifests = [
+        {
+            "shard": Shard(index, 2).describe("export_datasets"),
+            "datasets": [
+                {"dataset_id": f"ds-{index}", "status": "exported", "exported_file_count": 3},
+                {"dataset_id": f"ds-{index}-failed", "status": "failed"},
+            ],
+            "snapshot_key": f"snapshots/datasets-shard-{index}.json",
+            "sink": {"type": "local", "directory": "/backup", "prefix": "run"},
+        }
+        for index in range(2)
+    ]
+    merged = merge_shard_manifests(manifests)
+    assert merged["total_datasets"] == 4
+    assert merged["total_files"] == 6
+    assert merged["shard_snapshot_keys"] == [
+        "snapshots/datasets-shard-0.json",
+        "snapshots/datasets-shard-1.json",
+    ]
+    assert merged["sink"] == manifests[0]["sink"]
+
+
+@pytest.mark.parametrize(
+    "manifests",
+    [
+        [],
+        [{"exported_apps": []}],
+        [
+            _apps_manifest(0, ["a"]),
+            {**_apps_manifest(1, ["b"]), "shard": Shard(1, 3).describe("export_all_apps")},
+        ],
+        [
+            _apps_manifest(0, ["a"], sink={"type": "local", "prefix": "one"}),
+            _apps_manifest(1, ["b"], sink={"type": "local", "prefix": "two"}),
+        ],
+        [_apps_manifest(0, ["a"], snapshot_key="snapshots/apps.json")],
+    ],
+    ids=["empty", "not-sharded", "counts", "sinks", "dedup-without-sink"],
+)
+def test_merge_rejects_incompatible_manifests(manifests):
+    with pytest.raises(ValueError):
+        merge_shard_manifests(manifests)
@@ -0,0 +1,112 @@
+import base64
+import hashlib
+import io
+import re
+
+import pytest
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from provider.memory import MemoryBudget
+from provider.storage_download import StorageDownloader, StorageDownloadError
+
+DATA = bytes(range(256)) * 40
+
+
+class _CutStream(io.BytesIO):
+    """读到 cut 字节后模拟连接中断"""
+
+    def __init__(self, body: bytes, cut: int | None):
+        super().__init__(body)
+        self.cut = cut
+
+    def read(self, size: int = -1) -> bytes:
+        if self.cut is not None and self.tell() >= self.cut:
+            raise requests.exceptions.ChunkedEncodingError("connection reset")
+        if self.cut is not None and size > 0:
+            size = min(size, self.cut - self.tell())
+        return super().read(size)
+
+
+class _FakeStore:
+    """按预设内容响应（区间）请求，记录收到的 Range 头"""
+
+    def __init__(self, data: bytes = DATA, ranges: bool = True, headers: dict | None = None):
+        self.data = data
+        self.ranges = ranges
+        self.headers = headers or {}
+        self.cuts: list[int] = []
+        self.requested: list[str | None] = []
+
+    def send(self, session: requests.Session, headers: dict) -> requests.Response:
+        requested = headers.get("Range")
+        self.requested.append(requested)
+        response = requests.Response()
+        response.headers = CaseInsensitiveDict({"ETag": '"v1"', **self.headers})
+        body = self.data
+        if self.ranges and requested:
+            start, end = re.match(r"bytes=(\d+)-(\d*)", requested).groups()
+            start, end = int(start), min(int(end or len(self.data) - 1), len(self.data) - 1)
+            body = self.data[start : end + 1]
+            response.status_code = 206
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{len(self.data)}"
+        else:
+            response.status_code = 200
+        response.headers["Content-Length"] = str(len(body))
+        response.raw = _CutStream(body, self.cuts.pop(0) if self.cuts else None)
+        return response
+
+
+@pytest.fixture
+def downloader(monkeypatch):
+    downloader = StorageDownloader()
+    monkeypatch.setattr(downloader, "RETRY_BACKOFF", 0)
+    monkeypatch.setattr(downloader, "READ_CHUNK_SIZE", 256)
+    return downloader
+
+
+def test_interrupted_range_resumes_from_received_position(downloader):
+    store = _FakeStore()
+    store.cuts = [1000]
+    body, _ = downloader.download("http://store.test/obj", store.send, session=requests.Session())
+    with body:
+        assert body.read() == DATA
+    # 续传请求从已收到的第 1000 字节开始
+    assert store.requested[1].startswith("bytes=1000-")
+
+
+def test_large_object_downloads_parallel_segments_and_spills(downloader, monkeypatch):
+    monkeypatch.setattr(downloader, "SEGMENT_SIZE", 1024)
+    monkeypatch.setattr(downloader, "PARALLEL_THRESHOLD", 4096)
+    monkeypatch.setattr(downloader, "SPOOL_BYTES", 2048)
+    store = _FakeStore()
+    body, _ = downloader.download("http://store.test/obj", store.send, session=requests.Session())
+    with body:
+        assert not body.in_memory
+        assert body.read() == DATA
+    assert sorted(store.requested) == sorted(
+        f"bytes={start}-{min(start + 1024, len(DATA)) - 1}" for start in range(0, len(DATA), 1024)
+    )
+
+
+def test_checksum_mismatch_fails_and_releases_memory(downloader):
+    reservation = MemoryBudget.shared().reserve()
+    wrong = base64.b64encode(hashlib.md5(b"other").digest()).decode()
+    store = _FakeStore(ranges=False, headers={"Content-MD5": wrong})
+    with pytest.raises(StorageDownloadError, match="Content-MD5 mismatch"):
+        downloader.download("http://store.test/obj", store.send, reservation, session=requests.Session())
+    assert reservation.nbytes == 0
+
+    correct = base64.b64encode(hashlib.md5(DATA).digest()).decode()
+    store = _FakeStore(ranges=False, headers={"Content-MD5": correct})
+    body, _ = downloader.download("http://store.test/obj", store.send, session=requests.Session())
+    with body:
+        assert body.read() == DATA
+
+
+def test_exhausted_retries_raise_without_status_code(downloader):
+    store = _FakeStore(ranges=False)
+    store.cuts = [10] * (downloader.MAX_RETRIES + 1)
+    with pytest.raises(StorageDownloadError) as error:
+        downloader.download("http://store.test/obj", store.send, session=requests.Session())
+    assert error.value.status_code is None
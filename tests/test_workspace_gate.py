@@ -0,0 +1,54 @@
+import threading
+import time
+
+from provider.dify_backup import WorkspaceGate
+
+
+def _request_in_thread(gate: WorkspaceGate, workspace_id: str | None, done: list) -> threading.Thread:
+    def run():
+        with gate.request(workspace_id):
+            done.append(workspace_id)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_pinned_workspace_blocks_other_requests():
+    gate = WorkspaceGate()
+    done = []
+    with gate.pin("ws-1"):
+        bound = _request_in_thread(gate, "ws-1", done)
+        bound.join(1)
+        others = [_request_in_thread(gate, None, done), _request_in_thread(gate, "ws-2", done)]
+        time.sleep(0.05)
+        # 固定期间只有绑定到 ws-1 的请求能发出
+        assert done == ["ws-1"]
+    for thread in others:
+        thread.join(1)
+    assert sorted(done[1:], key=str) == sorted([None, "ws-2"], key=str)
+
+
+def test_pin_waits_for_requests_in_flight():
+    gate = WorkspaceGate()
+    events = []
+    release = threading.Event()
+
+    def in_flight():
+        with gate.request(None):
+            release.wait(1)
+            events.append("request done")
+
+    def pin():
+        with gate.pin("ws-1"):
+            events.append("pinned")
+
+    threads = [threading.Thread(target=in_flight), threading.Thread(target=pin)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    assert events == []
+    release.set()
+    for thread in threads:
+        thread.join(1)
+    assert events == ["request done", "pinned"]
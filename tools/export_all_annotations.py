@@ -2,81 +2,159 @@ from collections.abc import Generator
 from typing import Any
 import logging
 import csv
+import hashlib
 import io
+import math
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.concurrency import LISTING, iter_concurrent
+from provider.csv_safety import sanitize_csv_value
 from provider.dify_backup import DifyClient
+from provider.http_cache import HttpCache
+from provider.memory import MemoryBudget, MemoryBudgetExceeded, Reservation
+from provider.naming import annotation_filename, annotation_filenames
+from provider.planning import ExecutionPlan, sample_units
+from provider.progress import ProgressTracker
+from provider.sharding import Shard
+from provider.sinks import ArtifactSink, create_sink, put_manifest
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.addHandler(plugin_logger_handler)
 
+# 标注回复只在对话类应用中可用，这些类型的应用不会有标注，规划时直接跳过
+NO_ANNOTATION_MODES = ('workflow', 'completion')
+
+# 试运行抽样的应用数：获取标注数量只需一条请求，多抽一些以减小标注分布稀疏时的误差
+DRY_RUN_SAMPLE_APPS = 10
+
 
 class ExportAllAnnotationsTool(Tool):
     """
     Tool for exporting annotations for all Dify applications
+
+    After a completed run ``manifest`` holds the run manifest (also when it is not
+    returned), so callers such as the multi-workspace export can check failures.
+    A caller that pins the account to a workspace sets ``workspace_id`` first; the
+    tool's client is then bound to that workspace.
     """
 
+    manifest: dict | None = None
+    workspace_id: str | None = None
+
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         """
         Export annotations for all applications using DifyClient
         """
+        self.manifest = None
         base_url = self.runtime.credentials.get("dify_base_url", "")
         email = self.runtime.credentials.get("email", "")
         password = self.runtime.credentials.get("password", "")
+        use_cache = bool(tool_parameters.get("use_cache", False))
 
         if not base_url or not email or not password:
             yield self.create_text_message("Error: Provider credentials not configured")
             return
 
+        try:
+            shard = Shard.from_parameters(tool_parameters.get("shard_index"), tool_parameters.get("shard_count"))
+            sink = create_sink(tool_parameters.get("sink"), self.runtime.credentials, tool_parameters.get("sink_prefix"))
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
         try:
             # 初始化 Client (会自动登录)
-            client = DifyClient(base_url, email, password)
+            client = DifyClient(
+                base_url,
+                email,
+                password,
+                cache=HttpCache.shared() if use_cache else None,
+                workspace_id=self.workspace_id,
+            )
+
+            # 试运行从列表请求开始计入执行计划
+            plan = ExecutionPlan("export_all_annotations", client) if tool_parameters.get("dry_run") else None
 
             # 获取所有应用
             logger.info("开始获取应用列表...")
             all_apps = client.get_all_apps(limit=100, mode="all")
             logger.info(f"获取到 {len(all_apps)} 个应用")
+            filenames = annotation_filenames(all_apps)
+            if shard:
+                all_apps = shard.select(all_apps, lambda app: app.get("id"))
+                logger.info(f"分片 {shard.index}/{shard.count}：本次导出 {len(all_apps)} 个应用")
+
+            if plan:
+                yield from self._dry_run(client, plan, all_apps)
+                return
+
+            # 规划：按应用类型与标注数量（每个应用一条 limit=1 的请求）筛选出有标注的应用，
+            # 只对这些应用完整分页拉取
+            listed_app_count = len(all_apps)
+            all_apps = yield from self._plan_apps(client, all_apps)
+
+            memory = MemoryBudget.shared()
+            memory.reset_peak()
 
             successful_app_count = 0
             total_annotations_count = 0
             failed_apps_info = []
+            exported_apps = []
+
+            progress = ProgressTracker(len(all_apps), unit="应用")
 
-            for app in all_apps:
+            # 各应用并发拉取标注并生成 CSV，实际并发由 client 的自适应限流器控制
+            annotation_results = iter_concurrent(
+                lambda app: self._export_annotations(client, app, memory.reserve(), sink, filenames[app.get("id")]),
+                all_apps,
+                client.max_workers(LISTING),
+            )
+            for app, result, error in annotation_results:
                 app_id = app.get("id")
                 app_name = app.get("name")
+
+                # 拉取与 CSV 生成已在工作线程完成，先计入进度
+                progress_text = progress.advance(nbytes=len(result[1].encode("utf-8")) if error is None else 0)
+                if progress_text:
+                    yield self.create_text_message(progress_text)
                 
                 try:
-                    # 获取该应用的标注
-                    annotations = client.get_all_annotations(app_id)
-                    
-                    # 标注数量为0的无需yield
-                    if not annotations:
-                        logger.info(f"[{app_name}] 无标注，跳过")
-                        continue
+                    if error is not None:
+                        raise error
 
-                    # 生成 CSV 内容
-                    csv_content = self._generate_csv_content(annotations)
-                    
-                    # 生成文件名：应用-annotations.csv
-                    # 保留中文字符和常用字符
-                    safe_app_name = "".join(c for c in app_name if c.isalnum() or c in (' ', '-', '_') or '\u4e00' <= c <= '\u9fff').strip().replace(' ', '_')
-                    filename = f"{safe_app_name}-annotations.csv"
-                    
-                    # 返回 JSON 对象
-                    json_item = {
-                        "name": app_name,
-                        "filename": filename,
-                        "content": csv_content
-                    }
+                    annotation_count, csv_content, object_key, reservation = result
+
+                    # 发送完毕（或跳过）后释放预留
+                    with reservation:
+                        # 标注数量为0的无需yield
+                        if not annotation_count:
+                            logger.info(f"[{app_name}] 无标注，跳过")
+                            continue
+
+                        # 返回 JSON 对象，写入存储时以 object_key 代替 CSV 内容
+                        # 记录条数与摘要，verify_backup 据此校验备份
+                        json_item = {
+                            "id": app_id,
+                            "name": app_name,
+                            "filename": filenames[app_id],
+                            "annotation_count": annotation_count,
+                            "sha256": hashlib.sha256(csv_content.encode("utf-8")).hexdigest(),
+                        }
+                        if object_key:
+                            json_item["object_key"] = object_key
+                        else:
+                            json_item["content"] = csv_content
                     
-                    yield self.create_json_message(json_item)
+                        yield self.create_json_message(json_item)
+                        if object_key or shard:
+                            exported_apps.append({k: v for k, v in json_item.items() if k != "content"})
                     
-                    successful_app_count += 1
-                    total_annotations_count += len(annotations)
-                    logger.info(f"[{app_name}] 成功导出 {len(annotations)} 条标注")
+                        successful_app_count += 1
+                        total_annotations_count += annotation_count
+                        logger.info(f"[{app_name}] 成功导出 {annotation_count} 条标注")
 
                 except Exception as e:
                     logger.error(f"处理应用 {app_name} ({app_id}) 时出错: {str(e)}")
@@ -84,8 +162,17 @@ class ExportAllAnnotationsTool(Tool):
 
             # 返回摘要信息
             summary_text = f"✅ 批量导出标注完成\n\n"
+            if shard:
+                summary_text += f"分片: {shard.index}（共 {shard.count} 片）\n"
+            summary_text += f"有标注的应用: {len(all_apps)} / {listed_app_count}\n"
             summary_text += f"成功应用数: {successful_app_count}\n"
             summary_text += f"总标注数: {total_annotations_count}\n"
+            summary_text += f"{memory.stats_text()}\n"
+            if sink:
+                summary_text += f"📦 输出位置: {sink.location_text()}\n"
+            cache_stats = client.cache_stats_text()
+            if cache_stats:
+                summary_text += f"{cache_stats}\n"
             
             if failed_apps_info:
                 summary_text += f"\n❌ 部分应用处理失败:\n"
@@ -96,11 +183,139 @@ class ExportAllAnnotationsTool(Tool):
             
             yield self.create_text_message(summary_text)
 
+            manifest = {
+                "exported_apps": exported_apps,
+                "name_index": {item["filename"]: item["id"] for item in exported_apps},
+                "failed_apps": failed_apps_info,
+            }
+
+            # 写入存储或分片导出时返回清单
+            if sink or shard:
+                if shard:
+                    manifest["shard"] = shard.describe("export_all_annotations")
+                if sink:
+                    manifest["sink"] = sink.describe()
+                    manifest["manifest_key"] = put_manifest(sink, shard.label("annotations") if shard else "annotations", manifest)
+                yield self.create_json_message(manifest)
+            self.manifest = manifest
+
         except Exception as e:
             error_msg = f"Export All Annotations failed: {str(e)}"
             logger.error(error_msg)
             yield self.create_text_message(error_msg)
 
+    def _plan_apps(self, client: DifyClient, apps: list) -> Generator[ToolInvokeMessage, None, list]:
+        """
+        筛选需要完整拉取标注的应用（保持原顺序），规划期间输出进度
+
+        不支持标注的应用类型直接跳过；其余应用并发请求标注数量，数量为 0 的跳过。
+        数量请求失败（如旧版本不支持分页信息）时保留该应用，由完整拉取决定结果。
+        """
+        candidates = [app for app in apps if app.get("mode") not in NO_ANNOTATION_MODES]
+        logger.info(f"规划：{len(apps) - len(candidates)} 个应用类型不支持标注，检查其余 {len(candidates)} 个应用的标注数量")
+
+        selected_ids = set()
+        progress = ProgressTracker(len(candidates), unit="应用")
+        for app, count, error in iter_concurrent(
+            lambda app: client.count_annotations(app.get("id")),
+            candidates,
+            client.max_workers(LISTING),
+        ):
+            if error is not None:
+                logger.warning(f"[{app.get('name')}] 获取标注数量失败，改为完整拉取: {str(error)}")
+                selected_ids.add(app.get("id"))
+            elif count:
+                selected_ids.add(app.get("id"))
+
+            progress_text = progress.advance()
+            if progress_text:
+                yield self.create_text_message(f"[规划] {progress_text}")
+
+        logger.info(f"规划完成：{len(selected_ids)} 个应用有标注")
+        return [app for app in candidates if app.get("id") in selected_ids]
+
+    def _dry_run(self, client: DifyClient, plan: ExecutionPlan, apps: list) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        试运行：抽样少量可能有标注的应用，推算标注数、请求数、数据量与耗时
+
+        正式运行对每个候选应用发一条数量请求，再对有标注的应用按每页 100 条分页拉取，
+        请求数按抽样的平均标注数推算，不为每个应用单独请求数量。
+        """
+        plan.record_listing()
+        candidates = [app for app in apps if app.get("mode") not in NO_ANNOTATION_MODES]
+        sample = plan.sample(
+            "apps",
+            sample_units(candidates, DRY_RUN_SAMPLE_APPS, key=lambda app: app.get("mode") or ""),
+            lambda app: self._sample_annotations(client, app),
+            client.max_workers(LISTING),
+        )
+        plan.add_count("apps", len(apps))
+        plan.add_count("annotated_apps", sample.mean("annotated") * len(candidates))
+        plan.add_count("annotations", sample.mean("annotations") * len(candidates))
+        plan.add_requests(LISTING, len(candidates) * (1 + sample.mean("pages")))
+        plan.add_bytes(sample.mean("bytes") * len(candidates))
+        yield self.create_text_message(
+            plan.summary_text({"apps": "应用", "annotated_apps": "有标注的应用", "annotations": "标注"})
+        )
+        yield self.create_json_message(plan.to_dict())
+
+    def _sample_annotations(self, client: DifyClient, app: dict) -> dict:
+        """试运行抽样（在工作线程中执行）：获取标注数量，按首页标注生成的 CSV 估算每条标注的字节数"""
+        count = client.count_annotations(app.get("id"))
+        if not count:
+            return {"annotated": 0, "annotations": 0, "pages": 0, "bytes": 0}
+        pages = client.iter_annotations(app.get("id"))
+        try:
+            first_page = next(pages, [])
+        finally:
+            pages.close()
+        row_bytes = len(self._generate_csv_content(first_page).encode("utf-8")) / max(1, len(first_page))
+        # 与 get_all_annotations 的默认分页大小一致
+        return {"annotated": 1, "annotations": count, "pages": math.ceil(count / 100), "bytes": row_bytes * count}
+
+    def _export_annotations(self, client: DifyClient, app: dict, reservation: Reservation, sink: ArtifactSink | None = None, filename: str | None = None) -> tuple[int, str, str | None, Reservation]:
+        """
+        逐页拉取单个应用的标注并写入 CSV（在工作线程中执行）
+
+        每页写入前按问答文本长度扩大内存预留，内存中只保留当前页与已生成的 CSV，
+        返回 (标注数, CSV 内容, 对象键, 预留)，调用方发送完毕后释放预留。
+        指定存储时 CSV 在工作线程中直接写入存储。
+        """
+        try:
+            output = io.StringIO()
+            writer = csv.writer(output, quoting=csv.QUOTE_ALL)
+            writer.writerow(['question', 'answer'])
+            annotation_count = 0
+            estimated_size = 0
+            try:
+                for annotations in client.iter_annotations(app.get("id")):
+                    # 按问答文本长度估算 CSV 大小（UTF-8 下中文约 3 字节/字）
+                    estimated_size += sum(
+                        len(annotation.get('question') or '') + len(annotation.get('answer') or annotation.get('content') or '') + 8
+                        for annotation in annotations
+                    ) * 3
+                    reservation.resize(estimated_size)
+                    self._write_csv_rows(writer, annotations)
+                    annotation_count += len(annotations)
+            except MemoryBudgetExceeded:
+                # 内存预算无法容纳该应用的标注时整个应用失败，不输出不完整的 CSV
+                raise
+            except Exception as e:
+                # 与 get_all_annotations 一致：某一页失败时保留已拉取的标注
+                logger.warning(str(e))
+            if not annotation_count:
+                return 0, "", None, reservation
+            csv_content = output.getvalue()
+
+            object_key = None
+            if sink:
+                object_key = sink.key_for("annotations", filename or annotation_filename(app.get("name")))
+                sink.put_bytes(object_key, csv_content.encode("utf-8"), "text/csv")
+            return annotation_count, csv_content, object_key, reservation
+        except Exception:
+            reservation.release()
+            raise
+
     def _generate_csv_content(self, annotations: list) -> str:
         """
         生成 CSV 内容
@@ -110,27 +325,19 @@ class ExportAllAnnotationsTool(Tool):
         
         # 写入表头
         writer.writerow(['question', 'answer'])
-        
-        # 写入数据
+        self._write_csv_rows(writer, annotations)
+        return output.getvalue()
+
+    def _write_csv_rows(self, writer, annotations: list) -> None:
+        """
+        写入标注数据行
+        """
         for annotation in annotations:
             question = annotation.get('question', '')
             answer = annotation.get('answer', '') or annotation.get('content', '')
             
             # CSV 注入防护：如果以特殊字符开头，添加单引号前缀
-            question = self._sanitize_csv_value(question)
-            answer = self._sanitize_csv_value(answer)
+            question = sanitize_csv_value(question)
+            answer = sanitize_csv_value(answer)
             
             writer.writerow([question, answer])
-        
-        return output.getvalue()
-
-    def _sanitize_csv_value(self, value: str) -> str:
-        """
-        CSV 注入防护
-        """
-        if value and isinstance(value, str):
-            # 如果以这些字符开头，可能会被解释为公式
-            dangerous_chars = ('=', '+', '-', '@', '\t', '\r', '\n')
-            if value.startswith(dangerous_chars):
-                return "'" + value
-        return value
@@ -1,12 +1,29 @@
 from collections.abc import Generator
 from typing import Any
+import hashlib
 import logging
+import time
 import yaml
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.chunk_store import ChunkStore, create_chunk_store
+from provider.concurrency import EXPORT, iter_concurrent
+from provider.deadline import (
+    DEFERRED,
+    DeadlineScheduler,
+    decode_continuation_token,
+    encode_continuation_token,
+)
 from provider.dify_backup import DifyClient
+from provider.http_cache import HttpCache
+from provider.memory import MemoryBudget, Reservation
+from provider.naming import NameIndex, safe_name
+from provider.planning import ExecutionPlan, sample_units
+from provider.progress import ProgressTracker
+from provider.sharding import Shard
+from provider.sinks import ArtifactSink, put_manifest
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -16,88 +33,206 @@ logger.addHandler(plugin_logger_handler)
 class ExportAllAppsTool(Tool):
     """
     Tool for exporting all Dify applications DSL configurations
+
+    After a completed run ``manifest`` holds the run manifest (also when it is not
+    returned), so callers such as the multi-workspace export can check failures.
+    A caller that pins the account to a workspace sets ``workspace_id`` first; the
+    tool's client is then bound to that workspace.
     """
 
+    manifest: dict | None = None
+    workspace_id: str | None = None
+
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         """
         Export all applications DSL configurations using DifyClient
         """
+        # 时间预算从调用开始计算，登录与列表请求也计入
+        started_at = time.monotonic()
+        self.manifest = None
         version_type = tool_parameters.get("version_type", "draft")
         app_mode = tool_parameters.get("app_mode", "all")
+        time_budget = tool_parameters.get("time_budget_seconds")
+        continuation_token = (tool_parameters.get("continuation_token") or "").strip()
+        sink_type = tool_parameters.get("sink")
+        sink_prefix = tool_parameters.get("sink_prefix")
+        dedup = bool(tool_parameters.get("dedup", False))
+        dry_run = bool(tool_parameters.get("dry_run", False))
+        shard_index = tool_parameters.get("shard_index")
+        shard_count = tool_parameters.get("shard_count")
+
+        # 续传时沿用上一次调用的参数（含存储位置与分片），只处理剩余应用
+        pending_app_ids = None
+        if continuation_token:
+            try:
+                state = decode_continuation_token(continuation_token, "export_all_apps")
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            version_type = state["params"].get("version_type", version_type)
+            app_mode = state["params"].get("app_mode", app_mode)
+            sink_type = state["params"].get("sink", sink_type)
+            sink_prefix = state["params"].get("sink_prefix", sink_prefix)
+            dedup = state["params"].get("dedup", dedup)
+            shard_index = state["params"].get("shard_index", shard_index)
+            shard_count = state["params"].get("shard_count", shard_count)
+            pending_app_ids = set(state["remaining"])
+
+        try:
+            shard = Shard.from_parameters(shard_index, shard_count)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
 
         base_url = self.runtime.credentials.get("dify_base_url", "")
         email = self.runtime.credentials.get("email", "")
         password = self.runtime.credentials.get("password", "")
+        use_cache = bool(tool_parameters.get("use_cache", False))
 
         if not base_url or not email or not password:
             yield self.create_text_message("Error: Provider credentials not configured")
             return
 
+        try:
+            sink, store = create_chunk_store(dedup, sink_type, self.runtime.credentials, sink_prefix)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
         try:
             # 初始化 Client (会自动登录)
-            client = DifyClient(base_url, email, password)
+            client = DifyClient(
+                base_url,
+                email,
+                password,
+                cache=HttpCache.shared() if use_cache else None,
+                workspace_id=self.workspace_id,
+            )
+
+            # 试运行从列表请求开始计入执行计划
+            plan = ExecutionPlan("export_all_apps", client) if dry_run else None
 
             # 获取所有应用
             logger.info(f"开始获取应用列表... (app_mode={app_mode})")
             all_apps = client.get_all_apps(limit=100, mode=app_mode)
             logger.info(f"获取到 {len(all_apps)} 个应用")
 
+            # 按完整列表顺序预先分配应用名，同名应用追加稳定的后缀（续传时结果相同）
+            app_names = NameIndex()
+            for app in all_apps:
+                app_names.claim(safe_name(app.get("name")), app.get("id"), split_extension=False)
+            file_names = NameIndex()
+
+            if shard:
+                all_apps = shard.select(all_apps, lambda app: app.get("id"))
+                logger.info(f"分片 {shard.index}/{shard.count}：本次导出 {len(all_apps)} 个应用")
+            if pending_app_ids is not None:
+                all_apps = [app for app in all_apps if app.get("id") in pending_app_ids]
+                logger.info(f"续传模式：剩余 {len(all_apps)} 个应用待导出")
+
+            if plan:
+                yield from self._dry_run(client, plan, all_apps, version_type)
+                return
+
+            memory = MemoryBudget.shared()
+            memory.reset_peak()
+
             successful_app_ids = set()
             exported_dsl_count = 0
             failed_apps_info = []
+            exported_apps = {}
+            name_index = {}
 
-            for app in all_apps:
+            def export_one(app: dict) -> tuple[list, Reservation]:
+                app_stem = app_names.claim(safe_name(app.get("name")), app.get("id"), split_extension=False)
+                return self._export_app(client, app, version_type, memory.reserve(), sink, store, app_stem, file_names)
+
+            # 指定时间预算时按预计成本调度，截止前来不及完成的应用留给下一次调用
+            scheduler = None
+            if time_budget:
+                scheduler = DeadlineScheduler(float(time_budget), started_at=started_at)
+                cost_fn = lambda app: self._estimate_app_cost(app, version_type)
+                all_apps = scheduler.order(all_apps, cost_fn)
+                export_one = scheduler.wrap(export_one, cost_fn)
+
+            progress = ProgressTracker(len(all_apps), unit="应用")
+
+            # 各应用并发导出，实际并发由 client 的自适应限流器控制
+            export_results = iter_concurrent(
+                export_one,
+                all_apps,
+                client.max_workers(EXPORT),
+            )
+            for app, result, error in export_results:
                 app_id = app.get("id")
                 app_name = app.get("name")
-                app_mode = app.get("mode", "unknown")
-                
-                try:
-                    # 获取该应用要导出的版本列表
-                    versions = client.get_versions_to_export(app_id, app_name, version_type)
-                    
-                    if not versions:
-                        # 如果没找到版本，跳过
-                        continue
-
-                    has_success_version = False
-                    for ver in versions:
-                        dsl_content = client.export_dsl(app_id, ver["id"])
-                        
-                        if dsl_content:
-                            filename = client.generate_filename(app_name, ver["display_name"])
-                            
-                            # 保持原始 YAML 格式
-                            dsl_yaml = dsl_content if isinstance(dsl_content, str) else yaml.dump(dsl_content, allow_unicode=True, default_flow_style=False, sort_keys=False)
-
-                            json_item = {
-                                "id": app_id,
-                                "name": app_name,
-                                "mode": app_mode,
-                                "version": ver["version"],
-                                "filename": filename,
-                                "dsl": dsl_yaml
-                            }
-                            
-                            # 实时返回 JSON
-                            yield self.create_json_message(json_item)
-                            
-                            exported_dsl_count += 1
-                            has_success_version = True
-                            logger.info(f"[{app_name}] 成功导出版本: {ver['version']}")
-                        else:
-                            logger.warning(f"[{app_name}] 导出失败: {ver['display_name']}")
-                    
-                    if has_success_version:
-                        successful_app_ids.add(app_id)
-
-                except Exception as e:
-                    logger.error(f"处理应用 {app_name} ({app_id}) 时出错: {str(e)}")
-                    failed_apps_info.append(f"{app_name}: {str(e)}")
+
+                if result is DEFERRED:
+                    progress.adjust_total(-1)
+                    continue
+
+                if error is not None:
+                    logger.error(f"处理应用 {app_name} ({app_id}) 时出错: {str(error)}")
+                    failed_apps_info.append(f"{app_name}: {str(error)}")
+                    progress_text = progress.advance()
+                    if progress_text:
+                        yield self.create_text_message(progress_text)
+                    continue
+
+                json_items, reservation = result
+                with reservation:
+                    for json_item in json_items:
+                        # 实时返回 JSON
+                        yield self.create_json_message(json_item)
+                        exported_dsl_count += 1
+
+                progress_text = progress.advance(nbytes=sum(item["size"] if sink else len(item["dsl"].encode("utf-8")) for item in json_items))
+                if progress_text:
+                    yield self.create_text_message(progress_text)
+
+                if json_items:
+                    successful_app_ids.add(app_id)
+                    files = [item.get("path") or item.get("object_key") or item["filename"] for item in json_items]
+                    name_index.update((item["filename"], app_id) for item in json_items)
+                    exported_apps[app_id] = {
+                        "id": app_id,
+                        "name": app_name,
+                        "mode": app.get("mode", "unknown"),
+                        "updated_at": app.get("updated_at"),
+                        "files": files,
+                        "checksums": {file: item["sha256"] for file, item in zip(files, json_items)},
+                    }
+
+            logger.info(f"限流器状态: {client.limiters.snapshot()}")
+
+            deferred_app_ids = [app.get("id") for app in scheduler.deferred] if scheduler else []
+            next_token = None
+            if deferred_app_ids:
+                next_token = encode_continuation_token(
+                    "export_all_apps",
+                    deferred_app_ids,
+                    {
+                        "version_type": version_type,
+                        "app_mode": app_mode,
+                        **({"sink": sink_type, "sink_prefix": sink.prefix, "dedup": dedup} if sink else {}),
+                        **(shard.to_params() if shard else {}),
+                    },
+                )
 
             # 返回摘要信息
             summary_text = f"✅ 批量导出完成\n\n"
+            if shard:
+                summary_text += f"分片: {shard.index}（共 {shard.count} 片）\n"
             summary_text += f"成功应用数: {len(successful_app_ids)}\n"
             summary_text += f"总文件数: {exported_dsl_count}\n"
+            summary_text += f"{memory.stats_text()}\n"
+            if sink:
+                summary_text += f"📦 输出位置: {sink.location_text()}\n"
+            if store:
+                summary_text += f"{store.stats_text()}\n"
+            cache_stats = client.cache_stats_text()
+            if cache_stats:
+                summary_text += f"{cache_stats}\n"
             
             if failed_apps_info:
                 summary_text += f"\n❌ 部分应用处理失败:\n"
@@ -105,10 +240,128 @@ class ExportAllAppsTool(Tool):
                     summary_text += f"- {err}\n"
                 if len(failed_apps_info) > 10:
                     summary_text += f"... (共 {len(failed_apps_info)} 个错误)"
+
+            if deferred_app_ids:
+                summary_text += f"\n⏱️ 时间预算已用尽，剩余 {len(deferred_app_ids)} 个应用未导出。\n"
+                summary_text += "请使用清单中的 continuation_token 再次调用以继续导出。\n"
             
             yield self.create_text_message(summary_text)
 
+            manifest = {
+                "complete": not deferred_app_ids,
+                "exported_apps": list(exported_apps.values()),
+                "name_index": name_index,
+                "failed_apps": failed_apps_info,
+                "deferred_app_ids": deferred_app_ids,
+                "continuation_token": next_token,
+            }
+
+            # 分片调用或写入存储时返回本次完成内容的清单（及续传令牌）
+            if scheduler or continuation_token or sink or shard:
+                # 多个分片写入同一前缀时，清单与快照的文件名带上分片标识
+                label = shard.label("apps") if shard else "apps"
+                if shard:
+                    manifest["shard"] = shard.describe("export_all_apps")
+                if store:
+                    manifest["snapshot_key"] = store.commit(label)
+                if sink:
+                    manifest["sink"] = sink.describe()
+                    manifest["manifest_key"] = put_manifest(sink, label, manifest)
+                yield self.create_json_message(manifest)
+            self.manifest = manifest
+
         except Exception as e:
             error_msg = f"Export All Apps failed: {str(e)}"
             logger.error(error_msg)
             yield self.create_text_message(error_msg)
+
+    def _dry_run(self, client: DifyClient, plan: ExecutionPlan, apps: list, version_type: str) -> Generator[ToolInvokeMessage, None, None]:
+        """试运行：抽样导出少量应用（按类型分散抽取），推算全部应用的版本数、请求数、数据量与耗时"""
+        plan.record_listing()
+        sample = plan.sample(
+            "apps",
+            sample_units(apps, key=lambda app: app.get("mode") or ""),
+            lambda app: self._sample_app(client, app, version_type),
+            client.max_workers(EXPORT),
+        )
+        plan.add_count("apps", len(apps))
+        plan.extrapolate(sample, len(apps), counts=("versions",))
+        yield self.create_text_message(plan.summary_text({"apps": "应用", "versions": "版本"}))
+        yield self.create_json_message(plan.to_dict())
+
+    def _sample_app(self, client: DifyClient, app: dict, version_type: str) -> dict:
+        """试运行抽样（在工作线程中执行）：导出应用的目标版本，只统计版本数与 DSL 字节数"""
+        versions = client.get_versions_to_export(app.get("id"), app.get("name"), version_type)
+        nbytes = 0
+        for ver in versions:
+            dsl_content = client.export_dsl(app.get("id"), ver["id"])
+            if dsl_content:
+                dsl_yaml = dsl_content if isinstance(dsl_content, str) else yaml.dump(dsl_content, allow_unicode=True, default_flow_style=False, sort_keys=False)
+                nbytes += len(dsl_yaml.encode("utf-8"))
+        return {"versions": len(versions), "bytes": nbytes}
+
+    def _estimate_app_cost(self, app: dict, version_type: str) -> float:
+        """估算应用导出成本（约等于导出请求数）"""
+        if version_type == "draft":
+            return 1.0
+        # 工作流类应用通常有多个已发布版本
+        published = 3.0 if app.get("mode") in ("workflow", "advanced-chat") else 1.0
+        return published + (1.0 if version_type == "all" else 0.0)
+
+    def _export_app(self, client: DifyClient, app: dict, version_type: str, reservation: Reservation, sink: ArtifactSink | None = None, store: ChunkStore | None = None, app_stem: str | None = None, file_names: NameIndex | None = None) -> tuple[list, Reservation]:
+        """导出单个应用的所有目标版本（在工作线程中执行）
+
+        返回 JSON 条目列表与其占用的内存预留，调用方发送完毕后释放预留。
+        文件名由 app_stem（去重后的应用名）与版本名组成，并在 file_names 中去重。
+        指定存储时 DSL 直接在工作线程中写入存储，条目中以 object_key 代替 dsl 内容；
+        dedup 模式下写入分块仓库，条目中为快照内的 path 与 sha256。
+        """
+        app_id = app.get("id")
+        app_name = app.get("name")
+        app_mode = app.get("mode", "unknown")
+
+        # 获取该应用要导出的版本列表
+        versions = client.get_versions_to_export(app_id, app_name, version_type)
+
+        json_items = []
+        try:
+            for ver in versions:
+                dsl_content = client.export_dsl(app_id, ver["id"], reservation=reservation)
+
+                if dsl_content:
+                    filename = client.generate_filename(app_stem or app_name, ver["display_name"])
+                    if file_names is not None:
+                        filename = file_names.claim(filename, f"{app_id}/{ver['id']}")
+
+                    # 保持原始 YAML 格式
+                    dsl_yaml = dsl_content if isinstance(dsl_content, str) else yaml.dump(dsl_content, allow_unicode=True, default_flow_style=False, sort_keys=False)
+
+                    json_item = {
+                        "id": app_id,
+                        "name": app_name,
+                        "mode": app_mode,
+                        "version": ver["version"],
+                        "filename": filename,
+                    }
+                    # 记录摘要，verify_backup 据此校验备份
+                    dsl_bytes = dsl_yaml.encode("utf-8")
+                    json_item["sha256"] = hashlib.sha256(dsl_bytes).hexdigest()
+                    if store:
+                        json_item["path"] = f"apps/{filename}"
+                        json_item["size"] = len(dsl_bytes)
+                        store.put_bytes(json_item["path"], dsl_bytes)
+                    elif sink:
+                        json_item["object_key"] = sink.key_for("apps", filename)
+                        json_item["size"] = len(dsl_bytes)
+                        sink.put_bytes(json_item["object_key"], dsl_bytes, "application/x-yaml")
+                    else:
+                        json_item["dsl"] = dsl_yaml
+                    json_items.append(json_item)
+                    logger.info(f"[{app_name}] 成功导出版本: {ver['version']}")
+                else:
+                    logger.warning(f"[{app_name}] 导出失败: {ver['display_name']}")
+        except Exception:
+            reservation.release()
+            raise
+
+        return json_items, reservation
@@ -1,12 +1,19 @@
 from collections.abc import Generator
 from typing import Any
 import logging
+import re
 import yaml
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.concurrency import EXPORT, LISTING, iter_concurrent
 from provider.dify_backup import DifyClient
+from provider.http_cache import HttpCache
+from provider.memory import MemoryBudget
+from provider.naming import NameIndex, safe_name
+from provider.progress import ProgressTracker
+from provider.sinks import create_sink
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -14,87 +21,131 @@ logger.addHandler(plugin_logger_handler)
 
 
 class ExportAppTool(Tool):
+    """
+    Tool for exporting the DSL of one or more selected Dify applications
+    """
+
     def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
         """
-        Export a specific Dify application DSL.
+        Export specific Dify application DSLs, sharing one client across all selected apps.
         """
         # Get parameters
-        app_selector_value = tool_parameters.get("app_identifier")
         version_type = tool_parameters.get("version_type", "draft")
-        
-        if not app_selector_value:
-            yield self.create_text_message("Error: app_identifier is required")
-            return
-        
-        # 提取 app_id
-        if isinstance(app_selector_value, dict):
-            app_id = app_selector_value.get("app_id", "")
-        else:
-            app_id = str(app_selector_value).strip()
-        
-        if not app_id:
-            yield self.create_text_message("Error: Invalid app_identifier")
+        app_ids = _parse_app_ids(tool_parameters.get("app_identifier"), tool_parameters.get("app_ids"))
+
+        if not app_ids:
+            yield self.create_text_message("Error: app_identifier or app_ids is required")
             return
 
         # Get credentials
         base_url = self.runtime.credentials.get("dify_base_url", "")
         email = self.runtime.credentials.get("email", "")
         password = self.runtime.credentials.get("password", "")
+        use_cache = bool(tool_parameters.get("use_cache", False))
 
         if not base_url or not email or not password:
             yield self.create_text_message("Error: Provider credentials not configured")
             return
 
         try:
-            # 初始化 Client (会自动登录)
-            client = DifyClient(base_url, email, password)
-            
-            # 获取应用信息（用于名字）
-            app_info = client.get_app_info(app_id)
-            if not app_info:
-                yield self.create_text_message(f"Error: App {app_id} not found")
-                return
-            
-            app_name = app_info.get("name", "Unknown")
-            app_mode = app_info.get("mode", "Unknown")
-            
-            # 获取导出版本列表
-            versions = client.get_versions_to_export(app_id, app_name, version_type)
-            
-            exported_files = []
-            exported_count = 0
-            
-            for ver in versions:
-                # 导出 DSL
-                dsl_content = client.export_dsl(app_id, ver["id"])
-                
-                if dsl_content:
-                    filename = client.generate_filename(app_name, ver["display_name"])
-                    
-                    # 保持原始 YAML 格式
-                    dsl_yaml = dsl_content if isinstance(dsl_content, str) else yaml.dump(dsl_content, allow_unicode=True, default_flow_style=False, sort_keys=False)
-                    
-                    json_item = {
-                        "id": app_id,
-                        "name": app_name,
-                        "mode": app_mode,
-                        "version": ver["version"],
-                        "filename": filename,
-                        "dsl": dsl_yaml
-                    }
-                    exported_files.append(json_item)
-                    exported_count += 1
-                    
-                    # 实时返回 JSON
-                    yield self.create_json_message(json_item)
-                    logger.info(f"成功导出: {filename}")
+            sink = create_sink(tool_parameters.get("sink"), self.runtime.credentials, tool_parameters.get("sink_prefix"))
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
+        try:
+            # 初始化 Client (会自动登录)，所有应用共用同一个 client 与限流器
+            client = DifyClient(
+                base_url,
+                email,
+                password,
+                cache=HttpCache.shared() if use_cache else None,
+            )
+
+            # 第一轮：并发获取各应用信息与版本列表
+            discovered = {}
+            failed_apps = []
+            for app_id, result, error in iter_concurrent(
+                lambda app_id: self._discover_app(client, app_id, version_type),
+                app_ids,
+                client.max_workers(LISTING),
+            ):
+                if error is not None:
+                    logger.error(f"获取应用 {app_id} 信息失败: {str(error)}")
+                    failed_apps.append(f"{app_id}: {str(error)}")
+                elif result is None:
+                    failed_apps.append(f"{app_id}: not found")
                 else:
+                    discovered[app_id] = result
+
+            if len(app_ids) == 1 and not discovered:
+                yield self.create_text_message(f"Error: App {app_ids[0]} not found")
+                return
+
+            # 按输入顺序预先分配文件名：同名应用、同名版本追加稳定的后缀，与完成顺序无关
+            app_names = NameIndex()
+            file_names = NameIndex()
+            tasks = []
+            for app_id in app_ids:
+                if app_id not in discovered:
+                    continue
+                app_info, versions = discovered[app_id]
+                app_stem = app_names.claim(safe_name(app_info.get("name")), app_id, split_extension=False)
+                for ver in versions:
+                    filename = file_names.claim(client.generate_filename(app_stem, ver["display_name"]), f"{app_id}/{ver['id']}")
+                    tasks.append((app_info, ver, filename))
+
+            memory = MemoryBudget.shared()
+            memory.reset_peak()
+            # 单个应用版本数通常很少，每 5 个版本（或 15 秒）才输出一次进度
+            progress = ProgressTracker(len(tasks), unit="版本", every_items=5)
+
+            # 第二轮：所有应用的版本一起并发导出，每完成一个版本立即返回
+            exported_versions = {app_id: 0 for app_id in discovered}
+            for task, result, error in iter_concurrent(
+                lambda task: self._export_version(client, *task, memory.reserve(), sink),
+                tasks,
+                client.max_workers(EXPORT),
+            ):
+                app_info, ver, filename = task
+                if error is not None:
+                    logger.error(f"[{app_info.get('name')}] 导出版本 {ver['display_name']} 出错: {str(error)}")
+                    failed_apps.append(f"{app_info.get('name')} ({ver['display_name']}): {str(error)}")
+                elif result is None:
                     logger.warning(f"Failed to export content for {ver['display_name']}")
+                else:
+                    json_item, reservation = result
+                    with reservation:
+                        # 实时返回 JSON
+                        yield self.create_json_message(json_item)
+                    exported_versions[app_info.get("id")] += 1
+                    logger.info(f"成功导出: {filename}")
+
+                progress_text = progress.advance(nbytes=result[0].get("size", 0) if result else 0)
+                if progress_text:
+                    yield self.create_text_message(progress_text)
 
             # 返回摘要
+            exported_count = sum(exported_versions.values())
             if exported_count > 0:
-                summary = f"✅ 成功导出应用: {app_name}\n"
+                if len(app_ids) == 1:
+                    app_info = discovered[app_ids[0]][0]
+                    summary = f"✅ 成功导出应用: {app_info.get('name', 'Unknown')}\n"
+                else:
+                    exported_apps = sum(1 for count in exported_versions.values() if count)
+                    summary = f"✅ 成功导出应用: {exported_apps} / {len(app_ids)} 个\n"
                 summary += f"数量: {exported_count} 个版本\n"
+                if sink:
+                    summary += f"📦 输出位置: {sink.location_text()}\n"
+                cache_stats = client.cache_stats_text()
+                if cache_stats:
+                    summary += f"{cache_stats}\n"
+                if failed_apps:
+                    summary += f"\n❌ 部分应用处理失败:\n"
+                    for err in failed_apps[:10]:
+                        summary += f"- {err}\n"
+                    if len(failed_apps) > 10:
+                        summary += f"... (共 {len(failed_apps)} 个错误)"
                 yield self.create_text_message(summary)
             else:
                 yield self.create_text_message(f"未能导出任何版本 (Type: {version_type})")
@@ -103,3 +154,56 @@ class ExportAppTool(Tool):
             error_msg = f"Export failed: {str(e)}"
             logger.error(error_msg)
             yield self.create_text_message(error_msg)
+
+    def _discover_app(self, client: DifyClient, app_id: str, version_type: str) -> tuple[dict, list] | None:
+        """获取应用信息与待导出的版本列表（在工作线程中执行），应用不存在时返回 None"""
+        app_info = client.get_app_info(app_id)
+        if not app_info:
+            return None
+        app_info.setdefault("id", app_id)
+        versions = client.get_versions_to_export(app_id, app_info.get("name", "Unknown"), version_type, app_info=app_info)
+        return app_info, versions
+
+    def _export_version(self, client: DifyClient, app_info: dict, ver: dict, filename: str, reservation, sink) -> tuple | None:
+        """导出单个版本（在工作线程中执行），返回 JSON 条目与内存预留；导出失败时返回 None"""
+        try:
+            dsl_content = client.export_dsl(app_info["id"], ver["id"], reservation=reservation)
+            if not dsl_content:
+                reservation.release()
+                return None
+
+            # 保持原始 YAML 格式
+            dsl_yaml = dsl_content if isinstance(dsl_content, str) else yaml.dump(dsl_content, allow_unicode=True, default_flow_style=False, sort_keys=False)
+            dsl_bytes = dsl_yaml.encode("utf-8")
+
+            json_item = {
+                "id": app_info["id"],
+                "name": app_info.get("name", "Unknown"),
+                "mode": app_info.get("mode", "Unknown"),
+                "version": ver["version"],
+                "filename": filename,
+                "size": len(dsl_bytes),
+            }
+            if sink:
+                # 写入存储，只返回对象键
+                json_item["object_key"] = sink.key_for("apps", filename)
+                sink.put_bytes(json_item["object_key"], dsl_bytes, "application/x-yaml")
+            else:
+                json_item["dsl"] = dsl_yaml
+            return json_item, reservation
+        except Exception:
+            reservation.release()
+            raise
+
+
+def _parse_app_ids(selector: Any, app_ids_text: str | None) -> list:
+    """合并下拉选择的应用与 app_ids 中的应用 ID（逗号、空白或换行分隔），按首次出现顺序去重"""
+    selectors = selector if isinstance(selector, list) else [selector]
+    app_ids = []
+    for value in selectors:
+        if isinstance(value, dict):
+            value = value.get("app_id", "")
+        if value:
+            app_ids.append(str(value).strip())
+    app_ids.extend(re.split(r"[\s,;]+", (app_ids_text or "").strip()))
+    return list(dict.fromkeys(app_id for app_id in app_ids if app_id))
@@ -0,0 +1,368 @@
+from collections.abc import Generator
+from datetime import date, timedelta
+from typing import Any
+import gzip
+import json
+import logging
+import time
+import tempfile
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+from dify_plugin.config.logger_format import plugin_logger_handler
+from provider import fast_json
+from provider.blob_stream import iter_blob_chunks
+from provider.concurrency import HEARTBEAT, LISTING, iter_concurrent
+from provider.deadline import (
+    DEFERRED,
+    DeadlineScheduler,
+    decode_continuation_token,
+    encode_continuation_token,
+)
+from provider.dify_backup import DifyClient
+from provider.memory import MemoryBudget, Reservation
+from provider.naming import NameIndex, safe_name
+from provider.partitions import (
+    PARTITION_GRANULARITIES,
+    app_created_date,
+    parse_date,
+    time_partitions,
+)
+from provider.progress import ProgressTracker
+from provider.sinks import ArtifactSink, create_sink, put_manifest
+from provider.verify import HashingReader
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+# 有会话日志的应用类型（workflow 应用的运行记录不属于会话）
+CONVERSATION_MODES = ('chat', 'agent-chat', 'advanced-chat', 'completion')
+
+# 每个分区的压缩 JSONL 在内存中缓冲的上限，超出部分落盘
+CONVERSATION_SPOOL_BYTES = 4 * 1024 * 1024
+
+# 应用没有 created_at 且未指定开始日期时，向前导出的天数
+DEFAULT_LOOKBACK_DAYS = 30
+
+
+class ExportConversationsTool(Tool):
+    """
+    Tool for exporting conversation and message logs as compressed JSONL, partitioned by time
+    """
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Export conversations and messages of one or all conversational apps, one gzip JSONL file per app and time partition
+        """
+        # 时间预算从调用开始计算，登录与列表请求也计入
+        started_at = time.monotonic()
+        app_selector_value = tool_parameters.get("app_identifier")
+        app_id = app_selector_value.get("app_id", "") if isinstance(app_selector_value, dict) else str(app_selector_value or "").strip()
+        start_date = tool_parameters.get("start_date")
+        end_date = tool_parameters.get("end_date")
+        granularity = tool_parameters.get("partition") or "day"
+        time_budget = tool_parameters.get("time_budget_seconds")
+        continuation_token = (tool_parameters.get("continuation_token") or "").strip()
+        sink_type = tool_parameters.get("sink")
+        sink_prefix = tool_parameters.get("sink_prefix")
+
+        # 续传时沿用上一次调用的参数（含解析后的日期范围与存储位置），只处理剩余分区
+        pending_units = None
+        if continuation_token:
+            try:
+                state = decode_continuation_token(continuation_token, "export_conversations")
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            app_id = state["params"].get("app_id", app_id)
+            start_date = state["params"].get("start_date", start_date)
+            end_date = state["params"].get("end_date", end_date)
+            granularity = state["params"].get("partition", granularity)
+            sink_type = state["params"].get("sink", sink_type)
+            sink_prefix = state["params"].get("sink_prefix", sink_prefix)
+            pending_units = set(state["remaining"])
+
+        try:
+            start_date = parse_date(start_date, "start_date")
+            end_date = parse_date(end_date, "end_date") or date.today()
+            if granularity not in PARTITION_GRANULARITIES:
+                raise ValueError(f"partition must be one of {', '.join(PARTITION_GRANULARITIES)}")
+            if start_date and start_date > end_date:
+                raise ValueError("start_date must not be later than end_date")
+            sink = create_sink(sink_type, self.runtime.credentials, sink_prefix)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
+        base_url = self.runtime.credentials.get("dify_base_url", "")
+        email = self.runtime.credentials.get("email", "")
+        password = self.runtime.credentials.get("password", "")
+
+        if not base_url or not email or not password:
+            yield self.create_text_message("Error: Provider credentials not configured")
+            return
+
+        try:
+            # 初始化 Client (会自动登录)；会话日志不走 HTTP 缓存
+            client = DifyClient(base_url, email, password)
+
+            if app_id:
+                app_info = client.get_app_info(app_id)
+                if not app_info:
+                    yield self.create_text_message(f"Error: App {app_id} not found")
+                    return
+                app_info.setdefault("id", app_id)
+                all_apps = [app_info]
+            else:
+                all_apps = client.get_all_apps(limit=100, mode="all")
+            apps = [app for app in all_apps if app.get("mode") in CONVERSATION_MODES]
+            if app_id and not apps:
+                yield self.create_text_message(f"Error: App {app_id} ({all_apps[0].get('mode')}) has no conversation logs")
+                return
+            logger.info(f"{len(apps)} 个应用包含会话日志（共 {len(all_apps)} 个应用）")
+
+            # 按完整列表顺序分配目录名，同名应用追加稳定的后缀
+            app_names = NameIndex()
+            units = []
+            for app in apps:
+                app_stem = app_names.claim(safe_name(app.get("name")), app.get("id"), split_extension=False)
+                app_start = start_date or app_created_date(app) or end_date - timedelta(days=DEFAULT_LOOKBACK_DAYS - 1)
+                for label, first, last in time_partitions(min(app_start, end_date), end_date, granularity):
+                    units.append({"app": app, "stem": app_stem, "label": label, "start": first, "end": last})
+            if pending_units is not None:
+                units = [unit for unit in units if _unit_key(unit) in pending_units]
+                logger.info(f"续传模式：剩余 {len(units)} 个分区待导出")
+
+            memory = MemoryBudget.shared()
+            memory.reset_peak()
+
+            progress = ProgressTracker(len(units), unit="分区", activity_unit="条消息")
+
+            export_one = lambda unit: self._export_partition(client, unit, memory.reserve(), sink, progress)
+
+            # 指定时间预算时，截止前来不及开始的分区留给下一次调用
+            scheduler = None
+            if time_budget:
+                scheduler = DeadlineScheduler(float(time_budget), started_at=started_at)
+                export_one = scheduler.wrap(export_one, lambda unit: 1.0)
+
+            partitions = []
+            failed_partitions = []
+            resumed_count = 0
+            totals = {}
+
+            # 各分区并发导出，实际并发由 client 的自适应限流器控制；
+            # 长时间没有分区完成时（消息很多的分区）按进度间隔输出心跳
+            for unit, result, error in iter_concurrent(export_one, units, client.max_workers(LISTING), heartbeat=progress.every_seconds):
+                if unit is HEARTBEAT:
+                    progress_text = progress.heartbeat()
+                    if progress_text:
+                        yield self.create_text_message(progress_text)
+                    continue
+                app = unit["app"]
+                if result is DEFERRED:
+                    progress.adjust_total(-1)
+                    continue
+
+                if error is not None:
+                    logger.error(f"[{app.get('name')}] 分区 {unit['label']} 导出失败: {str(error)}")
+                    failed_partitions.append({"app_id": app.get("id"), "partition": unit["label"], "error": str(error)})
+                    progress_text = progress.advance()
+                    if progress_text:
+                        yield self.create_text_message(progress_text)
+                    continue
+
+                entry, spool, reservation = result
+                with reservation:
+                    if spool is not None:
+                        # 未指定存储时分块返回压缩文件，同时计算摘要
+                        with spool:
+                            reader = HashingReader(spool)
+                            yield from iter_blob_chunks(
+                                reader,
+                                entry["size"],
+                                meta={"mime_type": "application/gzip", "filename": f"{unit['stem']}-{unit['label']}.jsonl.gz"},
+                            )
+                        entry["sha256"] = reader.hexdigest()
+
+                if entry.get("resumed"):
+                    resumed_count += 1
+                app_totals = totals.setdefault(app.get("id"), {"conversation_count": 0, "message_count": 0})
+                app_totals["conversation_count"] += entry["conversation_count"]
+                app_totals["message_count"] += entry["message_count"]
+                if entry["conversation_count"]:
+                    partitions.append(entry)
+                    yield self.create_json_message(entry)
+
+                progress_text = progress.advance(nbytes=entry.get("size", 0))
+                if progress_text:
+                    yield self.create_text_message(progress_text)
+
+            logger.info(f"限流器状态: {client.limiters.snapshot()}")
+
+            deferred_units = [_unit_key(unit) for unit in scheduler.deferred] if scheduler else []
+            next_token = None
+            if deferred_units:
+                next_token = encode_continuation_token(
+                    "export_conversations",
+                    deferred_units,
+                    {
+                        "app_id": app_id,
+                        "start_date": start_date.isoformat() if start_date else None,
+                        "end_date": end_date.isoformat(),
+                        "partition": granularity,
+                        **({"sink": sink_type, "sink_prefix": sink.prefix} if sink else {}),
+                    },
+                )
+
+            total_conversations = sum(t["conversation_count"] for t in totals.values())
+            total_messages = sum(t["message_count"] for t in totals.values())
+
+            # 返回摘要信息
+            summary_text = f"✅ 会话日志导出完成\n\n"
+            summary_text += f"应用数: {len(apps)}\n"
+            summary_text += f"分区: {len(partitions)} 个有数据（按{PARTITION_GRANULARITIES[granularity]}划分，截至 {end_date.isoformat()}）\n"
+            if resumed_count:
+                summary_text += f"检查点复用: {resumed_count} 个分区\n"
+            summary_text += f"会话数: {total_conversations}\n"
+            summary_text += f"消息数: {total_messages}\n"
+            summary_text += f"{memory.stats_text()}\n"
+            if sink:
+                summary_text += f"📦 输出位置: {sink.location_text()}\n"
+
+            if failed_partitions:
+                summary_text += f"\n❌ 部分分区导出失败:\n"
+                for failure in failed_partitions[:10]:
+                    summary_text += f"- {failure['app_id']} / {failure['partition']}: {failure['error']}\n"
+                if len(failed_partitions) > 10:
+                    summary_text += f"... (共 {len(failed_partitions)} 个错误)\n"
+                if sink:
+                    summary_text += "使用相同的 sink_prefix 重新运行即可只补导失败的分区。\n"
+
+            if deferred_units:
+                summary_text += f"\n⏱️ 时间预算已用尽，剩余 {len(deferred_units)} 个分区未导出。\n"
+                summary_text += "请使用清单中的 continuation_token 再次调用以继续导出。\n"
+
+            yield self.create_text_message(summary_text)
+
+            manifest = {
+                "complete": not deferred_units and not failed_partitions,
+                "start_date": start_date.isoformat() if start_date else None,
+                "end_date": end_date.isoformat(),
+                "partition": granularity,
+                "apps": [
+                    {"id": app.get("id"), "name": app.get("name"), "mode": app.get("mode"), **totals.get(app.get("id"), {"conversation_count": 0, "message_count": 0})}
+                    for app in apps
+                ],
+                "partitions": sorted(partitions, key=lambda entry: (entry["app_id"], entry["start"])),
+                "failed_partitions": failed_partitions,
+                "deferred_partitions": deferred_units,
+                "continuation_token": next_token,
+            }
+            if sink:
+                manifest["sink"] = sink.describe()
+                manifest["manifest_key"] = put_manifest(sink, "conversations", manifest)
+            yield self.create_json_message(manifest)
+
+        except Exception as e:
+            error_msg = f"Export Conversations failed: {str(e)}"
+            logger.error(error_msg)
+            yield self.create_text_message(error_msg)
+
+    def _export_partition(self, client: DifyClient, unit: dict, reservation: Reservation, sink: ArtifactSink | None = None, progress: ProgressTracker | None = None) -> tuple[dict, Any, Reservation]:
+        """导出一个应用在一个时间分区内的会话与消息（在工作线程中执行）
+
+        逐页拉取并直接写入 gzip 压缩的 JSONL，内存中只保留当前一页，超过
+        CONVERSATION_SPOOL_BYTES 的部分落盘。每行为一条记录：
+        {"type": "conversation", "data": 会话} 或
+        {"type": "message", "conversation_id": 会话 ID, "data": 消息}。
+
+        指定存储时在工作线程中写入存储；已结束且有数据的分区随后写入检查点，
+        使用相同前缀重新运行时直接复用，不再请求接口。
+
+        Returns:
+            (分区条目, 未指定存储时的压缩文件 spool, 内存预留)
+        """
+        app = unit["app"]
+        app_id = app.get("id")
+        filename = f"conversations/{unit['stem']}/{unit['label']}.jsonl.gz"
+        # 结束时间在最近一天之内的分区可能还会产生新会话（账号时区与本地时区可能不同），不写检查点
+        closed = unit["end"] < date.today() - timedelta(days=1)
+        checkpoint_key = sink.key_for("conversations", "_checkpoints", app_id, f"{unit['label']}.json") if sink else None
+
+        if checkpoint_key and closed and sink.exists(checkpoint_key):
+            entry = json.loads(sink.get(checkpoint_key))
+            entry["resumed"] = True
+            return entry, None, reservation
+
+        entry = {
+            "app_id": app_id,
+            "app_name": app.get("name"),
+            "partition": unit["label"],
+            "start": unit["start"].isoformat(),
+            "end": unit["end"].isoformat(),
+            "filename": filename,
+            "conversation_count": 0,
+            "message_count": 0,
+            "closed": closed,
+        }
+
+        # 一次性预留内存缓冲上限，避免多个增长中的预留互相等待
+        reservation.resize(CONVERSATION_SPOOL_BYTES)
+        spool = tempfile.SpooledTemporaryFile(max_size=CONVERSATION_SPOOL_BYTES)
+        try:
+            with gzip.GzipFile(fileobj=spool, mode="wb", mtime=0) as output:
+                for conversations in client.iter_conversations(
+                    app_id,
+                    app.get("mode"),
+                    start=f"{unit['start'].isoformat()} 00:00",
+                    end=f"{unit['end'].isoformat()} 23:59",
+                ):
+                    for conversation in conversations:
+                        output.write(fast_json.dumps_line({"type": "conversation", "data": conversation}))
+                        entry["conversation_count"] += 1
+                        if app.get("mode") == "completion":
+                            # 文本生成应用每个会话只有一条消息，已包含在会话详情中
+                            entry["message_count"] += 1 if conversation.get("message") else 0
+                            if progress:
+                                progress.tick(1 if conversation.get("message") else 0)
+                            continue
+                        for messages in client.iter_conversation_messages(app_id, conversation.get("id")):
+                            for message in messages:
+                                output.write(fast_json.dumps_line({"type": "message", "conversation_id": conversation.get("id"), "data": message}))
+                            entry["message_count"] += len(messages)
+                            if progress:
+                                progress.tick(len(messages))
+
+            entry["size"] = spool.tell()
+            # 只有未落盘的部分占用内存
+            reservation.resize(min(entry["size"], CONVERSATION_SPOOL_BYTES))
+
+            if not entry["conversation_count"]:
+                spool.close()
+                reservation.release()
+            elif sink:
+                spool.seek(0)
+                with spool:
+                    reader = HashingReader(spool)
+                    entry["object_key"] = sink.key_for(filename)
+                    sink.put(entry["object_key"], reader, entry["size"], "application/gzip")
+                entry["sha256"] = reader.hexdigest()
+                reservation.release()
+            else:
+                spool.seek(0)
+                return entry, spool, reservation
+        except Exception:
+            spool.close()
+            reservation.release()
+            raise
+
+        # 空分区重新检查只需一次请求，与读取检查点相当，不写检查点
+        if checkpoint_key and closed and entry["conversation_count"]:
+            sink.put_bytes(checkpoint_key, json.dumps(entry, ensure_ascii=False).encode("utf-8"), "application/json")
+        return entry, None, reservation
+
+
+def _unit_key(unit: dict) -> str:
+    return f"{unit['app'].get('id')}/{unit['label']}"
@@ -1,14 +1,39 @@
-from collections.abc import Generator
-from typing import Any
+from collections.abc import Generator, Iterator
+from typing import Any, BinaryIO
 import logging
 import zipfile
+import csv
 import io
+import json
+import math
 import re
+import shutil
+import tempfile
+import threading
+import time
 
 from dify_plugin import Tool
 from dify_plugin.entities.tool import ToolInvokeMessage
 from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.blob_stream import iter_blob_chunks
+from provider.chunk_store import ChunkStore, create_chunk_store
+from provider.concurrency import DOWNLOAD, HEARTBEAT, LISTING, iter_concurrent
+from provider.csv_safety import sanitize_csv_value
+from provider.deadline import (
+    DEFERRED,
+    DeadlineScheduler,
+    decode_continuation_token,
+    encode_continuation_token,
+)
 from provider.dify_backup import DifyClient
+from provider.http_cache import HttpCache
+from provider.memory import MemoryBudget, Reservation, SpooledBuffer
+from provider.naming import NameIndex, safe_name
+from provider.planning import ExecutionPlan, sample_units
+from provider.progress import ProgressTracker
+from provider.sharding import Shard
+from provider.sinks import ArtifactSink, put_manifest
+from provider.verify import HashingReader
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -32,20 +57,6 @@ MIME_EXT_MAP = {
 }
 
 
-def _safe_name(name: str) -> str:
-    """将名称转换为文件系统安全的字符串，保留中文"""
-    safe = (
-        "".join(
-            c
-            for c in name
-            if c.isalnum() or c in (" ", "-", "_", ".") or "\u4e00" <= c <= "\u9fff"
-        )
-        .strip()
-        .replace(" ", "_")
-    )
-    return safe or "unknown"
-
-
 def _ext_from_mime(mime: str, original_name: str = "") -> str:
     """根据 MIME 或原始文件名推断扩展名"""
     # 先从原始文件名取扩展名
@@ -60,47 +71,201 @@ def _ext_from_mime(mime: str, original_name: str = "") -> str:
 
 def _build_zip_entry_name(original_name: str, mime: str = "") -> str:
     """生成 ZIP 内文件名，避免重复拼接扩展名。"""
-    safe_name = _safe_name(original_name)
+    safe = safe_name(original_name, keep_dots=True)
     ext = _ext_from_mime(mime, original_name)
 
-    if safe_name.lower().endswith(ext.lower()):
-        return safe_name
+    if safe.lower().endswith(ext.lower()):
+        return safe
+
+    if "." in safe:
+        safe = safe.rsplit(".", 1)[0]
+
+    return f"{safe}{ext}"
+
+
+def _segments_entry_name(doc_name: str) -> str:
+    """非文件文档的分段 JSONL 在 ZIP 内的文件名"""
+    return f"segments/{safe_name(doc_name, keep_dots=True)}.jsonl"
+
+
+def _document_entry_names(doc: dict) -> tuple[str, str]:
+    """文档在 ZIP 内的原始文件名与分段 JSONL 文件名（申请去重前）
+
+    只取自文档列表中的字段：原始文件名缺少扩展名时按列表中上传文件的 MIME 补全，
+    不依赖下载结果，文件名可以在下载前一次性分配。
+    """
+    doc_name = doc.get("name", "unknown")
+    upload_file = (doc.get("data_source_detail_dict") or {}).get("upload_file") or {}
+    return (
+        _build_zip_entry_name(doc_name, upload_file.get("mime_type") or ""),
+        _segments_entry_name(doc_name),
+    )
+
+
+# 分段 JSONL 在内存中缓冲的上限，超出后落盘
+SEGMENT_SPOOL_BYTES = 4 * 1024 * 1024
+
+# 知识库 ZIP 与清单文件在内存中缓冲的上限，超出后落盘
+ZIP_SPOOL_BYTES = 8 * 1024 * 1024
+
+# metadata 模式下清单的列
+INVENTORY_FIELDS = [
+    "dataset_id",
+    "dataset_name",
+    "document_id",
+    "document_name",
+    "data_source_type",
+    "indexing_status",
+    "enabled",
+    "archived",
+    "word_count",
+    "tokens",
+    "size",
+    "created_at",
+    "updated_at",
+]
+
+
+def _inventory_row(dataset: dict, doc: dict) -> dict:
+    """提取文档元数据生成清单行"""
+    upload_file = (doc.get("data_source_detail_dict") or {}).get("upload_file") or {}
+    return {
+        "dataset_id": dataset.get("id"),
+        "dataset_name": dataset.get("name"),
+        "document_id": doc.get("id"),
+        "document_name": doc.get("name"),
+        "data_source_type": doc.get("data_source_type"),
+        "indexing_status": doc.get("indexing_status"),
+        "enabled": doc.get("enabled"),
+        "archived": doc.get("archived"),
+        "word_count": doc.get("word_count"),
+        "tokens": doc.get("tokens"),
+        "size": upload_file.get("size"),
+        "created_at": doc.get("created_at"),
+        "updated_at": doc.get("updated_at"),
+    }
+
+
+def _fetched_size(fetched: tuple) -> int:
+    """_fetch_document 结果的数据字节数"""
+    return fetched[1].size
 
-    if "." in safe_name:
-        safe_name = safe_name.rsplit(".", 1)[0]
 
-    return f"{safe_name}{ext}"
+def _estimate_dataset_cost(dataset: dict) -> float:
+    """估算知识库导出成本：列表请求 + 每个文档一次下载"""
+    return 1.0 + float(dataset.get("document_count") or 0)
 
 
 class ExportDatasetsTool(Tool):
     """
     Tool for exporting Dify knowledge base (dataset) files as ZIP archives.
     Supports multi-select datasets; defaults to all datasets.
+
+    After a completed files-mode run ``manifest`` holds the returned manifest,
+    so callers such as the multi-workspace export can check failures.
+    A caller that pins the account to a workspace sets ``workspace_id`` first; the
+    tool's client is then bound to that workspace.
     """
 
+    manifest: dict | None = None
+    workspace_id: str | None = None
+
     def _invoke(
         self, tool_parameters: dict[str, Any]
     ) -> Generator[ToolInvokeMessage, None, None]:
         """
         Export selected datasets as ZIP files and return a file list summary.
         """
+        # 时间预算从调用开始计算，登录与列表请求也计入
+        started_at = time.monotonic()
+        self.manifest = None
         dataset_ids_raw = tool_parameters.get("dataset_ids", "").strip()
+        mode = tool_parameters.get("mode") or "files"
+        inventory_format = tool_parameters.get("inventory_format") or "jsonl"
+        time_budget = tool_parameters.get("time_budget_seconds")
+        continuation_token = (tool_parameters.get("continuation_token") or "").strip()
+        sink_type = tool_parameters.get("sink")
+        sink_prefix = tool_parameters.get("sink_prefix")
+        dedup = bool(tool_parameters.get("dedup", False))
+        dry_run = bool(tool_parameters.get("dry_run", False))
+        shard_index = tool_parameters.get("shard_index")
+        shard_count = tool_parameters.get("shard_count")
+
+        # 续传时只处理上一次调用剩余的知识库，并写入同一存储位置（同一分片）
+        if continuation_token:
+            try:
+                state = decode_continuation_token(continuation_token, "export_datasets")
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+            dataset_ids_raw = ",".join(state["remaining"])
+            sink_type = state["params"].get("sink", sink_type)
+            sink_prefix = state["params"].get("sink_prefix", sink_prefix)
+            dedup = state["params"].get("dedup", dedup)
+            shard_index = state["params"].get("shard_index", shard_index)
+            shard_count = state["params"].get("shard_count", shard_count)
+
+        try:
+            shard = Shard.from_parameters(shard_index, shard_count)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+        if dry_run and mode == "metadata":
+            yield self.create_text_message(
+                "Error: dry_run is only supported with mode=files"
+            )
+            return
+        if shard and mode == "metadata":
+            yield self.create_text_message(
+                "Error: shard_index/shard_count are only supported with mode=files"
+            )
+            return
 
         base_url = self.runtime.credentials.get("dify_base_url", "")
         email = self.runtime.credentials.get("email", "")
         password = self.runtime.credentials.get("password", "")
+        use_cache = bool(tool_parameters.get("use_cache", False))
 
         if not base_url or not email or not password:
             yield self.create_text_message("Error: Provider credentials not configured")
             return
 
         try:
-            client = DifyClient(base_url, email, password)
+            sink, store = create_chunk_store(
+                dedup, sink_type, self.runtime.credentials, sink_prefix
+            )
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
+        try:
+            client = DifyClient(
+                base_url,
+                email,
+                password,
+                cache=HttpCache.shared() if use_cache else None,
+                workspace_id=self.workspace_id,
+            )
+
+            memory = MemoryBudget.shared()
+            memory.reset_peak()
+
+            # 试运行从列表请求开始计入执行计划
+            plan = ExecutionPlan("export_datasets", client) if dry_run else None
 
             # ── 1. 确定要导出的知识库 ──────────────────────────────────────
             all_datasets = client.get_all_datasets(limit=100)
             logger.info(f"共获取到 {len(all_datasets)} 个知识库")
 
+            # 按完整列表顺序预先分配目录名，同名知识库追加稳定的后缀（续传时结果相同）
+            dataset_names = NameIndex()
+            for dataset in all_datasets:
+                dataset_names.claim(
+                    safe_name(dataset.get("name", "unknown"), keep_dots=True),
+                    dataset.get("id"),
+                    split_extension=False,
+                )
+
             if dataset_ids_raw:
                 # 解析用户指定的 ID 列表（支持逗号 / 换行 / 空格分隔）
                 requested_ids = {
@@ -115,7 +280,14 @@ class ExportDatasetsTool(Tool):
             else:
                 selected = all_datasets  # 默认全部
 
-            if not selected:
+            if shard:
+                selected = shard.select(selected, lambda dataset: dataset.get("id"))
+                logger.info(
+                    f"分片 {shard.index}/{shard.count}：本次导出 {len(selected)} 个知识库"
+                )
+
+            # 分片可能分不到知识库，仍返回空清单以便合并
+            if not selected and not shard:
                 yield self.create_text_message(
                     "⚠️ 未找到任何知识库，请检查 dataset_ids 参数。"
                 )
@@ -123,150 +295,164 @@ class ExportDatasetsTool(Tool):
 
             logger.info(f"将导出 {len(selected)} 个知识库")
 
-            # ── 2. 逐个知识库打包 ZIP ───────────────────────────────────────
-            total_file_count = 0
-            failed_datasets = []
-            dataset_results = []
-            file_list_lines = []  # 汇总文件清单
+            if plan:
+                yield from self._dry_run(client, plan, selected)
+                return
 
-            for dataset in selected:
-                dataset_id = dataset.get("id")
-                dataset_name = dataset.get("name", "unknown")
-                safe_ds_name = _safe_name(dataset_name)
+            # metadata 模式只生成文档清单，不下载任何文件
+            if mode == "metadata":
+                yield from self._export_inventory(
+                    client, selected, inventory_format, sink
+                )
+                return
 
-                logger.info(f"[{dataset_name}] 开始导出...")
+            # ── 2. 流水线打包 ZIP ───────────────────────────────────────────
+            # 文档列表、文件下载、ZIP 写入与输出分阶段重叠执行：列表阶段提前拉取后续
+            # 知识库的文档列表，下载池在各知识库的文档之间连续调度，下载完的文档由
+            # 工作线程直接写入所属知识库的 ZIP（每个 ZIP 一把锁，同时只有一个写入者）。
+            # 多个知识库的 ZIP 同时在写，最后一个文档写入后立即输出该知识库的 ZIP。
+            # 各阶段在途任务数受 iter_concurrent 的提交窗口限制，下载数据另受内存预算约束
 
-                try:
-                    documents = client.get_dataset_documents(dataset_id, limit=100)
-                    logger.info(f"[{dataset_name}] 共 {len(documents)} 个文档")
+            # 指定时间预算时按文档数从少到多调度，来不及的知识库留给下一次调用
+            scheduler = None
+            if time_budget:
+                scheduler = DeadlineScheduler(float(time_budget), started_at=started_at)
+                selected = scheduler.order(selected, _estimate_dataset_cost)
 
-                    if not documents:
-                        file_list_lines.append(f"📂 {dataset_name}（无文档，跳过）")
-                        dataset_results.append(
-                            {
-                                "dataset_id": dataset_id,
-                                "dataset_name": dataset_name,
-                                "status": "no_documents",
-                                "exported_file_count": 0,
-                            }
-                        )
+            # 进度按文档计，总数先取知识库元数据中的文档数，列出文档后修正
+            progress = ProgressTracker(
+                sum(dataset.get("document_count") or 0 for dataset in selected),
+                unit="文档",
+                activity_unit="个分段",
+            )
+
+            states = []  # 已开始的知识库，按调度顺序
+            ready = []  # 已完成、等待输出的知识库
+
+            # 时间预算按知识库真正开始下载的时刻判断（见 _admit_dataset），
+            # 列表阶段提前拉取的知识库不占用预算
+            def iter_listed() -> Iterator[dict]:
+                for dataset in selected:
+                    # 已有知识库来不及导出时，后面成本更高的知识库也不再列出文档
+                    if scheduler and scheduler.deferred:
+                        scheduler.defer(dataset)
+                        progress.adjust_total(-(dataset.get("document_count") or 0))
                         continue
+                    yield dataset
 
-                    # 在内存中建立 ZIP
-                    zip_buf = io.BytesIO()
-                    doc_file_list = []
-
-                    with zipfile.ZipFile(
-                        zip_buf, mode="w", compression=zipfile.ZIP_DEFLATED
-                    ) as zf:
-                        for doc in documents:
-                            doc_id = doc.get("id")
-                            doc_name = doc.get("name", "unknown")
-                            data_source_type = doc.get("data_source_type", "")
-                            data_source_info = doc.get("data_source_info") or {}
-
-                            file_added = False
-
-                            # ── 尝试下载原始上传文件 ──
-                            if data_source_type in {"upload_file", "file_upload"}:
-                                file_bytes, mime = client.download_document_file(
-                                    dataset_id, doc_id
-                                )
-                                if file_bytes:
-                                    zip_path = _build_zip_entry_name(
-                                        doc_name, mime or ""
-                                    )
-                                    zf.writestr(zip_path, file_bytes)
-                                    doc_file_list.append(zip_path)
-                                    file_added = True
-                                    logger.info(
-                                        f"  ✅ {doc_name} → {zip_path} ({len(file_bytes)} bytes, document download)"
-                                    )
-
-                            if not file_added and data_source_type in {
-                                "upload_file",
-                                "file_upload",
-                            }:
-                                upload_file_id = data_source_info.get(
-                                    "upload_file_id"
-                                ) or data_source_info.get("upload_file", {}).get("id")
-                                if upload_file_id:
-                                    file_bytes, mime = client.download_upload_file(
-                                        upload_file_id
-                                    )
-                                    if file_bytes:
-                                        # 确保 ZIP 内文件名不重复追加扩展名
-                                        zip_path = _build_zip_entry_name(
-                                            doc_name, mime or ""
-                                        )
-                                        zf.writestr(zip_path, file_bytes)
-                                        doc_file_list.append(zip_path)
-                                        file_added = True
-                                        logger.info(
-                                            f"  ✅ {doc_name} → {zip_path} ({len(file_bytes)} bytes, upload file fallback)"
-                                        )
-
-                            if not file_added:
-                                logger.warning(
-                                    f"  ⚠️ {doc_name} 无法获取文件内容，已跳过 (data_source_type={data_source_type or 'unknown'})"
-                                )
-
-                    zip_bytes = zip_buf.getvalue()
-                    zip_filename = f"{safe_ds_name}-documents.zip"
-
-                    if doc_file_list:
-                        # 返回 ZIP blob
-                        yield self.create_blob_message(
-                            blob=zip_bytes,
-                            meta={
-                                "mime_type": "application/zip",
-                                "filename": zip_filename,
-                            },
-                        )
-                        total_file_count += len(doc_file_list)
+            def iter_tasks() -> Iterator[tuple]:
+                listings = iter_concurrent(
+                    lambda dataset: client.get_dataset_documents(
+                        dataset.get("id"), limit=100
+                    ),
+                    iter_listed(),
+                    client.max_workers(LISTING),
+                )
+                for dataset, documents, error in listings:
+                    state = self._open_dataset(
+                        dataset, dataset_names, documents, error, store
+                    )
+                    states.append(state)
+                    progress.adjust_total(
+                        state["pending"] - (dataset.get("document_count") or 0)
+                    )
+                    if state["pending"] == 0:
+                        if not self._admit_dataset(state, scheduler):
+                            continue
+                        self._finish_dataset(state, scheduler, sink, store)
+                        ready.append(state)
+                        continue
+                    for doc in documents:
+                        yield state, doc
 
-                        # 收集文件清单
-                        file_list_lines.append(f"📂 {dataset_name} → {zip_filename}")
-                        for f in doc_file_list:
-                            file_list_lines.append(f"   └─ {f}")
-                        dataset_results.append(
-                            {
-                                "dataset_id": dataset_id,
-                                "dataset_name": dataset_name,
-                                "status": "exported",
-                                "exported_file_count": len(doc_file_list),
-                                "zip_filename": zip_filename,
-                            }
-                        )
-                    else:
-                        file_list_lines.append(
-                            f"📂 {dataset_name}（所有文档均无法获取文件，已跳过）"
-                        )
-                        dataset_results.append(
+            # 每个文档下载前先预留内存，写入 ZIP 后释放；长时间没有文档完成时
+            # （大文件下载、分段很多的文档）按进度间隔输出心跳
+            download_results = iter_concurrent(
+                lambda task: self._pipeline_document(
+                    client, *task, memory.reserve(), scheduler, sink, store, progress
+                ),
+                iter_tasks(),
+                client.max_workers(DOWNLOAD),
+                heartbeat=progress.every_seconds,
+            )
+            for task, result, error in download_results:
+                if task is HEARTBEAT:
+                    progress_text = progress.heartbeat()
+                    if progress_text:
+                        yield self.create_text_message(progress_text)
+                    continue
+                state, doc = task
+                if error is not None:
+                    logger.warning(
+                        f"  ⚠️ {doc.get('name', 'unknown')} 处理出错: {error}"
+                    )
+                if result is DEFERRED:
+                    progress.adjust_total(-1)
+                    continue
+                nbytes, finished = result or (0, False)
+                progress_text = progress.advance(nbytes=nbytes)
+                if progress_text:
+                    yield self.create_text_message(progress_text)
+                if finished:
+                    ready.append(state)
+                while ready:
+                    yield from self._emit_dataset(ready.pop(0))
+            while ready:
+                yield from self._emit_dataset(ready.pop(0))
+
+            # 汇总按调度顺序排列，与各知识库的完成顺序无关；推迟的知识库不计入
+            states = [state for state in states if state["admitted"]]
+            position = {dataset.get("id"): i for i, dataset in enumerate(selected)}
+            states.sort(key=lambda state: position[state["dataset_id"]])
+            total_file_count = 0
+            failed_datasets = []
+            dataset_results = []
+            file_list_lines = []  # 汇总文件清单
+            for state in states:
+                result = state["result"]
+                dataset_results.append(result)
+                total_file_count += result["exported_file_count"]
+                file_list_lines.extend(state["lines"])
+                if result["status"] == "failed":
+                    failed_datasets.append(f"{state['dataset_name']}: {state['error']}")
+
+            deferred_ids = (
+                [d.get("id") for d in scheduler.deferred] if scheduler else []
+            )
+            next_token = None
+            if deferred_ids:
+                next_token = encode_continuation_token(
+                    "export_datasets",
+                    deferred_ids,
+                    {
+                        **(
                             {
-                                "dataset_id": dataset_id,
-                                "dataset_name": dataset_name,
-                                "status": "no_exportable_files",
-                                "exported_file_count": 0,
+                                "sink": sink_type,
+                                "sink_prefix": sink.prefix,
+                                "dedup": dedup,
                             }
-                        )
-
-                except Exception as e:
-                    logger.error(f"[{dataset_name}] 导出失败: {str(e)}")
-                    failed_datasets.append(f"{dataset_name}: {str(e)}")
-                    dataset_results.append(
-                        {
-                            "dataset_id": dataset_id,
-                            "dataset_name": dataset_name,
-                            "status": "failed",
-                            "exported_file_count": 0,
-                        }
-                    )
+                            if sink
+                            else {}
+                        ),
+                        **(shard.to_params() if shard else {}),
+                    },
+                )
 
             # ── 3. 返回汇总文本 ──────────────────────────────────────────────
             summary = f"✅ 知识库文件导出完成\n\n"
-            summary += f"已处理知识库数: {len(selected)}\n"
-            summary += f"总导出文件数: {total_file_count}\n\n"
+            if shard:
+                summary += f"分片: {shard.index}（共 {shard.count} 片）\n"
+            summary += f"已处理知识库数: {len(selected) - len(deferred_ids)}\n"
+            summary += f"总导出文件数: {total_file_count}\n"
+            summary += f"{memory.stats_text()}\n"
+            if sink:
+                summary += f"📦 输出位置: {sink.location_text()}\n"
+            if store:
+                summary += f"{store.stats_text()}\n"
+            cache_stats = client.cache_stats_text()
+            if cache_stats:
+                summary += f"{cache_stats}\n"
+            summary += "\n"
             summary += "📋 文件清单:\n"
             summary += "\n".join(file_list_lines) if file_list_lines else "  （无）"
 
@@ -277,18 +463,608 @@ class ExportDatasetsTool(Tool):
                 if len(failed_datasets) > 10:
                     summary += f"  ... (共 {len(failed_datasets)} 个错误)"
 
+            if deferred_ids:
+                summary += f"\n\n⏱️ 时间预算已用尽，剩余 {len(deferred_ids)} 个知识库未导出。\n"
+                summary += "请使用清单中的 continuation_token 再次调用以继续导出。"
+
             yield self.create_text_message(summary)
 
             # 同时返回 JSON 结构化清单
-            yield self.create_json_message(
-                {
-                    "total_datasets": len(selected),
-                    "total_files": total_file_count,
-                    "datasets": dataset_results,
-                }
-            )
+            manifest = {
+                "total_datasets": len(selected) - len(deferred_ids),
+                "total_files": total_file_count,
+                "datasets": dataset_results,
+                "complete": not deferred_ids,
+                "deferred_dataset_ids": deferred_ids,
+                "continuation_token": next_token,
+            }
+            # 多个分片写入同一前缀时，清单与快照的文件名带上分片标识
+            label = shard.label("datasets") if shard else "datasets"
+            if shard:
+                manifest["shard"] = shard.describe("export_datasets")
+            if store:
+                manifest["snapshot_key"] = store.commit(label)
+            if sink:
+                manifest["sink"] = sink.describe()
+                manifest["manifest_key"] = put_manifest(sink, label, manifest)
+            yield self.create_json_message(manifest)
+            self.manifest = manifest
 
         except Exception as e:
             error_msg = f"Export Datasets failed: {str(e)}"
             logger.error(error_msg)
             yield self.create_text_message(error_msg)
+
+    def _emit_file(
+        self,
+        sink: ArtifactSink | None,
+        fileobj: BinaryIO,
+        size: int,
+        relative_key: str,
+        mime_type: str,
+    ) -> Generator[ToolInvokeMessage, None, str | None]:
+        """发送一个产物文件：未指定存储时分块返回 blob，否则写入存储并返回对象键"""
+        if sink is None:
+            yield from iter_blob_chunks(
+                fileobj,
+                size,
+                meta={"mime_type": mime_type, "filename": relative_key.split("/")[-1]},
+            )
+            return None
+        object_key = sink.key_for(relative_key)
+        sink.put(object_key, fileobj, size, mime_type)
+        return object_key
+
+    def _dry_run(
+        self, client: DifyClient, plan: ExecutionPlan, datasets: list
+    ) -> Generator[ToolInvokeMessage, None, None]:
+        """试运行：抽样下载少量文档，推算全部知识库的请求数、数据量与耗时
+
+        文档数取自知识库列表中的 document_count；文档列表请求数按每页 100 条计算，
+        只为抽样列出少量知识库的文档。数据量为文档原始大小，未计 ZIP 压缩。
+        """
+        plan.record_listing()
+        document_total = sum(dataset.get("document_count") or 0 for dataset in datasets)
+        plan.add_count("datasets", len(datasets))
+        plan.add_count("documents", document_total)
+        plan.add_requests(
+            LISTING,
+            sum(
+                max(1, math.ceil((dataset.get("document_count") or 0) / 100))
+                for dataset in datasets
+            ),
+        )
+
+        # 先列出少量知识库的文档，再按来源类型分散抽取文档下载
+        documents = []
+        for dataset, docs, error in iter_concurrent(
+            lambda dataset: client.get_dataset_documents(dataset.get("id"), limit=100),
+            sample_units(
+                [dataset for dataset in datasets if dataset.get("document_count")]
+            ),
+            client.max_workers(LISTING),
+        ):
+            if error is None:
+                documents.extend((dataset.get("id"), doc) for doc in docs)
+        sample = plan.sample(
+            "documents",
+            sample_units(
+                documents, key=lambda item: item[1].get("data_source_type") or ""
+            ),
+            lambda item: self._sample_document(client, *item),
+            client.max_workers(DOWNLOAD),
+        )
+        plan.extrapolate(sample, document_total)
+        yield self.create_text_message(
+            plan.summary_text({"datasets": "知识库", "documents": "文档"})
+        )
+        yield self.create_json_message(plan.to_dict())
+
+    def _sample_document(self, client: DifyClient, dataset_id: str, doc: dict) -> dict:
+        """试运行抽样（在工作线程中执行）：按正式导出的方式获取文档，只统计字节数"""
+        fetched = self._fetch_document(
+            client, dataset_id, doc, MemoryBudget.shared().reserve()
+        )
+        if fetched is None:
+            return {"bytes": 0}
+        with fetched[-1], fetched[1]:
+            return {"bytes": _fetched_size(fetched)}
+
+    def _open_dataset(
+        self,
+        dataset: dict,
+        dataset_names: NameIndex,
+        documents: list | None,
+        error: Exception | None,
+        store: ChunkStore | None,
+    ) -> dict:
+        """文档列表返回后建立知识库的写入状态
+
+        列表失败或没有文档的知识库 pending 为 0，直接进入完成阶段；
+        否则建立 ZIP（超过 ZIP_SPOOL_BYTES 或内存预算不足时落盘，留在内存中的部分
+        计入内存预算），dedup 模式下文件逐个写入分块仓库，不生成 ZIP。
+        """
+        dataset_id = dataset.get("id")
+        dataset_name = dataset.get("name", "unknown")
+        state = {
+            "dataset": dataset,
+            "dataset_id": dataset_id,
+            "dataset_name": dataset_name,
+            "safe_ds_name": dataset_names.claim(
+                safe_name(dataset_name, keep_dots=True),
+                dataset_id,
+                split_extension=False,
+            ),
+            # 是否已向调度器登记（None 为尚未判断），登记时刻为耗时起点
+            "admitted": None,
+            "started": None,
+            "pending": 0,
+            "error": None,
+            "zip_buf": None,
+            "zip_file": None,
+            "zip_size": None,
+            "lock": threading.Lock(),
+            "doc_file_list": [],
+            # 各文件的 SHA-256，verify_backup 据此校验备份
+            "member_checksums": {},
+            # ZIP 内文件名 → 文档 ID
+            "member_ids": {},
+            "segment_count": 0,
+            "result": None,
+            "lines": [],
+        }
+        if error is not None:
+            logger.error(f"[{dataset_name}] 获取文档列表失败: {str(error)}")
+            state["error"] = str(error)
+            return state
+
+        logger.info(f"[{dataset_name}] 共 {len(documents)} 个文档")
+        if not documents:
+            return state
+
+        # 按文档列表顺序一次性分配文件名，同名文档追加稳定的后缀，
+        # 与下载完成顺序无关，避免重复条目互相覆盖；上传文件类文档可能退回
+        # 分段 JSONL，两个文件名都预先分配
+        entry_names = NameIndex()
+        state["entry_paths"] = {}
+        for doc in documents:
+            file_name, segments_name = _document_entry_names(doc)
+            paths = {}
+            if doc.get("data_source_type") in {"upload_file", "file_upload"}:
+                paths["file"] = entry_names.claim(file_name, doc.get("id"))
+            paths["segments"] = entry_names.claim(segments_name, doc.get("id"))
+            state["entry_paths"][doc.get("id")] = paths
+        state["pending"] = len(documents)
+        if not store:
+            state["zip_buf"] = SpooledBuffer(
+                MemoryBudget.shared().reserve(), ZIP_SPOOL_BYTES
+            )
+            state["zip_file"] = zipfile.ZipFile(
+                state["zip_buf"], mode="w", compression=zipfile.ZIP_DEFLATED
+            )
+        return state
+
+    def _pipeline_document(
+        self,
+        client: DifyClient,
+        state: dict,
+        doc: dict,
+        reservation: Reservation,
+        scheduler: DeadlineScheduler | None,
+        sink: ArtifactSink | None,
+        store: ChunkStore | None,
+        progress: ProgressTracker | None = None,
+    ) -> tuple[int, bool] | object:
+        """下载一个文档并写入所属知识库（在工作线程中执行）
+
+        写入在知识库的锁内串行完成；知识库的最后一个文档处理完后随即关闭 ZIP，
+        指定存储时在本线程写入存储。
+
+        Returns:
+            (下载数据字节数, 知识库是否已完成)；知识库因时间预算被推迟时为 DEFERRED
+        """
+        if not self._admit_dataset(state, scheduler):
+            reservation.release()
+            return DEFERRED
+
+        doc_name = doc.get("name", "unknown")
+        try:
+            fetched = self._fetch_document(
+                client, state["dataset_id"], doc, reservation, progress
+            )
+        except Exception as e:
+            logger.warning(f"  ⚠️ {doc_name} 下载出错，已跳过: {e}")
+            fetched = None
+        else:
+            if fetched is None:
+                logger.warning(
+                    f"  ⚠️ {doc_name} 无法获取文件内容，已跳过 (data_source_type={doc.get('data_source_type') or 'unknown'})"
+                )
+
+        nbytes = _fetched_size(fetched) if fetched else 0
+        with state["lock"]:
+            if fetched is not None:
+                if state["error"] is None:
+                    try:
+                        self._write_document(state, doc, fetched, store)
+                    except Exception as e:
+                        logger.error(f"[{state['dataset_name']}] 写入失败: {str(e)}")
+                        state["error"] = str(e)
+                else:
+                    # 知识库已失败，丢弃后续文档
+                    fetched[1].close()
+                    fetched[-1].release()
+            state["pending"] -= 1
+            if state["pending"]:
+                return nbytes, False
+        self._finish_dataset(state, scheduler, sink, store)
+        return nbytes, True
+
+    def _admit_dataset(self, state: dict, scheduler: DeadlineScheduler | None) -> bool:
+        """知识库的第一个文档开始下载时（没有文档的知识库在完成时）向调度器登记
+
+        来不及导出的知识库记入 scheduler.deferred，其余文档随之跳过。
+        在真正开始处理时判断，排队中的知识库不会提前占用时间预算，
+        耗时也从此刻起计，不含排队等待。
+        """
+        with state["lock"]:
+            if state["admitted"] is None:
+                state["admitted"] = scheduler is None or scheduler.try_start(
+                    state["dataset"], _estimate_dataset_cost(state["dataset"])
+                )
+                if state["admitted"]:
+                    state["started"] = time.monotonic()
+                elif state["zip_file"] is not None:
+                    state["zip_file"].close()
+                    state["zip_buf"].close()
+            return state["admitted"]
+
+    def _write_document(
+        self, state: dict, doc: dict, fetched: tuple, store: ChunkStore | None
+    ) -> None:
+        """把一个文档写入知识库的 ZIP 或分块仓库（调用方持有知识库的锁）"""
+        doc_name = doc.get("name", "unknown")
+        zip_path = state["entry_paths"][doc.get("id")][fetched[0]]
+        safe_ds_name = state["safe_ds_name"]
+        # 原始文件与分段 JSONL 均从缓冲文件流式写入 ZIP 或分块仓库
+        size = _fetched_size(fetched)
+        with fetched[-1], fetched[1] as spool:
+            reader = HashingReader(spool)
+            if store:
+                store.put_file(f"datasets/{safe_ds_name}/{zip_path}", reader)
+            else:
+                with state["zip_file"].open(
+                    zip_path,
+                    mode="w",
+                    force_zip64=size >= zipfile.ZIP64_LIMIT,
+                ) as entry:
+                    shutil.copyfileobj(reader, entry)
+        checksum = reader.hexdigest()
+        if fetched[0] == "segments":
+            state["segment_count"] += fetched[2]
+            detail = f"{fetched[2]} segments"
+        else:
+            detail = f"{size} bytes, {fetched[3]}"
+        state["doc_file_list"].append(zip_path)
+        state["member_ids"][zip_path] = doc.get("id")
+        state["member_checksums"][zip_path] = checksum
+        logger.info(f"  ✅ {doc_name} → {zip_path} ({detail})")
+
+    def _finish_dataset(
+        self,
+        state: dict,
+        scheduler: DeadlineScheduler | None,
+        sink: ArtifactSink | None,
+        store: ChunkStore | None,
+    ) -> None:
+        """关闭知识库的 ZIP 并生成结果
+
+        指定存储时在当前线程写入存储；否则 ZIP 留在缓冲文件中，
+        由主线程在 _emit_dataset 中分块返回。
+        """
+        try:
+            if state["zip_file"] is not None:
+                state["zip_file"].close()
+            if state["error"] is None and state["doc_file_list"] and state["zip_buf"]:
+                # ZIP 写完后长度确定，从缓冲文件读取，不整体读入内存
+                state["zip_size"] = state["zip_buf"].tell()
+                state["zip_buf"].seek(0)
+                if sink:
+                    try:
+                        zip_reader = HashingReader(state["zip_buf"])
+                        object_key = sink.key_for(
+                            f"datasets/{state['safe_ds_name']}-documents.zip"
+                        )
+                        sink.put(
+                            object_key, zip_reader, state["zip_size"], "application/zip"
+                        )
+                    finally:
+                        state["zip_buf"].close()
+                    self._set_archive_result(state, zip_reader.hexdigest(), object_key)
+                return
+        except Exception as e:
+            logger.error(f"[{state['dataset_name']}] 导出失败: {str(e)}")
+            state["error"] = str(e)
+        finally:
+            if scheduler:
+                scheduler.record(
+                    _estimate_dataset_cost(state["dataset"]),
+                    time.monotonic() - state["started"],
+                )
+
+        if state["zip_buf"]:
+            state["zip_buf"].close()
+        dataset_name = state["dataset_name"]
+        result = {
+            "dataset_id": state["dataset_id"],
+            "dataset_name": dataset_name,
+            "exported_file_count": 0,
+        }
+        if state["error"] is not None:
+            result["status"] = "failed"
+            result["error"] = state["error"]
+        elif "entry_paths" not in state:
+            result["status"] = "no_documents"
+            state["lines"].append(f"📂 {dataset_name}（无文档，跳过）")
+        elif not state["doc_file_list"]:
+            result["status"] = "no_exportable_files"
+            state["lines"].append(
+                f"📂 {dataset_name}（所有文档均无法获取文件，已跳过）"
+            )
+        else:
+            # dedup 模式：文件已逐个写入分块仓库
+            path = f"datasets/{state['safe_ds_name']}/"
+            result.update(
+                status="exported",
+                exported_file_count=len(state["doc_file_list"]),
+                exported_segment_count=state["segment_count"],
+                updated_at=state["dataset"].get("updated_at"),
+                path=path,
+                members=state["member_checksums"],
+                name_index=state["member_ids"],
+            )
+            state["lines"].append(f"📂 {dataset_name} → {path}")
+            state["lines"].extend(f"   └─ {f}" for f in state["doc_file_list"])
+        state["result"] = result
+
+    def _emit_dataset(self, state: dict) -> Generator[ToolInvokeMessage, None, None]:
+        """在主线程中分块返回已完成知识库的 ZIP（未指定存储时）"""
+        if state["result"] is not None:
+            return
+        try:
+            zip_reader = HashingReader(state["zip_buf"])
+            yield from self._emit_file(
+                None,
+                zip_reader,
+                state["zip_size"],
+                f"datasets/{state['safe_ds_name']}-documents.zip",
+                "application/zip",
+            )
+        finally:
+            state["zip_buf"].close()
+        self._set_archive_result(state, zip_reader.hexdigest(), None)
+
+    def _set_archive_result(
+        self, state: dict, sha256: str, object_key: str | None
+    ) -> None:
+        """记录已输出 ZIP 的知识库结果与文件清单"""
+        zip_filename = f"{state['safe_ds_name']}-documents.zip"
+        result = {
+            "dataset_id": state["dataset_id"],
+            "dataset_name": state["dataset_name"],
+            "status": "exported",
+            "exported_file_count": len(state["doc_file_list"]),
+            "exported_segment_count": state["segment_count"],
+            "updated_at": state["dataset"].get("updated_at"),
+            "zip_filename": zip_filename,
+            "size": state["zip_size"],
+            "sha256": sha256,
+            "members": state["member_checksums"],
+            "name_index": state["member_ids"],
+        }
+        if object_key:
+            result["object_key"] = object_key
+        state["result"] = result
+        state["lines"].append(
+            f"📂 {state['dataset_name']} → {object_key or zip_filename}"
+        )
+        state["lines"].extend(f"   └─ {f}" for f in state["doc_file_list"])
+
+    def _export_inventory(
+        self,
+        client: DifyClient,
+        datasets: list,
+        inventory_format: str,
+        sink: ArtifactSink | None,
+    ) -> Generator[ToolInvokeMessage, None, None]:
+        """并发拉取各知识库文档列表，流式写出 JSONL / CSV 元数据清单"""
+        spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_BYTES)
+        output = io.TextIOWrapper(spool, encoding="utf-8", newline="")
+        csv_writer = None
+        if inventory_format == "csv":
+            csv_writer = csv.DictWriter(output, fieldnames=INVENTORY_FIELDS)
+            csv_writer.writeheader()
+
+        document_count = 0
+        status_counts: dict[str, int] = {}
+        failed_datasets = []
+
+        progress = ProgressTracker(len(datasets), unit="知识库")
+
+        listing_results = iter_concurrent(
+            lambda dataset: client.get_dataset_documents(dataset.get("id"), limit=100),
+            datasets,
+            client.max_workers(LISTING),
+        )
+        for dataset, documents, error in listing_results:
+            dataset_name = dataset.get("name", "unknown")
+            progress_text = progress.advance()
+            if progress_text:
+                yield self.create_text_message(progress_text)
+            if error is not None:
+                logger.error(f"[{dataset_name}] 获取文档列表失败: {str(error)}")
+                failed_datasets.append(f"{dataset_name}: {str(error)}")
+                continue
+
+            for doc in documents:
+                row = _inventory_row(dataset, doc)
+                if csv_writer:
+                    csv_writer.writerow(
+                        {key: sanitize_csv_value(value) for key, value in row.items()}
+                    )
+                else:
+                    output.write(json.dumps(row, ensure_ascii=False) + "\n")
+                status = row["indexing_status"] or "unknown"
+                status_counts[status] = status_counts.get(status, 0) + 1
+            document_count += len(documents)
+            logger.info(f"[{dataset_name}] 清单已记录 {len(documents)} 个文档")
+
+        inventory_filename = f"datasets-inventory.{inventory_format}"
+        output.flush()
+        output.detach()
+        inventory_size = spool.tell()
+        spool.seek(0)
+        with spool:
+            inventory_reader = HashingReader(spool)
+            object_key = yield from self._emit_file(
+                sink,
+                inventory_reader,
+                inventory_size,
+                inventory_filename,
+                "text/csv" if csv_writer else "application/x-ndjson",
+            )
+
+        summary = f"✅ 知识库清单生成完成\n\n"
+        summary += f"知识库数: {len(datasets)}\n"
+        summary += f"文档数: {document_count}\n"
+        summary += f"清单文件: {object_key or inventory_filename}\n"
+        for status, count in sorted(status_counts.items()):
+            summary += f"  - {status}: {count}\n"
+        if failed_datasets:
+            summary += f"\n❌ 部分知识库处理失败:\n"
+            for err in failed_datasets[:10]:
+                summary += f"  - {err}\n"
+            if len(failed_datasets) > 10:
+                summary += f"  ... (共 {len(failed_datasets)} 个错误)"
+        yield self.create_text_message(summary)
+
+        result = {
+            "mode": "metadata",
+            "total_datasets": len(datasets),
+            "total_documents": document_count,
+            "indexing_status": status_counts,
+            "inventory_filename": inventory_filename,
+            "inventory_format": inventory_format,
+            "size": inventory_size,
+            "sha256": inventory_reader.hexdigest(),
+            "failed_datasets": failed_datasets,
+        }
+        if sink:
+            result["sink"] = sink.describe()
+            result["object_key"] = object_key
+        yield self.create_json_message(result)
+
+    def _fetch_document(
+        self,
+        client: DifyClient,
+        dataset_id: str,
+        doc: dict,
+        reservation: Reservation,
+        progress: ProgressTracker | None = None,
+    ) -> tuple | None:
+        """导出单个文档（在工作线程中执行）
+
+        上传文件类文档下载原始文件；Notion、网页抓取、API 文本等非文件文档，
+        以及原始文件无法下载的文档，改为导出分段 JSONL。
+        内容写入 SpooledBuffer，留在内存中的部分记在 reservation 上，
+        随结果一并返回，由调用方写入后关闭并释放。
+
+        Returns:
+            ("file", spool, mime_type, source, reservation) 或
+            ("segments", spool, segment_count, reservation)，
+            均无法获取时返回 None
+        """
+        try:
+            fetched = self._fetch_document_file(client, dataset_id, doc, reservation)
+            if fetched:
+                return ("file", *fetched, reservation)
+            reservation.release()
+            fetched = self._fetch_document_segments(
+                client, dataset_id, doc, reservation, progress
+            )
+            if fetched:
+                return (*fetched, reservation)
+        except Exception:
+            reservation.release()
+            raise
+        reservation.release()
+        return None
+
+    def _fetch_document_segments(
+        self,
+        client: DifyClient,
+        dataset_id: str,
+        doc: dict,
+        reservation: Reservation,
+        progress: ProgressTracker | None = None,
+    ) -> tuple | None:
+        """逐页拉取文档分段并写成 JSONL，超过 SEGMENT_SPOOL_BYTES 或内存预算不足时落盘"""
+        spool = SpooledBuffer(reservation, SEGMENT_SPOOL_BYTES)
+        segment_count = 0
+        try:
+            for items in client.iter_document_segments(dataset_id, doc.get("id")):
+                for segment in items:
+                    spool.write(
+                        json.dumps(segment, ensure_ascii=False).encode("utf-8") + b"\n"
+                    )
+                segment_count += len(items)
+                if progress:
+                    progress.tick(len(items))
+        except Exception:
+            spool.close()
+            raise
+
+        if segment_count == 0:
+            spool.close()
+            return None
+
+        spool.seek(0)
+        return "segments", spool, segment_count
+
+    def _fetch_document_file(
+        self,
+        client: DifyClient,
+        dataset_id: str,
+        doc: dict,
+        reservation: Reservation,
+    ) -> tuple[SpooledBuffer, str | None, str] | None:
+        """下载单个文档的原始文件
+
+        Returns:
+            (spool, mime_type, source) 元组，无法获取文件时返回 None
+        """
+        doc_id = doc.get("id")
+        data_source_type = doc.get("data_source_type", "")
+        data_source_info = doc.get("data_source_info") or {}
+
+        if data_source_type not in {"upload_file", "file_upload"}:
+            return None
+
+        # ── 尝试下载原始上传文件 ──
+        spool, mime = client.download_document_file(dataset_id, doc_id, reservation)
+        if spool is not None:
+            if spool.size:
+                return spool, mime, "document download"
+            spool.close()
+
+        upload_file_id = data_source_info.get("upload_file_id") or data_source_info.get(
+            "upload_file", {}
+        ).get("id")
+        if upload_file_id:
+            spool, mime = client.download_upload_file(upload_file_id, reservation)
+            if spool is not None:
+                if spool.size:
+                    return spool, mime, "upload file fallback"
+                spool.close()
+
+        return None
@@ -0,0 +1,467 @@
+from collections.abc import Generator
+from datetime import datetime, timedelta, timezone
+from typing import Any
+import gzip
+import json
+import logging
+import tempfile
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+from dify_plugin.config.logger_format import plugin_logger_handler
+from provider import fast_json
+from provider.blob_stream import iter_blob_chunks
+from provider.concurrency import HEARTBEAT, LISTING, iter_concurrent
+from provider.dify_backup import DifyClient
+from provider.memory import MemoryBudget, Reservation
+from provider.naming import NameIndex, safe_name
+from provider.partitions import (
+    PARTITION_GRANULARITIES,
+    app_created_date,
+    parse_date,
+    time_partitions,
+    utc_timestamp,
+)
+from provider.progress import ProgressTracker
+from provider.sinks import ArtifactSink, create_sink, put_manifest
+from provider.verify import HashingReader
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+# 有工作流运行记录的应用类型
+WORKFLOW_MODES = ('workflow', 'advanced-chat')
+
+# 每个输出文件在内存中缓冲的上限，超出部分落盘
+RUN_SPOOL_BYTES = 4 * 1024 * 1024
+
+# 每页运行记录的详情与节点执行记录按批并发获取，每批的并发数
+RUN_DETAIL_BATCH = 8
+
+# 应用没有 created_at 且未指定开始日期时，向前导出的天数
+DEFAULT_LOOKBACK_DAYS = 30
+
+
+def _json_text(value: Any) -> str | None:
+    """嵌套对象序列化为 JSON 字符串，使每一列在各行中类型一致，便于导入列式存储"""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def _run_row(app: dict, run: dict, detail: dict | None, log: dict | None = None, detail_error: str | None = None) -> dict:
+    """一次运行的扁平记录，字段固定"""
+    source = {**(log or {}), **run, **(detail or {})}
+    account = source.get("created_by_account") or {}
+    end_user = source.get("created_by_end_user") or {}
+    return {
+        "app_id": app.get("id"),
+        "app_name": app.get("name"),
+        "run_id": run.get("id"),
+        "sequence_number": source.get("sequence_number"),
+        "version": source.get("version"),
+        "status": source.get("status"),
+        "error": source.get("error"),
+        "elapsed_time": source.get("elapsed_time"),
+        "total_tokens": source.get("total_tokens"),
+        "total_steps": source.get("total_steps"),
+        "exceptions_count": source.get("exceptions_count"),
+        "created_at": source.get("created_at"),
+        "finished_at": source.get("finished_at"),
+        "triggered_from": (log or {}).get("created_from") or source.get("triggered_from"),
+        "created_by_role": source.get("created_by_role"),
+        "created_by": account.get("email") or account.get("id") or end_user.get("session_id") or end_user.get("id"),
+        "conversation_id": source.get("conversation_id"),
+        "message_id": source.get("message_id"),
+        "inputs": _json_text(source.get("inputs")),
+        "outputs": _json_text(source.get("outputs")),
+        "detail_error": detail_error,
+    }
+
+
+def _node_row(app_id: str, run_id: str, node: dict) -> dict:
+    """一次节点执行的扁平记录，字段固定；token 与费用从 execution_metadata 中提取"""
+    metadata = node.get("execution_metadata") or {}
+    if isinstance(metadata, str):
+        try:
+            metadata = json.loads(metadata)
+        except ValueError:
+            metadata = {}
+    return {
+        "app_id": app_id,
+        "run_id": run_id,
+        "node_execution_id": node.get("id"),
+        "index": node.get("index"),
+        "predecessor_node_id": node.get("predecessor_node_id"),
+        "node_id": node.get("node_id"),
+        "node_type": node.get("node_type"),
+        "title": node.get("title"),
+        "status": node.get("status"),
+        "error": node.get("error"),
+        "elapsed_time": node.get("elapsed_time"),
+        "created_at": node.get("created_at"),
+        "finished_at": node.get("finished_at"),
+        "total_tokens": metadata.get("total_tokens"),
+        "total_price": metadata.get("total_price"),
+        "currency": metadata.get("currency"),
+        "inputs": _json_text(node.get("inputs")),
+        "process_data": _json_text(node.get("process_data")),
+        "outputs": _json_text(node.get("outputs")),
+        "execution_metadata": _json_text(metadata or None),
+    }
+
+
+class _PartitionOutput:
+    """
+    一个应用在一个时间分区内的输出：runs 与 node_executions 两个 gzip JSONL 文件
+
+    每个文件只有一种记录、字段固定，可直接导入列式存储；
+    超过 RUN_SPOOL_BYTES 的部分落盘，内存占用记在 reservation 上。
+    """
+
+    def __init__(self, unit: dict, label: str, first, last, include_nodes: bool, reservation: Reservation):
+        self.entry = {
+            "app_id": unit["app"].get("id"),
+            "app_name": unit["app"].get("name"),
+            "app_mode": unit["app"].get("mode"),
+            "partition": label,
+            "start": first.isoformat(),
+            "end": last.isoformat(),
+            "run_count": 0,
+            "node_execution_count": 0,
+            "detail_errors": 0,
+            "files": [],
+        }
+        self.reservation = reservation
+        self.kinds = ("runs", "node_executions") if include_nodes else ("runs",)
+        # 一次性预留内存缓冲上限，避免多个增长中的预留互相等待
+        reservation.resize(RUN_SPOOL_BYTES * len(self.kinds))
+        self.spools = {kind: tempfile.SpooledTemporaryFile(max_size=RUN_SPOOL_BYTES) for kind in self.kinds}
+        self.outputs = {kind: gzip.GzipFile(fileobj=self.spools[kind], mode="wb", mtime=0) for kind in self.kinds}
+        self.stem = f"workflow_runs/{unit['stem']}/{label}"
+
+    def write_run(self, row: dict, nodes: list | None) -> None:
+        self.outputs["runs"].write(fast_json.dumps_line(row))
+        self.entry["run_count"] += 1
+        if row["detail_error"]:
+            self.entry["detail_errors"] += 1
+        if nodes and "node_executions" in self.outputs:
+            for node in nodes:
+                self.outputs["node_executions"].write(fast_json.dumps_line(_node_row(row["app_id"], row["run_id"], node)))
+            self.entry["node_execution_count"] += len(nodes)
+
+    def finish(self, sink: ArtifactSink | None) -> tuple[dict, list]:
+        """结束写入。指定存储时写入存储并返回 (条目, [])，否则返回待发送的 (条目, [(文件信息, spool)])
+
+        分区没有运行记录时不产生文件。
+        """
+        for output in self.outputs.values():
+            output.close()
+        pending = []
+        try:
+            for kind in self.kinds:
+                spool = self.spools[kind]
+                if not self.entry["run_count"]:
+                    spool.close()
+                    continue
+                file_info = {"kind": kind, "filename": f"{self.stem}.{kind}.jsonl.gz", "size": spool.tell()}
+                spool.seek(0)
+                self.entry["files"].append(file_info)
+                if sink:
+                    with spool:
+                        reader = HashingReader(spool)
+                        file_info["object_key"] = sink.key_for(file_info["filename"])
+                        sink.put(file_info["object_key"], reader, file_info["size"], "application/gzip")
+                    file_info["sha256"] = reader.hexdigest()
+                else:
+                    pending.append((file_info, spool))
+        except Exception:
+            self.close()
+            raise
+        # 只有未落盘的部分占用内存
+        self.reservation.resize(sum(min(file_info["size"], RUN_SPOOL_BYTES) for file_info, _ in pending))
+        return self.entry, pending
+
+    def close(self) -> None:
+        for spool in self.spools.values():
+            spool.close()
+        self.reservation.release()
+
+
+class ExportWorkflowRunsTool(Tool):
+    """
+    Tool for exporting workflow run history and node executions as compressed JSONL, partitioned by time
+    """
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Export workflow runs of one or all workflow / chatflow apps, one set of gzip JSONL files per app and time partition
+        """
+        app_selector_value = tool_parameters.get("app_identifier")
+        app_id = app_selector_value.get("app_id", "") if isinstance(app_selector_value, dict) else str(app_selector_value or "").strip()
+        granularity = tool_parameters.get("partition") or "day"
+        include_nodes = bool(tool_parameters.get("include_node_executions", False))
+
+        try:
+            start_date = parse_date(tool_parameters.get("start_date"), "start_date")
+            end_date = parse_date(tool_parameters.get("end_date"), "end_date") or datetime.now(timezone.utc).date()
+            if granularity not in PARTITION_GRANULARITIES:
+                raise ValueError(f"partition must be one of {', '.join(PARTITION_GRANULARITIES)}")
+            if start_date and start_date > end_date:
+                raise ValueError("start_date must not be later than end_date")
+            sink = create_sink(tool_parameters.get("sink"), self.runtime.credentials, tool_parameters.get("sink_prefix"))
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
+        base_url = self.runtime.credentials.get("dify_base_url", "")
+        email = self.runtime.credentials.get("email", "")
+        password = self.runtime.credentials.get("password", "")
+
+        if not base_url or not email or not password:
+            yield self.create_text_message("Error: Provider credentials not configured")
+            return
+
+        try:
+            # 初始化 Client (会自动登录)；运行记录不走 HTTP 缓存
+            client = DifyClient(base_url, email, password)
+
+            if app_id:
+                app_info = client.get_app_info(app_id)
+                if not app_info:
+                    yield self.create_text_message(f"Error: App {app_id} not found")
+                    return
+                app_info.setdefault("id", app_id)
+                all_apps = [app_info]
+            else:
+                all_apps = client.get_all_apps(limit=100, mode="all")
+            apps = [app for app in all_apps if app.get("mode") in WORKFLOW_MODES]
+            if app_id and not apps:
+                yield self.create_text_message(f"Error: App {app_id} ({all_apps[0].get('mode')}) has no workflow runs")
+                return
+            logger.info(f"{len(apps)} 个应用包含工作流运行记录（共 {len(all_apps)} 个应用）")
+
+            # workflow 应用的运行日志支持按时间过滤，每个分区单独分页；
+            # advanced-chat 应用只能按游标从新到旧读取，整个应用作为一个任务，按时间归入分区
+            app_names = NameIndex()
+            units = []
+            for app in apps:
+                app_stem = app_names.claim(safe_name(app.get("name")), app.get("id"), split_extension=False)
+                app_start = start_date or app_created_date(app, timezone.utc) or end_date - timedelta(days=DEFAULT_LOOKBACK_DAYS - 1)
+                partitions = time_partitions(min(app_start, end_date), end_date, granularity)
+                if app.get("mode") == "workflow":
+                    units.extend({"app": app, "stem": app_stem, "partitions": [partition]} for partition in partitions)
+                else:
+                    units.append({"app": app, "stem": app_stem, "partitions": partitions})
+
+            memory = MemoryBudget.shared()
+            memory.reset_peak()
+
+            progress = ProgressTracker(sum(len(unit["partitions"]) for unit in units), unit="分区", activity_unit="条运行记录")
+
+            partitions = []
+            failed = []
+            totals = {}
+
+            # 各任务并发导出，实际并发由 client 的自适应限流器控制；
+            # 长时间没有任务完成时（chatflow 应用需读完全部运行记录）按进度间隔输出心跳
+            for unit, results, error in iter_concurrent(
+                lambda unit: self._export_unit(client, unit, include_nodes, memory, sink, progress),
+                units,
+                client.max_workers(LISTING),
+                heartbeat=progress.every_seconds,
+            ):
+                if unit is HEARTBEAT:
+                    progress_text = progress.heartbeat()
+                    if progress_text:
+                        yield self.create_text_message(progress_text)
+                    continue
+                app = unit["app"]
+                if error is not None:
+                    labels = ", ".join(partition[0] for partition in unit["partitions"][:3]) + ("…" if len(unit["partitions"]) > 3 else "")
+                    logger.error(f"[{app.get('name')}] 导出运行记录失败 ({labels}): {str(error)}")
+                    failed.append({"app_id": app.get("id"), "partitions": [partition[0] for partition in unit["partitions"]], "error": str(error)})
+                    results = []
+
+                for entry, pending, reservation in results:
+                    with reservation:
+                        for file_info, spool in pending:
+                            # 未指定存储时分块返回压缩文件，同时计算摘要
+                            with spool:
+                                reader = HashingReader(spool)
+                                yield from iter_blob_chunks(
+                                    reader,
+                                    file_info["size"],
+                                    meta={"mime_type": "application/gzip", "filename": file_info["filename"].split("/", 1)[1].replace("/", "-")},
+                                )
+                            file_info["sha256"] = reader.hexdigest()
+
+                    app_totals = totals.setdefault(app.get("id"), {"run_count": 0, "node_execution_count": 0})
+                    app_totals["run_count"] += entry["run_count"]
+                    app_totals["node_execution_count"] += entry["node_execution_count"]
+                    partitions.append(entry)
+                    yield self.create_json_message(entry)
+
+                progress_text = progress.advance(len(unit["partitions"]), nbytes=sum(f["size"] for entry, _, _ in results for f in entry["files"]))
+                if progress_text:
+                    yield self.create_text_message(progress_text)
+
+            logger.info(f"限流器状态: {client.limiters.snapshot()}")
+
+            total_runs = sum(t["run_count"] for t in totals.values())
+            total_nodes = sum(t["node_execution_count"] for t in totals.values())
+            detail_errors = sum(entry["detail_errors"] for entry in partitions)
+
+            # 返回摘要信息
+            summary_text = f"✅ 工作流运行记录导出完成\n\n"
+            summary_text += f"应用数: {len(apps)}\n"
+            summary_text += f"分区: {len(partitions)} 个有数据（按{PARTITION_GRANULARITIES[granularity]}划分，UTC，截至 {end_date.isoformat()}）\n"
+            summary_text += f"运行记录数: {total_runs}\n"
+            if include_nodes:
+                summary_text += f"节点执行记录数: {total_nodes}\n"
+            if detail_errors:
+                summary_text += f"⚠️ {detail_errors} 条运行记录的详情获取失败，仅包含摘要字段\n"
+            summary_text += f"{memory.stats_text()}\n"
+            if sink:
+                summary_text += f"📦 输出位置: {sink.location_text()}\n"
+
+            if failed:
+                summary_text += f"\n❌ 部分应用导出失败:\n"
+                for failure in failed[:10]:
+                    summary_text += f"- {failure['app_id']} ({len(failure['partitions'])} 个分区): {failure['error']}\n"
+                if len(failed) > 10:
+                    summary_text += f"... (共 {len(failed)} 个错误)\n"
+
+            yield self.create_text_message(summary_text)
+
+            manifest = {
+                "complete": not failed,
+                "start_date": start_date.isoformat() if start_date else None,
+                "end_date": end_date.isoformat(),
+                "partition": granularity,
+                "include_node_executions": include_nodes,
+                "apps": [
+                    {"id": app.get("id"), "name": app.get("name"), "mode": app.get("mode"), **totals.get(app.get("id"), {"run_count": 0, "node_execution_count": 0})}
+                    for app in apps
+                ],
+                "partitions": sorted(partitions, key=lambda entry: (entry["app_id"], entry["start"])),
+                "failed": failed,
+            }
+            if sink:
+                manifest["sink"] = sink.describe()
+                manifest["manifest_key"] = put_manifest(sink, "workflow_runs", manifest)
+            yield self.create_json_message(manifest)
+
+        except Exception as e:
+            error_msg = f"Export Workflow Runs failed: {str(e)}"
+            logger.error(error_msg)
+            yield self.create_text_message(error_msg)
+
+    def _export_unit(self, client: DifyClient, unit: dict, include_nodes: bool, memory: MemoryBudget, sink: ArtifactSink | None = None, progress: ProgressTracker | None = None) -> list:
+        """导出一个任务（在工作线程中执行）
+
+        workflow 应用：一个分区，按时间窗口分页运行日志。
+        advanced-chat 应用：从新到旧读取所有运行记录，早于开始日期即停止，
+        按创建时间依次写入各分区（同一时刻只有一个分区在写）。
+
+        Returns:
+            有运行记录的分区列表 [(条目, 待发送的文件, 内存预留)]
+        """
+        app = unit["app"]
+        app_id = app.get("id")
+        results = []
+        current = None
+        try:
+            if app.get("mode") == "workflow":
+                label, first, last = unit["partitions"][0]
+                lower, upper = utc_timestamp(first), utc_timestamp(last + timedelta(days=1))
+                current = _PartitionOutput(unit, label, first, last, include_nodes, memory.reserve())
+                for logs in client.iter_workflow_app_logs(
+                    app_id,
+                    created_after=f"{first.isoformat()}T00:00:00Z",
+                    created_before=f"{(last + timedelta(days=1)).isoformat()}T00:00:00Z",
+                ):
+                    # 接口的时间过滤两端均包含，边界上的记录按 [lower, upper) 归入分区
+                    logs = [log for log in logs if lower <= (log.get("created_at") or 0) < upper]
+                    runs = [(log.get("workflow_run") or {"id": log.get("workflow_run_id")}, log) for log in logs]
+                    self._write_runs(client, app, runs, include_nodes, current)
+                    if progress:
+                        progress.tick(len(runs))
+                results.append((*current.finish(sink), current.reservation))
+                current = None
+            else:
+                windows = [(label, first, last, utc_timestamp(first), utc_timestamp(last + timedelta(days=1))) for label, first, last in unit["partitions"]]
+                range_start, range_end = windows[0][3], windows[-1][4]
+                window_index = len(windows) - 1
+                done = False
+                for runs in client.iter_workflow_runs(app_id, app.get("mode")):
+                    batch = []
+                    for run in runs:
+                        created_at = run.get("created_at") or 0
+                        if created_at >= range_end:
+                            continue
+                        if created_at < range_start:
+                            done = True
+                            break
+                        # 运行记录从新到旧，遇到更早分区的记录时结束当前分区
+                        while created_at < windows[window_index][3]:
+                            window_index -= 1
+                        if current is None or current.entry["partition"] != windows[window_index][0]:
+                            if current is not None:
+                                self._write_runs(client, app, batch, include_nodes, current)
+                                batch = []
+                                results.append((*current.finish(sink), current.reservation))
+                            label, first, last, _, _ = windows[window_index]
+                            current = _PartitionOutput(unit, label, first, last, include_nodes, memory.reserve())
+                        batch.append((run, None))
+                    if batch:
+                        self._write_runs(client, app, batch, include_nodes, current)
+                    if progress:
+                        progress.tick(len(runs))
+                    if done:
+                        break
+                if current is not None:
+                    results.append((*current.finish(sink), current.reservation))
+                    current = None
+        except Exception:
+            if current is not None:
+                current.close()
+            for _, pending, reservation in results:
+                for _, spool in pending:
+                    spool.close()
+                reservation.release()
+            raise
+
+        # 没有运行记录的分区不返回
+        kept = []
+        for entry, pending, reservation in results:
+            if entry["run_count"]:
+                kept.append((entry, pending, reservation))
+            else:
+                reservation.release()
+        return kept
+
+    def _write_runs(self, client: DifyClient, app: dict, runs: list, include_nodes: bool, output: _PartitionOutput) -> None:
+        """按批并发获取一页运行记录的详情（及节点执行记录），按原顺序写入"""
+        app_id = app.get("id")
+
+        def fetch(item: tuple) -> tuple:
+            run_id = item[0].get("id")
+            detail = client.get_workflow_run(app_id, run_id)
+            nodes = client.get_workflow_run_node_executions(app_id, run_id) if include_nodes else None
+            return detail, nodes
+
+        fetched = {}
+        for item, result, error in iter_concurrent(fetch, runs, RUN_DETAIL_BATCH):
+            fetched[item[0].get("id")] = (result, error)
+
+        for run, log in runs:
+            result, error = fetched[run.get("id")]
+            if error is not None:
+                # 详情获取失败时保留摘要字段，不影响同一分区的其他记录
+                logger.warning(f"[{app.get('name')}] 获取运行记录 {run.get('id')} 详情失败: {str(error)}")
+                output.write_run(_run_row(app, run, None, log, str(error)), None)
+            else:
+                detail, nodes = result
+                output.write_run(_run_row(app, run, detail, log), nodes)
@@ -0,0 +1,196 @@
+from collections.abc import Generator
+from typing import Any
+import logging
+import re
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.dify_backup import DifyClient
+from provider.sinks import create_sink, put_manifest
+# 只导入模块：插件加载时要求每个工具文件中只有一个 Tool 子类
+import tools.export_all_annotations as export_all_annotations
+import tools.export_all_apps as export_all_apps
+import tools.export_datasets as export_datasets
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+
+class ExportWorkspacesTool(Tool):
+    """
+    Tool for backing up apps, annotations and datasets of several workspaces in one run
+    """
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Switch to each selected workspace in turn and run the bulk export tools there,
+        partitioning the output by workspace id
+        """
+        workspaces_raw = (tool_parameters.get("workspaces") or "all").strip()
+        include_apps = tool_parameters.get("include_apps", True) is not False
+        include_annotations = tool_parameters.get("include_annotations", True) is not False
+        include_datasets = bool(tool_parameters.get("include_datasets", False))
+        version_type = tool_parameters.get("version_type") or "draft"
+
+        base_url = self.runtime.credentials.get("dify_base_url", "")
+        email = self.runtime.credentials.get("email", "")
+        password = self.runtime.credentials.get("password", "")
+
+        if not base_url or not email or not password:
+            yield self.create_text_message("Error: Provider credentials not configured")
+            return
+
+        if not (include_apps or include_annotations or include_datasets):
+            yield self.create_text_message("Error: Nothing to export, enable at least one of apps, annotations or datasets")
+            return
+
+        try:
+            sink = create_sink(tool_parameters.get("sink"), self.runtime.credentials, tool_parameters.get("sink_prefix"))
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
+        try:
+            # 初始化 Client (会自动登录)
+            client = DifyClient(base_url, email, password)
+
+            all_workspaces = client.get_workspaces()
+            logger.info(f"账号共加入 {len(all_workspaces)} 个工作空间")
+            try:
+                selected = self._select_workspaces(all_workspaces, workspaces_raw)
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+
+            workspace_results = []
+            for index, workspace in enumerate(selected, 1):
+                workspace_id = workspace.get("id")
+                workspace_name = workspace.get("name") or workspace_id
+                yield self.create_text_message(f"🏢 [{index}/{len(selected)}] 开始导出工作空间: {workspace_name} ({workspace_id})")
+
+                # 每个工作空间的输出写到 {sink_prefix}/{workspace_id} 下
+                sub_parameters = {"sink": tool_parameters.get("sink")}
+                if sink:
+                    sub_parameters["sink_prefix"] = sink.key_for(workspace_id)
+
+                steps = []
+                if include_apps:
+                    steps.append((export_all_apps.ExportAllAppsTool, {**sub_parameters, "version_type": version_type, "app_mode": "all"}))
+                if include_annotations:
+                    steps.append((export_all_annotations.ExportAllAnnotationsTool, sub_parameters))
+                if include_datasets:
+                    steps.append((export_datasets.ExportDatasetsTool, {**sub_parameters, "dataset_ids": ""}))
+
+                errors = []
+                completed_steps = 0
+                try:
+                    # 切换是账号级的，各工作空间依次导出。固定期间本进程内该账号的其他请求
+                    # 等待，只有绑定到该工作空间的子工具 client 能发请求；进程外（如浏览器）
+                    # 的切换无法阻止，子工具登录后与结束后各校验一次当前工作空间
+                    with client.use_workspace(workspace_id):
+                        for tool_cls, parameters in steps:
+                            tool = tool_cls(self.runtime, self.session)
+                            tool.workspace_id = workspace_id
+                            last_text = None
+                            for message in tool._invoke(parameters):
+                                if message.type == ToolInvokeMessage.MessageType.TEXT:
+                                    last_text = message.message.text
+                                yield self._tag_message(message, workspace)
+                            # 子工具自行捕获异常并只输出文本，跑完时才会留下清单
+                            if tool.manifest is None:
+                                errors.append(last_text or f"{tool_cls.__name__} did not complete")
+                                continue
+                            try:
+                                client.verify_workspace()
+                            except Exception as e:
+                                errors.append(f"{tool_cls.__name__}: workspace changed during export, output may mix workspaces ({str(e)})")
+                                continue
+                            completed_steps += 1
+                            errors.extend(self._manifest_errors(tool.manifest))
+                except Exception as e:
+                    errors.append(str(e))
+
+                if not errors:
+                    status = "completed"
+                elif completed_steps:
+                    status = "partial"
+                else:
+                    status = "failed"
+                if errors:
+                    logger.error(f"导出工作空间 {workspace_name} ({workspace_id}) 出错: {errors[0]}")
+                workspace_results.append({
+                    "id": workspace_id,
+                    "name": workspace_name,
+                    "status": status,
+                    **({"errors": errors} if errors else {}),
+                    **({"sink_prefix": sub_parameters["sink_prefix"]} if sink else {}),
+                })
+
+            # 返回摘要信息
+            completed = [r for r in workspace_results if r["status"] == "completed"]
+            unsuccessful = [r for r in workspace_results if r["status"] != "completed"]
+            summary_text = f"✅ 多工作空间导出完成\n\n"
+            summary_text += f"工作空间数: {len(selected)}\n"
+            summary_text += f"成功: {len(completed)}\n"
+            if sink:
+                summary_text += f"📦 输出位置: {sink.location_text()}\n"
+            if unsuccessful:
+                summary_text += f"\n❌ 部分工作空间导出失败:\n"
+                for r in unsuccessful[:10]:
+                    more = f"（另有 {len(r['errors']) - 1} 个错误）" if len(r["errors"]) > 1 else ""
+                    summary_text += f"- {r['name']} [{r['status']}]: {r['errors'][0]}{more}\n"
+                if len(unsuccessful) > 10:
+                    summary_text += f"... (共 {len(unsuccessful)} 个工作空间)"
+            yield self.create_text_message(summary_text)
+
+            manifest = {"workspaces": workspace_results}
+            if sink:
+                manifest["sink"] = sink.describe()
+                manifest["manifest_key"] = put_manifest(sink, "workspaces", manifest)
+            yield self.create_json_message(manifest)
+
+        except Exception as e:
+            error_msg = f"Export Workspaces failed: {str(e)}"
+            logger.error(error_msg)
+            yield self.create_text_message(error_msg)
+
+    def _select_workspaces(self, workspaces: list, workspaces_raw: str) -> list:
+        """解析 workspaces 参数：all，或以逗号/换行分隔的工作空间 ID 或名称"""
+        if workspaces_raw.lower() == "all":
+            return workspaces
+
+        requested = [w.strip() for w in re.split(r"[,\n\r]+", workspaces_raw) if w.strip()]
+        selected = []
+        not_found = []
+        for key in requested:
+            match = next((w for w in workspaces if key in (w.get("id"), w.get("name"))), None)
+            if match is None:
+                not_found.append(key)
+            elif match not in selected:
+                selected.append(match)
+        if not_found:
+            raise ValueError(f"Workspaces not found: {', '.join(not_found)}")
+        return selected
+
+    def _manifest_errors(self, manifest: dict) -> list:
+        """从子工具的清单中取出失败的应用 / 知识库，以及未完成（被推迟）的提示"""
+        errors = list(manifest.get("failed_apps") or [])
+        for dataset in manifest.get("datasets") or []:
+            if dataset.get("status") == "failed":
+                errors.append(f"{dataset.get('dataset_name')}: {dataset.get('error')}")
+        if manifest.get("complete") is False:
+            errors.append("export did not complete, see continuation_token")
+        return errors
+
+    def _tag_message(self, message: ToolInvokeMessage, workspace: dict) -> ToolInvokeMessage:
+        """在子工具的消息上标注所属工作空间，便于区分不同工作空间的同名文件"""
+        if message.type == ToolInvokeMessage.MessageType.JSON and isinstance(message.message.json_object, dict):
+            message.message.json_object["workspace_id"] = workspace.get("id")
+            message.message.json_object["workspace_name"] = workspace.get("name")
+        elif message.type == ToolInvokeMessage.MessageType.TEXT:
+            message.message.text = f"[{workspace.get('name')}] {message.message.text}"
+        elif message.meta and message.meta.get("filename"):
+            message.meta = {**message.meta, "filename": f"{workspace.get('id')}-{message.meta['filename']}"}
+        return message
@@ -0,0 +1,285 @@
+from collections.abc import Generator, Iterator
+from typing import Any
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.concurrency import IMPORT, iter_concurrent
+from provider.csv_safety import unsanitize_csv_value
+from provider.dify_backup import DifyClient
+from provider.naming import ANNOTATION_FILE_SUFFIX, annotation_filename, annotation_filenames
+from provider.progress import ProgressTracker
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+# Dify 默认单次批量导入最多 10000 条（ANNOTATION_IMPORT_MAX_RECORDS），且按分钟限制导入次数，
+# 每批尽量多放一些，减少任务数
+DEFAULT_BATCH_SIZE = 5000
+MAX_BATCH_SIZE = 10000
+
+
+class ImportAnnotationsTool(Tool):
+    """
+    Tool for restoring annotations from CSV files produced by export_all_annotations
+    """
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Import annotation CSVs into their target apps through Dify's batch import, concurrently across apps
+        """
+        annotation_files = tool_parameters.get("annotation_files") or []
+        app_mapping_text = (tool_parameters.get("app_mapping") or "").strip()
+        skip_existing = tool_parameters.get("skip_existing", True)
+        skip_existing = True if skip_existing is None else bool(skip_existing)
+        try:
+            batch_size = int(tool_parameters.get("batch_size") or DEFAULT_BATCH_SIZE)
+        except (TypeError, ValueError):
+            batch_size = DEFAULT_BATCH_SIZE
+        batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+
+        base_url = self.runtime.credentials.get("dify_base_url", "")
+        email = self.runtime.credentials.get("email", "")
+        password = self.runtime.credentials.get("password", "")
+
+        if not base_url or not email or not password:
+            yield self.create_text_message("Error: Provider credentials not configured")
+            return
+
+        if not annotation_files:
+            yield self.create_text_message("Error: annotation_files is required")
+            return
+
+        try:
+            app_mapping = json.loads(app_mapping_text) if app_mapping_text else {}
+        except ValueError as e:
+            yield self.create_text_message(f"Error: Invalid app_mapping JSON: {str(e)}")
+            return
+        if not isinstance(app_mapping, dict):
+            yield self.create_text_message("Error: app_mapping must be a JSON object")
+            return
+
+        try:
+            # ── 1. 收集标注文件 ─────────────────────────────────────────────
+            sources = []
+            for file in annotation_files if isinstance(annotation_files, list) else [annotation_files]:
+                sources.extend(self._sources_from_file(file))
+            if not sources:
+                yield self.create_text_message("⚠️ 未找到可导入的标注文件")
+                return
+
+            # 初始化 Client (会自动登录)
+            client = DifyClient(base_url, email, password)
+
+            # ── 2. 按应用 ID 或名称把文件映射到目标应用 ─────────────────────
+            all_apps = client.get_all_apps(limit=100, mode="all")
+            apps_index = self._index_apps(all_apps)
+
+            jobs: dict[str, dict] = {}
+            app_results = []
+            for source in sources:
+                target = app_mapping.get(source["source"]) or app_mapping.get(source["hint"]) or source["hint"]
+                app = self._resolve_app(str(target), apps_index)
+                if app is None:
+                    logger.warning(f"[{source['source']}] 未找到目标应用: {target}")
+                    app_results.append({
+                        "app_name": target,
+                        "sources": [source["source"]],
+                        "status": "failed",
+                        "error": f"No target app found for {target}",
+                    })
+                    continue
+                job = jobs.setdefault(app["id"], {"app": app, "sources": []})
+                job["sources"].append(source)
+            logger.info(f"共 {len(sources)} 个标注文件，映射到 {len(jobs)} 个应用")
+
+            counts = {"imported": 0, "skipped": 0, "failed": len(app_results)}
+            total_annotations = 0
+            for result in app_results:
+                yield self.create_json_message(result)
+
+            progress = ProgressTracker(len(jobs), unit="应用")
+
+            # ── 3. 各应用并发导入，同一应用的批次按顺序提交 ─────────────────
+            import_results = iter_concurrent(
+                lambda job: self._import_app(client, job, batch_size, skip_existing),
+                list(jobs.values()),
+                client.max_workers(IMPORT),
+            )
+            for job, result, error in import_results:
+                if error is not None:
+                    logger.error(f"[{job['app'].get('name')}] 导入标注失败: {str(error)}")
+                    result = {
+                        "app_id": job["app"].get("id"),
+                        "app_name": job["app"].get("name"),
+                        "sources": [s["source"] for s in job["sources"]],
+                        "status": "failed",
+                        "error": str(error),
+                    }
+                counts[result["status"]] += 1
+                total_annotations += result.get("imported", 0)
+                app_results.append(result)
+
+                # 实时返回每个应用的结果
+                yield self.create_json_message(result)
+
+                progress_text = progress.advance(nbytes=result.get("bytes", 0))
+                if progress_text:
+                    yield self.create_text_message(progress_text)
+
+            # ── 4. 返回摘要 ────────────────────────────────────────────────
+            summary_text = f"✅ 批量导入标注完成\n\n"
+            summary_text += f"导入应用数: {counts['imported']}\n"
+            summary_text += f"无新增跳过: {counts['skipped']}\n"
+            summary_text += f"失败应用数: {counts['failed']}\n"
+            summary_text += f"总导入标注数: {total_annotations}\n"
+
+            failed = [r for r in app_results if r["status"] == "failed"]
+            if failed:
+                summary_text += f"\n❌ 部分应用导入失败:\n"
+                for r in failed[:10]:
+                    summary_text += f"- {r['app_name']}: {r['error']}\n"
+                if len(failed) > 10:
+                    summary_text += f"... (共 {len(failed)} 个错误)"
+
+            yield self.create_text_message(summary_text)
+            yield self.create_json_message({
+                "total_apps": len(app_results),
+                **counts,
+                "total_annotations": total_annotations,
+                "apps": app_results,
+            })
+
+        except Exception as e:
+            error_msg = f"Import Annotations failed: {str(e)}"
+            logger.error(error_msg)
+            yield self.create_text_message(error_msg)
+
+    def _import_app(self, client: DifyClient, job: dict, batch_size: int, skip_existing: bool) -> dict:
+        """
+        把一个应用的全部标注文件分批导入（在工作线程中执行）
+
+        逐行解析 CSV，凑满 batch_size 条即提交一个批量导入任务并等待完成，
+        内存中只保留当前批次与已有问题的摘要。
+        """
+        app_id = job["app"]["id"]
+        app_name = job["app"].get("name")
+
+        # 已有问题只保存 8 字节摘要，百万级标注也只占几十 MB
+        existing = set()
+        if skip_existing:
+            for items in client.iter_annotations(app_id):
+                existing.update(_question_key(item.get("question") or "") for item in items)
+            logger.info(f"[{app_name}] 已有 {len(existing)} 条标注")
+
+        stats = {"imported": 0, "skipped": 0, "invalid": 0, "batches": 0, "bytes": 0}
+        batch = []
+
+        def flush():
+            payload = self._build_csv(batch)
+            try:
+                client.batch_import_annotations(app_id, payload, annotation_filename(app_name or app_id))
+            except Exception as e:
+                raise Exception(f"{str(e)} (已导入 {stats['imported']} 条)") from e
+            stats["imported"] += len(batch)
+            stats["batches"] += 1
+            stats["bytes"] += len(payload)
+            logger.info(f"[{app_name}] 第 {stats['batches']} 批导入完成，累计 {stats['imported']} 条")
+            batch.clear()
+
+        for source in job["sources"]:
+            for question, answer in self._iter_rows(source):
+                # Dify 要求问题和答案都不为空
+                if not question or not answer:
+                    stats["invalid"] += 1
+                    continue
+                if skip_existing:
+                    key = _question_key(question)
+                    if key in existing:
+                        stats["skipped"] += 1
+                        continue
+                    existing.add(key)
+                batch.append((question, answer))
+                if len(batch) >= batch_size:
+                    flush()
+        if batch:
+            flush()
+
+        return {
+            "app_id": app_id,
+            "app_name": app_name,
+            "sources": [s["source"] for s in job["sources"]],
+            "status": "imported" if stats["imported"] else "skipped",
+            **stats,
+        }
+
+    def _iter_rows(self, source: dict) -> Iterator[tuple[str, str]]:
+        """逐行解析 CSV，跳过表头并去掉导出时加的公式防护前缀"""
+        stream = io.TextIOWrapper(io.BytesIO(source["data"]), encoding="utf-8-sig", newline="")
+        reader = csv.reader(stream)
+        for index, row in enumerate(reader):
+            if index == 0 and [c.strip().lower() for c in row[:2]] == ["question", "answer"]:
+                continue
+            if len(row) < 2:
+                yield "", ""
+                continue
+            yield unsanitize_csv_value(row[0]), unsanitize_csv_value(row[1])
+
+    def _build_csv(self, rows: list) -> bytes:
+        """生成批量导入接口要求的 CSV（表头 question,answer）"""
+        output = io.StringIO()
+        writer = csv.writer(output, quoting=csv.QUOTE_ALL)
+        writer.writerow(["question", "answer"])
+        writer.writerows(rows)
+        return output.getvalue().encode("utf-8")
+
+    def _sources_from_file(self, file) -> list:
+        """解析上传的文件：标注 CSV，或 export_all_annotations 返回的 JSON"""
+        filename = file.filename or ""
+        data = file.blob
+
+        if filename.lower().endswith(".json"):
+            payload = json.loads(data)
+            items = payload if isinstance(payload, list) else [payload]
+            return [
+                {
+                    "source": item.get("filename") or item.get("name"),
+                    "hint": item.get("name"),
+                    "data": item["content"].encode("utf-8"),
+                }
+                for item in items
+                if isinstance(item, dict) and item.get("content") and item.get("name")
+            ]
+
+        basename = os.path.basename(filename)
+        hint = basename[: -len(ANNOTATION_FILE_SUFFIX)] if basename.endswith(ANNOTATION_FILE_SUFFIX) else os.path.splitext(basename)[0]
+        return [{"source": basename, "hint": hint, "data": data}]
+
+    def _index_apps(self, apps: list) -> dict:
+        index = {"id": {}, "name": {}, "filename": {}}
+        # 文件名按与导出相同的规则分配，同名应用的 应用-2-annotations.csv 对应列表中的第二个
+        filenames = annotation_filenames(apps)
+        for app in apps:
+            index["id"][app.get("id")] = app
+            index["name"].setdefault(app.get("name"), app)
+            index["filename"].setdefault(filenames[app.get("id")], app)
+        return index
+
+    def _resolve_app(self, target: str, apps_index: dict) -> dict | None:
+        """按应用 ID、名称、导出文件名依次匹配目标应用"""
+        return (
+            apps_index["id"].get(target)
+            or apps_index["name"].get(target)
+            or apps_index["filename"].get(annotation_filename(target))
+        )
+
+
+def _question_key(question: str) -> bytes:
+    return hashlib.blake2b(question.encode("utf-8"), digest_size=8).digest()
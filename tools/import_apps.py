@@ -0,0 +1,266 @@
+from collections.abc import Callable, Generator
+from typing import Any
+import io
+import json
+import logging
+import os
+import re
+import zipfile
+import yaml
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.chunk_store import ChunkStore
+from provider.concurrency import IMPORT, iter_concurrent
+from provider.dify_backup import DifyClient
+from provider.naming import safe_name
+from provider.progress import ProgressTracker
+from provider.sinks import sink_from_manifest
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+DSL_EXTENSIONS = (".yml", ".yaml")
+
+
+class ImportAppsTool(Tool):
+    """
+    Tool for restoring Dify applications from DSL backups produced by export_all_apps
+    """
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Import DSL files (uploaded files, ZIP archives or an export manifest) concurrently
+        """
+        dsl_files = tool_parameters.get("dsl_files") or []
+        manifest_text = (tool_parameters.get("manifest") or "").strip()
+        prefer_version = tool_parameters.get("prefer_version") or "draft"
+        skip_existing = tool_parameters.get("skip_existing", True)
+        skip_existing = True if skip_existing is None else bool(skip_existing)
+
+        base_url = self.runtime.credentials.get("dify_base_url", "")
+        email = self.runtime.credentials.get("email", "")
+        password = self.runtime.credentials.get("password", "")
+
+        if not base_url or not email or not password:
+            yield self.create_text_message("Error: Provider credentials not configured")
+            return
+
+        if not dsl_files and not manifest_text:
+            yield self.create_text_message("Error: dsl_files or manifest is required")
+            return
+
+        try:
+            # ── 1. 收集待导入的 DSL ─────────────────────────────────────────
+            entries = []
+            for file in dsl_files if isinstance(dsl_files, list) else [dsl_files]:
+                entries.extend(self._entries_from_file(file))
+            if manifest_text:
+                entries.extend(self._entries_from_json(json.loads(manifest_text)))
+
+            candidates = self._select_versions(entries, prefer_version)
+            if not candidates:
+                yield self.create_text_message("⚠️ 未找到可导入的 DSL 文件")
+                return
+            logger.info(f"共 {len(entries)} 个 DSL 文件，将导入 {len(candidates)} 个应用")
+
+            # 初始化 Client (会自动登录)
+            client = DifyClient(base_url, email, password)
+
+            # 按名称判断应用是否已存在，重复执行时跳过已恢复的应用
+            existing_names = set()
+            if skip_existing:
+                existing_names = {app.get("name") for app in client.get_all_apps(limit=100, mode="all")}
+                logger.info(f"目标工作空间已有 {len(existing_names)} 个应用")
+
+            progress = ProgressTracker(len(candidates), unit="应用")
+            app_results = []
+            counts = {"imported": 0, "skipped": 0, "failed": 0}
+
+            # ── 2. 并发导入，实际并发由 client 的自适应限流器控制 ────────────
+            import_results = iter_concurrent(
+                lambda entry: self._import_one(client, entry, existing_names),
+                candidates,
+                client.max_workers(IMPORT),
+            )
+            for entry, result, error in import_results:
+                if error is not None:
+                    logger.error(f"[{entry['name']}] 导入失败: {str(error)}")
+                    result = {
+                        "name": entry["name"],
+                        "source": entry["source"],
+                        "status": "failed",
+                        "error": str(error),
+                    }
+                counts[result["status"]] += 1
+                app_results.append(result)
+
+                # 实时返回每个应用的结果
+                yield self.create_json_message(result)
+
+                progress_text = progress.advance()
+                if progress_text:
+                    yield self.create_text_message(progress_text)
+
+            # ── 3. 返回摘要 ────────────────────────────────────────────────
+            summary_text = f"✅ 批量导入完成\n\n"
+            summary_text += f"导入成功: {counts['imported']}\n"
+            summary_text += f"已存在跳过: {counts['skipped']}\n"
+            summary_text += f"导入失败: {counts['failed']}\n"
+
+            failed = [r for r in app_results if r["status"] == "failed"]
+            if failed:
+                summary_text += f"\n❌ 部分应用导入失败:\n"
+                for r in failed[:10]:
+                    summary_text += f"- {r['name']}: {r['error']}\n"
+                if len(failed) > 10:
+                    summary_text += f"... (共 {len(failed)} 个错误)"
+
+            yield self.create_text_message(summary_text)
+            yield self.create_json_message({
+                "total_apps": len(candidates),
+                **counts,
+                "apps": app_results,
+            })
+
+        except Exception as e:
+            error_msg = f"Import Apps failed: {str(e)}"
+            logger.error(error_msg)
+            yield self.create_text_message(error_msg)
+
+    def _import_one(self, client: DifyClient, entry: dict, existing_names: set) -> dict:
+        """导入单个应用（在工作线程中执行）"""
+        result = {"name": entry["name"], "source": entry["source"]}
+
+        if entry["name"] in existing_names:
+            logger.info(f"[{entry['name']}] 应用已存在，跳过")
+            return {**result, "status": "skipped"}
+
+        dsl = entry["dsl"] if entry["dsl"] is not None else entry["read"](entry["source"]).decode("utf-8")
+        imported = client.import_app_dsl(dsl)
+        logger.info(f"[{entry['name']}] 导入成功: {imported.get('app_id')} ({imported.get('status')})")
+        return {
+            **result,
+            "status": "imported",
+            "app_id": imported.get("app_id"),
+            "app_mode": imported.get("app_mode"),
+            "import_status": imported.get("status"),
+        }
+
+    def _entries_from_file(self, file) -> list:
+        """解析上传的文件：单个 DSL、ZIP 压缩包，或 export_all_apps 返回的 JSON"""
+        filename = file.filename or ""
+        data = file.blob
+        lowered = filename.lower()
+
+        if lowered.endswith(".zip"):
+            entries = []
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                for info in zf.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith(DSL_EXTENSIONS):
+                        continue
+                    dsl = zf.read(info).decode("utf-8")
+                    entries.append(self._dsl_entry(dsl, f"{filename}:{info.filename}"))
+            return entries
+
+        if lowered.endswith(".json"):
+            return self._entries_from_json(json.loads(data))
+
+        return [self._dsl_entry(data.decode("utf-8"), filename)]
+
+    def _entries_from_json(self, payload) -> list:
+        """解析 export_all_apps 的输出：存储清单（exported_apps + sink）或 JSON 条目列表"""
+        if isinstance(payload, dict) and "exported_apps" in payload:
+            if not payload.get("sink"):
+                raise ValueError("Manifest has no sink information; upload the DSL files instead")
+            sink = sink_from_manifest(payload["sink"], self.runtime.credentials)
+            read = sink.get
+            # dedup 模式导出的文件从分块仓库按快照还原
+            if payload.get("snapshot_key"):
+                store = ChunkStore(sink)
+                snapshot_files = store.load_snapshot(payload["snapshot_key"])["files"]
+                read = lambda path: store.read_file(snapshot_files[path])
+            return [
+                self._manifest_entry(app, key, read)
+                for app in payload["exported_apps"]
+                for key in app.get("files", [])
+            ]
+
+        items = payload if isinstance(payload, list) else [payload]
+        entries = []
+        for item in items:
+            if not isinstance(item, dict) or not item.get("dsl"):
+                continue
+            entries.append({
+                "group": item.get("id") or item.get("name"),
+                "name": item.get("name"),
+                "version": item.get("version", "draft"),
+                "source": item.get("filename", ""),
+                "dsl": item["dsl"],
+                "read": None,
+            })
+        return entries
+
+    def _manifest_entry(self, app: dict, key: str, read: Callable[[str], bytes]) -> dict:
+        return {
+            "group": app.get("id") or app.get("name"),
+            "name": app.get("name"),
+            "version": _version_from_filename(key),
+            "source": key,
+            "dsl": None,
+            "read": read,
+        }
+
+    def _dsl_entry(self, dsl: str, source: str) -> dict:
+        try:
+            app = yaml.safe_load(dsl).get("app") or {}
+        except (yaml.YAMLError, AttributeError) as e:
+            raise ValueError(f"Invalid DSL file {source}: {e}") from e
+        app_name = app.get("name")
+        if not app_name:
+            raise ValueError(f"Invalid DSL file {source}: missing app.name")
+        # 同名的不同应用导出时文件名带 -2、-3 等后缀，不能只按 app.name 归并版本
+        return {
+            "group": app.get("id") or _app_stem_from_filename(source, app_name),
+            "name": app_name,
+            "version": _version_from_filename(source),
+            "source": source,
+            "dsl": dsl,
+            "read": None,
+        }
+
+    def _select_versions(self, entries: list, prefer_version: str) -> list:
+        """同一应用有多个版本的 DSL 时只导入一个：优先 prefer_version，否则取第一个"""
+        groups: dict[str, list] = {}
+        for entry in entries:
+            groups.setdefault(entry["group"], []).append(entry)
+
+        selected = []
+        for group in groups.values():
+            if prefer_version == "draft":
+                preferred = [e for e in group if e["version"] == "draft"]
+            else:
+                preferred = [e for e in group if e["version"] != "draft"]
+            selected.append((preferred or group)[0])
+        return selected
+
+
+def _app_stem_from_filename(filename: str, app_name: str) -> str:
+    """取出 export_all_apps 文件名 {应用名}[-N]-{版本}.yml 中去重后的应用名部分
+
+    文件被改名、不以应用名开头时退回应用名本身。
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    base = safe_name(app_name)
+    if not stem.startswith(f"{base}-"):
+        return base
+    match = re.match(r"(\d+)-", stem[len(base) + 1:])
+    return f"{base}-{match.group(1)}" if match else base
+
+
+def _version_from_filename(filename: str) -> str:
+    """export_all_apps 的文件名形如 {应用名}-{版本}.yml，草稿版本以 -draft 结尾"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return "draft" if stem.endswith("-draft") else "published"
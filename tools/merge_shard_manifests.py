@@ -0,0 +1,106 @@
+from collections.abc import Generator
+from typing import Any
+import json
+import logging
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.chunk_store import ChunkStore
+from provider.sharding import merge_shard_manifests
+from provider.sinks import put_manifest, sink_from_manifest
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+# 合并后清单与快照的文件名
+MANIFEST_NAMES = {
+    "export_all_apps": "apps",
+    "export_all_annotations": "annotations",
+    "export_datasets": "datasets",
+}
+
+
+class MergeShardManifestsTool(Tool):
+    """
+    Tool for combining the manifests of a sharded bulk export into one manifest
+    """
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Merge per-shard manifests, combining deduplicated snapshots and writing the result to the same storage
+        """
+        manifests_text = (tool_parameters.get("manifests") or "").strip()
+        manifest_files = tool_parameters.get("manifest_files") or []
+
+        if not manifests_text and not manifest_files:
+            yield self.create_text_message("Error: manifests or manifest_files is required")
+            return
+
+        try:
+            manifests = _parse_manifests(manifests_text) if manifests_text else []
+            for file in manifest_files if isinstance(manifest_files, list) else [manifest_files]:
+                manifests.extend(_parse_manifests(file.blob.decode("utf-8")))
+            merged = merge_shard_manifests(manifests)
+        except ValueError as e:
+            yield self.create_text_message(f"Error: {str(e)}")
+            return
+
+        try:
+            tool = merged["shards"]["tool"]
+            sink = sink_from_manifest(merged["sink"], self.runtime.credentials) if merged.get("sink") else None
+
+            # dedup 模式：各分片的快照合并为一份，import / verify 按单个快照读取
+            snapshot_keys = merged.pop("shard_snapshot_keys", [])
+            if snapshot_keys:
+                store = ChunkStore(sink)
+                for key in snapshot_keys:
+                    store.files.update(store.load_snapshot(key)["files"])
+                merged["snapshot_key"] = store.commit(MANIFEST_NAMES[tool], merged_from=snapshot_keys)
+
+            if sink:
+                merged["manifest_key"] = put_manifest(sink, MANIFEST_NAMES[tool], merged)
+
+            count = merged["shards"]["count"]
+            summary_text = f"✅ 分片清单合并完成\n\n"
+            summary_text += f"工具: {tool}\n"
+            summary_text += f"分片: {len(merged['shards']['merged'])} / {count}\n"
+            if "datasets" in merged:
+                summary_text += f"知识库数: {merged['total_datasets']}\n"
+                summary_text += f"文件数: {merged['total_files']}\n"
+            else:
+                summary_text += f"应用数: {len(merged['exported_apps'])}\n"
+            if snapshot_keys:
+                summary_text += f"合并快照: {len(snapshot_keys)} → {merged['snapshot_key']}\n"
+            if merged.get("manifest_key"):
+                summary_text += f"📦 清单: {merged['manifest_key']}\n"
+            if merged["missing_shards"]:
+                summary_text += f"\n⚠️ 缺少分片: {', '.join(map(str, merged['missing_shards']))}\n"
+            if merged["incomplete_shards"]:
+                summary_text += f"\n⏱️ 未完成的分片（需使用续传令牌继续）: {', '.join(map(str, merged['incomplete_shards']))}\n"
+
+            yield self.create_text_message(summary_text)
+            yield self.create_json_message(merged)
+
+        except Exception as e:
+            error_msg = f"Merge Shard Manifests failed: {str(e)}"
+            logger.error(error_msg)
+            yield self.create_text_message(error_msg)
+
+
+def _parse_manifests(text: str) -> list:
+    """解析一个或多个清单：JSON 数组，或依次拼接（可用空白分隔）的 JSON 对象"""
+    decoder = json.JSONDecoder()
+    manifests = []
+    pos = 0
+    while pos < len(text):
+        if text[pos].isspace() or text[pos] == ",":
+            pos += 1
+            continue
+        try:
+            value, pos = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid manifest JSON: {e}") from e
+        manifests.extend(value if isinstance(value, list) else [value])
+    return manifests
@@ -0,0 +1,485 @@
+from collections.abc import Generator, Iterator
+from typing import Any, BinaryIO
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import zipfile
+
+from dify_plugin import Tool
+from dify_plugin.entities.tool import ToolInvokeMessage
+from dify_plugin.config.logger_format import plugin_logger_handler
+from provider.chunk_store import ChunkStore
+from provider.concurrency import LISTING, iter_concurrent
+from provider.dify_backup import DifyClient
+from provider.progress import ProgressTracker
+from provider.sinks import ArtifactSink, LocalSink, sink_from_manifest
+from provider.verify import HASH_CHUNK_SIZE, check_dsl, count_csv_rows, hash_stream, hash_zip_member
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(plugin_logger_handler)
+
+# 从 S3 或去重仓库下载备份文件的并发数（下载到临时文件后再并行校验）
+DEFAULT_FETCH_WORKERS = 4
+
+DSL_EXTENSIONS = (".yml", ".yaml")
+
+
+class VerifyBackupTool(Tool):
+    """
+    Tool for verifying backups produced by the export tools against their manifests
+    """
+
+    def _invoke(self, tool_parameters: dict[str, Any]) -> Generator[ToolInvokeMessage, None, None]:
+        """
+        Check ZIP CRCs, SHA-256 digests, DSL syntax and CSV row counts of a backup,
+        hashing in parallel across CPU cores, and optionally compare it with the live instance
+        """
+        manifest_text = (tool_parameters.get("manifest") or "").strip()
+        backup_files = tool_parameters.get("backup_files") or []
+        check_live = bool(tool_parameters.get("check_live", False))
+        try:
+            max_workers = int(tool_parameters.get("max_workers") or os.cpu_count() or 4)
+        except (TypeError, ValueError):
+            max_workers = os.cpu_count() or 4
+        max_workers = max(1, max_workers)
+
+        if not manifest_text and not backup_files:
+            yield self.create_text_message("Error: manifest or backup_files is required")
+            return
+
+        base_url = self.runtime.credentials.get("dify_base_url", "")
+        email = self.runtime.credentials.get("email", "")
+        password = self.runtime.credentials.get("password", "")
+
+        if check_live and (not base_url or not email or not password):
+            yield self.create_text_message("Error: Provider credentials not configured")
+            return
+
+        try:
+            # ── 1. 根据清单与上传文件确定要校验的文件及其预期值 ─────────────
+            targets = []
+            expectations = {}
+            live_items = {"apps": [], "annotations": [], "datasets": []}
+            try:
+                if manifest_text:
+                    self._collect_manifest(json.loads(manifest_text), targets, expectations, live_items)
+                uploads = backup_files if isinstance(backup_files, list) else [backup_files]
+                # 先读取上传的清单，其他文件才能按文件名找到预期值
+                uploads = sorted(uploads, key=lambda f: not (f.filename or "").lower().endswith(".json"))
+                for file in uploads:
+                    self._collect_file(file, targets, expectations, live_items)
+            except ValueError as e:
+                yield self.create_text_message(f"Error: {str(e)}")
+                return
+
+            if not targets and not check_live:
+                yield self.create_text_message("⚠️ 未找到可校验的备份文件")
+                return
+            logger.info(f"共 {len(targets)} 个文件待校验，校验线程数 {max_workers}")
+
+            # ── 2. 并行校验：远程文件先下载到临时文件，哈希与解压在原生线程中执行 ──
+            progress = ProgressTracker(len(targets), unit="文件")
+            file_results = []
+            ready = []
+
+            def iter_tasks() -> Iterator[tuple]:
+                prepared_targets = iter_concurrent(self._prepare, targets, DEFAULT_FETCH_WORKERS)
+                for target, state, error in prepared_targets:
+                    if error is not None:
+                        ready.append(self._failed_result(target, f"Read failed: {error}"))
+                        continue
+                    tasks = self._plan_tasks(state)
+                    if state["pending"] == 0:
+                        ready.append(self._finish(state))
+                    yield from tasks
+
+            task_results = iter_concurrent(self._run_task, iter_tasks(), max_workers, native_threads=True)
+            for (state, action, arg), value, error in task_results:
+                self._record(state, action, arg, value, error)
+                state["pending"] -= 1
+                if state["pending"] == 0:
+                    ready.append(self._finish(state))
+                while ready:
+                    yield from self._emit_result(ready.pop(0), file_results, progress)
+            while ready:
+                yield from self._emit_result(ready.pop(0), file_results, progress)
+
+            # ── 3. 与线上实例对比，找出备份后有变化的内容 ───────────────────
+            live_results = []
+            if check_live:
+                client = DifyClient(base_url, email, password)
+                live_results = self._check_live(client, live_items)
+
+            # ── 4. 返回摘要 ────────────────────────────────────────────────
+            failed = [r for r in file_results if r["status"] == "failed"]
+            unverified = [r for r in file_results if r["status"] == "ok" and not r["checksum_verified"]]
+            total_bytes = sum(r.get("size") or 0 for r in file_results)
+            total_members = sum(r.get("members") or 0 for r in file_results)
+
+            summary_text = "✅ 备份校验通过\n\n" if not failed else "❌ 备份校验发现问题\n\n"
+            summary_text += f"校验文件数: {len(file_results)}\n"
+            summary_text += f"通过: {len(file_results) - len(failed)}\n"
+            summary_text += f"失败: {len(failed)}\n"
+            summary_text += f"校验数据量: {total_bytes / 1024 / 1024:.1f} MB\n"
+            if total_members:
+                summary_text += f"ZIP 成员数: {total_members}\n"
+            if unverified:
+                summary_text += f"⚠️ 清单未记录摘要、仅检查了格式的文件: {len(unverified)}\n"
+            if check_live:
+                live_counts = {}
+                for r in live_results:
+                    live_counts[r["status"]] = live_counts.get(r["status"], 0) + 1
+                summary_text += "实时对比: " + (
+                    "，".join(f"{status} {count}" for status, count in sorted(live_counts.items())) or "（无可对比内容）"
+                ) + "\n"
+
+            if failed:
+                summary_text += f"\n❌ 校验失败的文件:\n"
+                for r in failed[:10]:
+                    summary_text += f"- {r['source']}: {r['errors'][0]}\n"
+                if len(failed) > 10:
+                    summary_text += f"... (共 {len(failed)} 个文件)"
+
+            yield self.create_text_message(summary_text)
+            report = {
+                "ok": not failed,
+                "total_files": len(file_results),
+                "passed": len(file_results) - len(failed),
+                "failed": len(failed),
+                "bytes": total_bytes,
+                "files": file_results,
+            }
+            if check_live:
+                report["live"] = live_results
+            yield self.create_json_message(report)
+
+        except Exception as e:
+            error_msg = f"Verify Backup failed: {str(e)}"
+            logger.error(error_msg)
+            yield self.create_text_message(error_msg)
+
+    def _collect_manifest(self, manifest: dict, targets: list, expectations: dict, live_items: dict) -> None:
+        """解析导出工具的清单
+
+        带存储信息的清单直接从存储读取文件；不带的（消息模式）只记录各文件的预期值，
+        按文件名与上传的文件对应。
+        """
+        if not isinstance(manifest, dict):
+            raise ValueError("Manifest must be a JSON object")
+        if "workspaces" in manifest:
+            raise ValueError("Workspace manifests only list sub-runs; verify the manifest of each workspace instead")
+
+        sink = sink_from_manifest(manifest["sink"], self.runtime.credentials) if manifest.get("sink") else None
+        store = None
+        snapshot_files = {}
+        if manifest.get("snapshot_key"):
+            if sink is None:
+                raise ValueError("Manifest has a snapshot_key but no sink information")
+            store = ChunkStore(sink)
+            snapshot_files = store.load_snapshot(manifest["snapshot_key"])["files"]
+
+        def add(kind: str, key: str, **expected) -> None:
+            if sink is None:
+                expectations[os.path.basename(key)] = expected
+            elif store is not None:
+                entry = snapshot_files.get(key)
+                if entry is None:
+                    targets.append({"source": key, "kind": kind, "missing": True, **expected})
+                else:
+                    # 快照记录了文件摘要，读出分块时还会逐块校验
+                    expected.setdefault("sha256", entry["sha256"])
+                    targets.append({"source": key, "kind": kind, "fetch": lambda: store.iter_file(entry), **expected})
+            else:
+                targets.append({"source": key, "kind": kind, **self._sink_reader(sink, key), **expected})
+
+        if manifest.get("mode") == "metadata":
+            kind = "csv" if manifest.get("inventory_format") == "csv" else "jsonl"
+            add(kind, manifest.get("object_key") or manifest.get("inventory_filename"), sha256=manifest.get("sha256"), size=manifest.get("size"), rows=manifest.get("total_documents"))
+            return
+
+        if "datasets" in manifest:
+            for dataset in manifest["datasets"]:
+                if dataset.get("status") != "exported":
+                    continue
+                live_items["datasets"].append(dataset)
+                members = dataset.get("members")
+                if dataset.get("path"):
+                    # 去重模式：知识库的文件逐个存放在快照中
+                    for name, digest in (members or {}).items():
+                        add(_kind_for(name), f"{dataset['path']}{name}", sha256=digest)
+                else:
+                    add("zip", dataset.get("object_key") or dataset.get("zip_filename"), sha256=dataset.get("sha256"), size=dataset.get("size"), members=members)
+            return
+
+        for app in manifest.get("exported_apps") or []:
+            if "files" in app:
+                live_items["apps"].append(app)
+                checksums = app.get("checksums") or {}
+                for key in app["files"]:
+                    add("dsl", key, sha256=checksums.get(key))
+            elif app.get("object_key"):
+                live_items["annotations"].append(app)
+                add("csv", app["object_key"], sha256=app.get("sha256"), rows=app.get("annotation_count"))
+
+    def _collect_file(self, file, targets: list, expectations: dict, live_items: dict) -> None:
+        """解析上传的文件：导出工具的 JSON 输出 / 清单，或 ZIP、DSL、CSV 等备份文件"""
+        filename = file.filename or ""
+        data = file.blob
+
+        if filename.lower().endswith(".json"):
+            payload = json.loads(data)
+            if isinstance(payload, dict) and any(k in payload for k in ("exported_apps", "datasets", "workspaces", "mode")):
+                self._collect_manifest(payload, targets, expectations, live_items)
+                return
+            # 消息模式的 JSON 条目中带有文件内容与摘要
+            for item in payload if isinstance(payload, list) else [payload]:
+                if not isinstance(item, dict):
+                    continue
+                if item.get("dsl"):
+                    content, kind = item["dsl"].encode("utf-8"), "dsl"
+                elif item.get("content"):
+                    content, kind = item["content"].encode("utf-8"), "csv"
+                else:
+                    continue
+                targets.append({
+                    "source": f"{filename}:{item.get('filename') or item.get('name')}",
+                    "kind": kind,
+                    "open": lambda content=content: io.BytesIO(content),
+                    "sha256": item.get("sha256"),
+                    "rows": item.get("annotation_count"),
+                })
+            return
+
+        expected = expectations.get(os.path.basename(filename), {})
+        targets.append({"source": filename, "kind": _kind_for(filename), "open": lambda: io.BytesIO(data), **expected})
+
+    def _sink_reader(self, sink: ArtifactSink, key: str) -> dict:
+        """本地存储可直接按路径并行读取；远程存储先下载到临时文件"""
+        if isinstance(sink, LocalSink):
+            return {"open": lambda: sink.open(key)}
+        return {"fetch": lambda: _iter_stream(sink, key)}
+
+    def _prepare(self, target: dict) -> dict:
+        """为目标建立校验状态；需要远程读取的文件下载到临时文件，同时计算摘要（在 I/O 工作线程中执行）"""
+        state = {"target": target, "pending": 0, "errors": [], "member_hashes": {}, "member_names": None}
+        if target.get("missing"):
+            raise ValueError("File not found in snapshot")
+        if target.get("fetch") is None:
+            state["open"] = target["open"]
+            return state
+
+        fd, path = tempfile.mkstemp(prefix="dify-verify-")
+        state["temp_path"] = path
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, "wb") as f:
+                for chunk in target["fetch"]():
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+        except Exception:
+            os.remove(path)
+            raise
+        state["open"] = lambda: open(path, "rb")
+        state["sha256"] = digest.hexdigest()
+        state["size"] = size
+        return state
+
+    def _plan_tasks(self, state: dict) -> list:
+        """拆分校验任务：整文件哈希、逐个 ZIP 成员解压哈希、DSL 解析、CSV 计数"""
+        kind = state["target"]["kind"]
+        tasks = []
+        if "sha256" not in state:
+            tasks.append((state, "hash", None))
+        if kind == "zip":
+            # 只读取中央目录，成员由各线程分别打开压缩包解压
+            try:
+                with state["open"]() as f, zipfile.ZipFile(f) as zf:
+                    state["member_names"] = [info.filename for info in zf.infolist() if not info.is_dir()]
+            except (zipfile.BadZipFile, OSError) as e:
+                state["errors"].append(f"Invalid ZIP: {e}")
+                state["member_names"] = []
+            tasks.extend((state, "member", name) for name in state["member_names"])
+        elif kind in ("dsl", "csv", "jsonl"):
+            tasks.append((state, kind, None))
+        state["pending"] = len(tasks)
+        return tasks
+
+    def _run_task(self, task: tuple) -> Any:
+        """执行一个校验任务（在原生线程中执行）"""
+        state, action, arg = task
+        if action == "member":
+            return hash_zip_member(state["open"], arg)
+        with state["open"]() as f:
+            if action == "hash":
+                return hash_stream(f)
+            if action == "dsl":
+                return check_dsl(f.read())
+            if action == "csv":
+                return count_csv_rows(f)
+            if action == "jsonl":
+                return _count_jsonl_rows(f)
+        raise ValueError(f"Unknown verification task: {action}")
+
+    def _record(self, state: dict, action: str, arg: str | None, value: Any, error: Exception | None) -> None:
+        if error is not None:
+            state["errors"].append(f"{arg}: {error}" if arg else f"{action}: {error}")
+        elif action == "hash":
+            state["sha256"], state["size"] = value
+        elif action == "member":
+            state["member_hashes"][arg] = value[0]
+        elif action == "dsl":
+            state["app_name"] = value
+        else:
+            state["rows"] = value
+
+    def _finish(self, state: dict) -> dict:
+        """与预期值比对，生成单个文件的校验结果并清理临时文件"""
+        target = state["target"]
+        errors = state["errors"]
+        if state.get("temp_path"):
+            os.remove(state["temp_path"])
+
+        if target.get("sha256") and state.get("sha256") and target["sha256"] != state["sha256"]:
+            errors.append(f"SHA-256 mismatch: expected {target['sha256']}, got {state['sha256']}")
+        if target.get("size") is not None and state.get("size") is not None and target["size"] != state["size"]:
+            errors.append(f"Size mismatch: expected {target['size']}, got {state['size']}")
+        if target.get("rows") is not None and state.get("rows") is not None and target["rows"] != state["rows"]:
+            errors.append(f"Row count mismatch: expected {target['rows']}, got {state['rows']}")
+
+        expected_members = target.get("members")
+        if expected_members is not None and state["member_names"] is not None:
+            actual = state["member_hashes"]
+            for name, digest in expected_members.items():
+                if name not in state["member_names"]:
+                    errors.append(f"{name}: missing from archive")
+                elif name in actual and actual[name] != digest:
+                    errors.append(f"{name}: SHA-256 mismatch")
+            unexpected = [name for name in state["member_names"] if name not in expected_members]
+            if unexpected:
+                errors.append(f"Unexpected members: {', '.join(unexpected[:5])}")
+
+        result = {
+            "source": target["source"],
+            "kind": target["kind"],
+            "status": "failed" if errors else "ok",
+            "size": state.get("size"),
+            "sha256": state.get("sha256"),
+            "checksum_verified": bool(target.get("sha256") or expected_members),
+        }
+        if state["member_names"] is not None:
+            result["members"] = len(state["member_names"])
+        if "rows" in state:
+            result["rows"] = state["rows"]
+        if state.get("app_name"):
+            result["app_name"] = state["app_name"]
+        if errors:
+            result["errors"] = errors
+        return result
+
+    def _failed_result(self, target: dict, error: str) -> dict:
+        return {
+            "source": target["source"],
+            "kind": target["kind"],
+            "status": "failed",
+            "checksum_verified": False,
+            "errors": [error],
+        }
+
+    def _emit_result(self, result: dict, file_results: list, progress: ProgressTracker) -> Generator[ToolInvokeMessage, None, None]:
+        if result["status"] == "failed":
+            logger.warning(f"[{result['source']}] 校验失败: {result['errors'][0]}")
+        file_results.append(result)
+
+        # 实时返回每个文件的结果
+        yield self.create_json_message(result)
+
+        progress_text = progress.advance(nbytes=result.get("size") or 0)
+        if progress_text:
+            yield self.create_text_message(progress_text)
+
+    def _check_live(self, client: DifyClient, live_items: dict) -> list:
+        """对比线上的 updated_at（应用、知识库）与标注数量，标记备份后有变化的内容"""
+        results = []
+        if live_items["apps"]:
+            live_apps = {app.get("id"): app for app in client.get_all_apps(limit=100, mode="all")}
+            results.extend(_compare_updated_at("app", item, live_apps.get(item.get("id"))) for item in live_items["apps"])
+        if live_items["datasets"]:
+            live_datasets = {dataset.get("id"): dataset for dataset in client.get_all_datasets(limit=100)}
+            results.extend(
+                _compare_updated_at(
+                    "dataset",
+                    {"id": item.get("dataset_id"), "name": item.get("dataset_name"), "updated_at": item.get("updated_at")},
+                    live_datasets.get(item.get("dataset_id")),
+                )
+                for item in live_items["datasets"]
+            )
+        if live_items["annotations"]:
+            counts = iter_concurrent(
+                lambda item: client.count_annotations(item["id"]),
+                [item for item in live_items["annotations"] if item.get("id")],
+                client.max_workers(LISTING),
+            )
+            for item, count, error in counts:
+                result = {"type": "annotations", "id": item["id"], "name": item.get("name"), "backup_count": item.get("annotation_count")}
+                if error is not None:
+                    result.update(status="unknown", error=str(error))
+                else:
+                    result.update(live_count=count, status="unchanged" if count == item.get("annotation_count") else "changed")
+                results.append(result)
+        logger.info(f"实时对比完成: {len(results)} 项")
+        return results
+
+
+def _compare_updated_at(item_type: str, item: dict, live: dict | None) -> dict:
+    result = {"type": item_type, "id": item.get("id"), "name": item.get("name"), "backup_updated_at": item.get("updated_at")}
+    if live is None:
+        result["status"] = "deleted"
+        return result
+    result["live_updated_at"] = live.get("updated_at")
+    if item.get("updated_at") is None:
+        result["status"] = "unknown"
+    else:
+        result["status"] = "unchanged" if live.get("updated_at") == item["updated_at"] else "changed"
+    return result
+
+
+def _kind_for(filename: str) -> str:
+    lowered = filename.lower()
+    if lowered.endswith(".zip"):
+        return "zip"
+    if lowered.endswith(DSL_EXTENSIONS):
+        return "dsl"
+    if lowered.endswith(".csv"):
+        return "csv"
+    if lowered.endswith(".jsonl"):
+        return "jsonl"
+    return "file"
+
+
+def _iter_stream(sink: ArtifactSink, key: str) -> Iterator[bytes]:
+    with sink.open(key) as stream:
+        while True:
+            chunk = stream.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _count_jsonl_rows(fileobj: BinaryIO) -> int:
+    """统计 JSONL 行数，并确认每行都是有效的 JSON"""
+    rows = 0
+    for line_number, line in enumerate(fileobj, 1):
+        if not line.strip():
+            continue
+        try:
+            json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e}") from e
+        rows += 1
+    return rows